@@ -0,0 +1,205 @@
+"""
+League-wide batch mode:
+Finds the peak of every player in the player index and writes one
+league-wide table
+
+Pages are fetched and parsed on a bounded thread pool (players already
+in the cache are not fetched again), peaks are computed on a process
+pool, and every finished player is appended to a checkpoint file so a
+killed run picks up where it stopped.
+
+Command line example:
+"python3 batch.py --out league_peaks.csv --fetch-workers 4 --workers 2"
+
+"""
+
+import os
+import json
+import time
+import argparse
+from concurrent.futures import (ThreadPoolExecutor, ProcessPoolExecutor,
+                                wait, FIRST_COMPLETED)
+
+import pandas as pd
+
+import peakfinder as pf
+import player_index
+import tables as stat_tables
+import cache
+import outbound
+
+CHECKPOINT_PATH = 'batch_checkpoint.jsonl'
+OUT_PATH = 'league_peaks.csv'
+
+PEAK_COLUMNS = ['Season', 'Tm', 'PER', 'WS', 'FG%', 'PTS', 'AST', 'TRB']
+
+
+def fetch_player(ext):
+    # tables (and bio, for the interactive cache) without downloading the headshot
+    p = pf.Player(ext=ext)
+
+    if pf.SNAPSHOT is not None:
+        pf.from_snapshot(p)  # offline, see snapshot.py
+        return p
+
+    if pf.USE_CACHE:
+        cached = cache.get_cache().get(ext)
+
+        if cached is not None:
+            p.reg_season, p.playoff, bio = cached
+            pf.set_bio(p, bio)
+            return p
+
+    url = pf.player_url(ext)
+    html = pf.fetch_page(url, outbound.BACKGROUND)  # searches go first
+
+    pf.merge_tables(p, stat_tables.parse_tables(html))
+
+    try:
+        pf.player_data(p, url, html)
+    except Exception as err:  # optional like in a lookup, the peak only needs the tables
+        p.missing['bio'] = str(err)
+
+    if pf.USE_CACHE and 'bio' not in p.missing:  # kept only once it is complete
+        cache.get_cache().put(ext, html, p.reg_season, p.playoff, pf.get_bio(p))
+
+    return p
+
+
+def peak_row(ext, reg_season, playoff):
+    # runs in a worker process, returns one row of the league table
+    p = pf.Player(ext=ext, reg_season=reg_season, playoff=playoff)
+    peak_data = pf.determine_peak_season(p)
+    row = {'ext': ext}
+
+    for prefix, peak in (('', peak_data.regular), ('Playoffs ', peak_data.playoffs)):
+        if peak is None:
+            continue
+
+        row.update({prefix + col: val for col, val in zip(PEAK_COLUMNS, peak.season)})
+        row[prefix + 'Peak'] = float(peak.sums[peak.index])
+
+    return row
+
+
+def read_checkpoint(path):
+    rows = {}
+
+    if not os.path.exists(path):
+        return rows
+
+    with open(path) as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue  # line cut off when the last run was killed
+
+            rows[row['ext']] = row
+
+    return rows
+
+
+def all_exts():
+    return sorted(set(player_index.get_index().exts))
+
+
+def run_batch(exts = None, out = OUT_PATH, checkpoint = CHECKPOINT_PATH,
+              fetch_workers = 4, workers = None, checkpoint_every = 25, progress = None):
+    """Computes every player's peak, returns the league table as a DataFrame.
+    Players already finished in checkpoint are skipped, failed ones retried.
+    """
+    exts = all_exts() if exts is None else list(exts)
+    rows = read_checkpoint(checkpoint)
+    todo = iter([e for e in exts if e not in rows or 'error' in rows[e]])
+
+    pending = {}  # future -> (stage, ext)
+    unsaved = 0
+    done = 0
+
+    with open(checkpoint, 'a') as log, \
+         ThreadPoolExecutor(fetch_workers) as fetch_pool, \
+         ProcessPoolExecutor(workers) as peak_pool:
+
+        def fill():
+            # keep a bounded number of fetches in flight
+            while sum(stage == 'fetch' for stage, _ in pending.values()) < fetch_workers * 2:
+                ext = next(todo, None)
+                if ext is None:
+                    return
+
+                pending[fetch_pool.submit(fetch_player, ext)] = ('fetch', ext)
+
+        def finish(row):
+            nonlocal unsaved, done
+
+            rows[row['ext']] = row
+            log.write(json.dumps(row) + '\n')
+            unsaved += 1
+            done += 1
+
+            if unsaved >= checkpoint_every:
+                log.flush()
+                os.fsync(log.fileno())
+                unsaved = 0
+
+            if progress is not None:
+                progress(done, row)
+
+        fill()
+
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in finished:
+                stage, ext = pending.pop(future)
+
+                try:
+                    result = future.result()
+
+                except Exception as err:
+                    finish({'ext': ext, 'error': f'{stage}: {err!r}'})
+                    continue
+
+                if stage == 'fetch':
+                    pending[peak_pool.submit(peak_row, ext, result.reg_season,
+                                             result.playoff)] = ('peak', ext)
+                else:
+                    finish(result)
+
+            fill()
+
+    league = pd.DataFrame([rows[e] for e in exts if e in rows])
+
+    if out is not None:
+        league.to_csv(out, index=False)
+
+    return league
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find the peak of every player in the index')
+    parser.add_argument('--out', default=OUT_PATH, help='league table (csv)')
+    parser.add_argument('--checkpoint', default=CHECKPOINT_PATH, help='resume file (jsonl)')
+    parser.add_argument('--fetch-workers', type=int, default=4, help='pages fetched at once')
+    parser.add_argument('--workers', type=int, default=None, help='peak worker processes')
+    parser.add_argument('--limit', type=int, default=None, help='only the first N players')
+    args = parser.parse_args()
+
+    exts = all_exts()[:args.limit]
+    start = time.perf_counter()
+
+    def progress(done, row):
+        status = row.get('error', row.get('Season', ''))
+        print(f'[{done}] {row["ext"]} {status}')
+
+    league = run_batch(exts, args.out, args.checkpoint, args.fetch_workers,
+                       args.workers, progress=progress)
+
+    failed = league['error'].notna().sum() if 'error' in league else 0
+    print(f'{len(league)} players ({failed} failed) in {time.perf_counter() - start:.1f}s'
+          f' -> {args.out}')
+
+
+if __name__ == "__main__":
+    main()
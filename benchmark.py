@@ -0,0 +1,688 @@
+"""
+Basketball Peak Finder benchmarks
+
+Times the local (no network) parts of the application against the saved
+pages in fixtures/, a local stand-in server and a fake Sheets service
+
+Every run is appended to benchmark_results.jsonl with the git commit it
+ran on, and each number is printed next to the change from the previous
+run, so a regression between commits shows up as a percentage. Only
+timings live here; that the faster paths give the same results is
+checked by the tests in tests/.
+
+Command line example (only the lookup and chart groups, not saved):
+"python3 benchmark.py --only lookup redraw --no-save"
+
+"""
+
+import os
+import ast
+import json
+import time
+import argparse
+import subprocess
+import tempfile
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import requests
+from bs4 import BeautifulSoup
+
+import fixtures
+import player_index
+import player_bio
+import peakfinder as pf
+import sheets
+import cache
+import tables
+import engine
+import players
+import loadgen
+import service
+import snapshot
+import outbound
+import prefetch
+from fake_sheets import FakeSheets
+
+SAMPLE_NAMES = ['lebron james', 'gary payton', 'kareem abdul-jabbar',
+                'a.c. green', 'not a player']
+SAMPLE_TYPOS = ['lebron jmaes', 'micheal jordon', 'shaq oneal', 'steph curry']
+SAMPLE_PREFIXES = ['l', 'leb', 'jam', 'kobe b']
+
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'benchmark_results.jsonl')
+
+
+def timeit(func, repeat = 5, number = 1):
+    # best of repeat runs, in seconds per call
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+
+        for _ in range(number):
+            func()
+
+        elapsed = (time.perf_counter() - start) / number
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def literal_eval_lookup(name):
+    # the lookup get_player used to do on every search
+    with open(player_index.DATABASE_PATH) as f:
+        player_dict = ast.literal_eval(f.read())
+
+    return player_dict.get(name)
+
+
+def bench_index():
+    results = {}
+
+    results['literal_eval lookup'] = timeit(
+        lambda: [literal_eval_lookup(n) for n in SAMPLE_NAMES]) / len(SAMPLE_NAMES)
+
+    results['index load'] = timeit(player_index.read_index)
+
+    index = player_index.read_index()
+    results['index lookup'] = timeit(
+        lambda: [index.lookup(n) for n in SAMPLE_NAMES], number=1000) / len(SAMPLE_NAMES)
+
+    return results
+
+
+def bench_search():
+    results = {}
+    index = player_index.read_index()
+
+    results['search index build'] = timeit(
+        lambda: player_index.PlayerIndex(index.names, index.exts)._build_search())
+
+    index._build_search()
+    results['fuzzy match'] = timeit(
+        lambda: [index.fuzzy(q) for q in SAMPLE_TYPOS], number=100) / len(SAMPLE_TYPOS)
+    results['prefix completion'] = timeit(
+        lambda: [index.complete(q) for q in SAMPLE_PREFIXES], number=100) / len(SAMPLE_PREFIXES)
+
+    return results
+
+
+def bench_sheets(latency = 0.02):
+    # per-table getDF calls against one batchUpdate + batchGet,
+    # with a simulated round trip of latency seconds per call
+    results = {}
+    ext = 'veterve01'
+    url = 'https://www.basketball-reference.com/players/v/' + ext + '.html'
+    html = fixtures.load_page(ext)
+
+    fake = FakeSheets({url: html}, latency)
+    sheets.setService(fake)
+
+    results['sheets per table'] = timeit(lambda: pf.sheets_tables(url), repeat=3)
+    results['sheets batched'] = timeit(lambda: pf.sheets_tables(url, html), repeat=3)
+
+    sheets.setService(None)
+
+    return results
+
+
+def bench_sheets_pool(lookups = 8, recalc = 0.2):
+    # lookups one at a time against all at once, each in its own leased
+    # slot, on a fake that takes recalc seconds per IMPORTHTML
+    results = {}
+    site = fixtures.crowd_site(lookups)
+    pages = {'https://www.basketball-reference.com' + path: html for path, html in site.items()}
+    fake = FakeSheets(pages, recalc=recalc)
+    sheets.setService(fake)
+
+    def lookup(url):
+        pf.sheets_tables(url, pages[url])
+
+    def at_once():
+        with ThreadPoolExecutor(lookups) as pool:
+            list(pool.map(lookup, pages))
+
+    results[f'{lookups} lookups one at a time'] = timeit(lambda: [lookup(u) for u in pages], repeat=1)
+    results[f'{lookups} lookups at once'] = timeit(at_once, repeat=2)
+
+    sheets.getPool().shrink(idle=0)
+    sheets.setService(None)
+
+    return results
+
+
+def bench_lookup():
+    # each lookup stage on a short (rookie) and a long (veteran) career
+    results = {}
+    player_index.get_index()
+
+    results['get_player'] = timeit(
+        lambda: [pf.get_player(pf.Player(), n) for n in SAMPLE_NAMES],
+        number=100) / len(SAMPLE_NAMES)
+
+    for ext in fixtures.PLAYERS:
+        career = 'rookie' if ext == 'rookiro01' else 'veteran'
+        html = fixtures.load_page(ext)
+        url = 'https://www.basketball-reference.com/players/' + ext[0] + '/' + ext + '.html'
+
+        soup = BeautifulSoup(html, 'html.parser')
+        results[f'parse page, {career}'] = timeit(
+            lambda: BeautifulSoup(html, 'html.parser'), repeat=3)
+        results[f'player_info, {career}'] = timeit(
+            lambda: pf.player_info(soup, pf.Player()), number=20)
+        results[f'parse_bio, {career}'] = timeit(
+            lambda: player_bio.parse_bio(html), number=20)
+
+        parsed = tables.parse_tables(html)
+        results[f'parse tables, {career}'] = timeit(
+            lambda: tables.parse_tables(html), repeat=3)
+        results[f'merge + filter, {career}'] = timeit(
+            lambda: pf.merge_tables(pf.Player(ext=ext), parsed), number=10)
+
+        sheets.setService(FakeSheets({url: html}))
+        results[f'sheets getDF tables, {career}'] = timeit(
+            lambda: pf.player_tables(pf.Player(ext=ext), url), repeat=3)
+        sheets.setService(None)
+
+        p = pf.Player(ext=ext)
+        pf.merge_tables(p, parsed)
+        results[f'determine_peak_season, {career}'] = timeit(
+            lambda: pf.determine_peak_season(p), number=10)
+
+    return results
+
+
+def full_parse(html):
+    # one tree of the whole page, walked for the bio and the tables
+    soup = BeautifulSoup(html, 'html.parser')
+    pf.player_info(soup, pf.Player())
+
+    return tables.parse_tables(soup)
+
+
+def targeted_parse(html):
+    # only the info block and the wanted tables are built
+    player_bio.parse_bio(html)
+
+    return tables.parse_tables(html)
+
+
+def peak_memory(func):
+    # bytes allocated at the high point of one call
+    tracemalloc.start()
+
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+
+    finally:
+        tracemalloc.stop()
+
+
+def bench_page():
+    # bio + stats tables from a saved page, whole tree against targeted
+    results = {}
+
+    for ext in fixtures.PLAYERS:
+        career = 'rookie' if ext == 'rookiro01' else 'veteran'
+        html = fixtures.load_page(ext)
+
+        results[f'full tree, {career}'] = timeit(lambda: full_parse(html), repeat=3)
+        results[f'targeted ({tables.PARSER}), {career}'] = timeit(
+            lambda: targeted_parse(html), repeat=3)
+
+    return results
+
+
+def bench_page_memory():
+    results = {}
+
+    for ext in fixtures.PLAYERS:
+        career = 'rookie' if ext == 'rookiro01' else 'veteran'
+        html = fixtures.load_page(ext)
+
+        results[f'full tree, {career}'] = peak_memory(lambda: full_parse(html))
+        results[f'targeted ({tables.PARSER}), {career}'] = peak_memory(
+            lambda: targeted_parse(html))
+
+    return results
+
+
+def bench_letters():
+    # players.main parsing: the whole database from the 26 letter pages
+    results = {}
+    pages = fixtures.letter_pages()
+
+    def full_parse():
+        # what players.main did before SoupStrainer
+        for html in pages.values():
+            soup = BeautifulSoup(html, 'html.parser')
+            soup.find_all('th', class_='left')
+
+    results['letter pages, full parse'] = timeit(full_parse, repeat=1)
+    results['letter pages, parse_letter'] = timeit(
+        lambda: [players.parse_letter(html) for html in pages.values()], repeat=3)
+
+    return results
+
+
+def bench_cache():
+    # parsing a saved page against reading the cached tables back
+    results = {}
+    ext = 'veterve01'
+    html = fixtures.load_page(ext)
+
+    with tempfile.TemporaryDirectory() as path:
+        c = cache.PlayerCache(path)
+        p = pf.Player(ext=ext)
+        pf.merge_tables(p, tables.parse_tables(html))
+
+        results['parse + merge tables'] = timeit(
+            lambda: pf.merge_tables(pf.Player(), tables.parse_tables(html)), repeat=3)
+        results['cache put'] = timeit(lambda: c.put(ext, html, p.reg_season, p.playoff))
+        results['cache get'] = timeit(lambda: c.get(ext), number=20)
+
+    return results
+
+
+def bench_snapshot(players = 600):
+    # opening a league snapshot and looking one player up, against the disk cache
+    results = {}
+    frames = []
+
+    for path, html in fixtures.crowd_site(players).items():
+        p = pf.Player(ext=path.rsplit('/', 1)[1][:-len('.html')])
+        pf.merge_tables(p, tables.parse_tables(html))
+        frames.append((p.ext, p.reg_season, p.playoff, player_bio.parse_bio(html)._asdict()))
+
+    ext, reg_season, playoff, bio = frames[len(frames) // 2]
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'league.snap')
+
+        results[f'write, {players} players'] = timeit(lambda: snapshot.write(path, frames),
+                                                      repeat=1)
+        results['open'] = timeit(lambda: snapshot.Snapshot(path).close(), number=20)
+
+        with_snapshot = snapshot.Snapshot(path)
+        results['snapshot get'] = timeit(lambda: with_snapshot.get(ext), number=20)
+        with_snapshot.close()
+
+        c = cache.PlayerCache(os.path.join(folder, 'cache'))
+        c.put(ext, '', reg_season, playoff, bio)
+        results['cache get'] = timeit(lambda: c.get(ext), number=20)
+
+    return results
+
+
+def bench_engine(sizes = (1, 100, 5000)):
+    # determine_peak_season once per player against one grouped pass
+    results = {}
+    frames = {f'p{i}': fixtures.career_frame(i) for i in range(max(sizes))}
+
+    for size in sizes:
+        subset = dict(list(frames.items())[:size])
+        repeat = 3 if size < 1000 else 1
+
+        def loop():
+            for df in subset.values():
+                p = pf.Player(reg_season=df.copy(), playoff=pd.DataFrame({'P': []}))
+                pf.determine_peak_season(p)
+
+        results[f'per player loop, {size}'] = timeit(loop, repeat=repeat)
+        results[f'build store, {size}'] = timeit(lambda: engine.build_store(subset), repeat=repeat)
+
+        store = engine.build_store(subset)
+        results[f'vectorized peaks, {size}'] = timeit(lambda: engine.peaks(store), repeat=repeat)
+
+    return results
+
+
+def bench_crawl(delay = 0.3):
+    # database rebuild against a local stand-in that adds delay seconds per page
+    results = {}
+    server = fixtures.serve(fixtures.saved_site(), delay)
+    url = server.url + '/players/'
+
+    def one_at_a_time():
+        # the old players.main loop
+        for letter in players.LETTERS:
+            response = requests.get(url + letter + '/')
+            soup = BeautifulSoup(response.text, 'html.parser')
+            soup.find_all('th', class_='left')
+
+    results['letter pages one at a time'] = timeit(one_at_a_time, repeat=1)
+    results['letter pages concurrent'] = timeit(lambda: players.crawl(url), repeat=3)
+
+    # the stand-in behind basketball-reference's own limit, which bounds the real crawl
+    outbound.set_scheduler(outbound.Scheduler({'127.0.0.1': outbound.LIMITS['www.basketball-reference.com']}))
+
+    try:
+        results['letter pages concurrent, site limit'] = timeit(lambda: players.crawl(url), repeat=1)
+    finally:
+        outbound.set_scheduler(None)
+
+    server.shutdown()
+
+    return results
+
+
+def bench_service(players = 50, count = 200, delay = 0.05):
+    # the lookup service under load, sharing lookups against looking up every request
+    results = {}
+    runs = {'shared lookups': {}, 'every request looked up': {'single_flight': False, 'ttl': 0}}
+
+    for title, options in runs.items():
+        run = loadgen.run(players, count, delay=delay, **options)
+        results[f'per request, {title}'] = run['seconds'] / count
+        results[f'p99 latency, {title}'] = run['p99']
+
+    return results
+
+
+def bench_hedge(players = 8, stall = 1.0, hedge = 0.2):
+    # lookups against a stand-in whose first answer for each page stalls,
+    # waiting the stall out against a hedged second request
+    results = {}
+    site = fixtures.crowd_site(players)
+    exts = [path.rsplit('/', 1)[1][:-len('.html')] for path in site]
+    before = pf.SITE, pf.USE_CACHE, dict(pf.HEDGE_AFTER)
+
+    for title, after in (('no hedge', None), ('hedged', hedge)):
+        upstream = fixtures.serve(site, stall=stall)  # new server, every page stalls once
+        pf.SITE, pf.USE_CACHE = upstream.url, False
+        pf.HEDGE_AFTER['page'] = after
+        latencies = []
+
+        try:
+            for ext in exts:
+                start = time.perf_counter()
+                pf.player_stats(pf.Player(ext=ext), pic=False)
+                latencies.append(time.perf_counter() - start)
+
+        finally:
+            upstream.shutdown()
+            pf.SITE, pf.USE_CACHE = before[:2]
+            pf.HEDGE_AFTER.update(before[2])
+
+        results[f'lookup p50, {title}'] = service.percentile(latencies, 50)
+        results[f'lookup max, {title}'] = max(latencies)
+
+    return results
+
+
+def bench_prefetch(searches = 8, delay = 0.2, think = 0.6):
+    # a search made think seconds after its name was typed, with and without
+    # the typed candidates (the player and one other) prefetched meanwhile
+    results = {}
+    site = fixtures.crowd_site(searches * 2)
+    exts = [path.rsplit('/', 1)[1][:-len('.html')] for path in site]
+    upstream = fixtures.serve(site, delay)
+    site_before = pf.SITE
+    pf.SITE = upstream.url
+
+    try:
+        for title, prefetching in (('typed, no prefetch', False), ('typed, prefetched', True)):
+            with tempfile.TemporaryDirectory() as folder:
+                cache.set_cache(cache.PlayerCache(folder))
+                prefetcher = prefetch.Prefetcher(settle=0.05, headshot=None, history_path=None)
+                latencies = []
+
+                for ext, other in zip(exts[::2], exts[1::2]):
+                    if prefetching:
+                        prefetcher.suggest([ext, other])
+
+                    time.sleep(think)
+                    start = time.perf_counter()
+
+                    with prefetcher.search(ext):
+                        pf.player_stats(pf.Player(ext=ext), pic=False)
+
+                    latencies.append(time.perf_counter() - start)
+
+                prefetcher.close()
+                results[f'search, {title}'] = sum(latencies) / len(latencies)
+
+    finally:
+        cache.set_cache(None)
+        upstream.shutdown()
+        pf.SITE = site_before
+
+    return results
+
+
+def bench_outbound(background = 40, searches = 5, rate = 20):
+    # search latency while a batch floods the same rate limited host,
+    # searches in their own lane against queued behind the batch
+    results = {}
+    server = fixtures.serve(fixtures.saved_site())
+    page = server.url + '/players/v/veterve01.html'
+
+    for title, lane in (('own lane', outbound.INTERACTIVE), ('behind batch', outbound.BACKGROUND)):
+        scheduler = outbound.Scheduler({'127.0.0.1': (rate, 2)})
+        waits = []
+
+        def search():
+            start = time.perf_counter()
+            scheduler.get(page, lane, timeout=10)
+            waits.append(time.perf_counter() - start)
+
+        with ThreadPoolExecutor(background + searches) as pool:
+            flood = [pool.submit(scheduler.get, page, outbound.BACKGROUND, timeout=10)
+                     for _ in range(background)]
+            time.sleep(0.2)  # the batch is under way when the searches come in
+            found = [pool.submit(search) for _ in range(searches)]
+
+            for future in flood + found:
+                future.result()
+
+        results[f'search, {title}'] = sum(waits) / len(waits)
+
+    server.shutdown()
+
+    return results
+
+
+def peak_lists(peak):
+    # a Peak in the nested list layout determine_peak_season used to return
+    return [[str(v) for v in peak.season], peak.seasons.tolist(), peak.sums.tolist(),
+            peak.ppg.tolist(), peak.apg.tolist(), peak.rpg.tolist()]
+
+
+def bench_peak_memory(players = 2000):
+    # memory held by the peak results of many players once their tables are gone
+    results = {}
+    peaks = []
+
+    for seed in range(players):
+        p = pf.Player(reg_season=fixtures.career_frame(seed), playoff=pd.DataFrame({'P': []}))
+        peaks.append(pf.determine_peak_season(p).regular)
+
+    def held(build):
+        tracemalloc.start()
+        kept = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del kept
+
+        return size
+
+    results[f'nested lists, {players} players'] = held(lambda: [peak_lists(pk) for pk in peaks])
+    results[f'Peak arrays, {players} players'] = held(
+        lambda: [pf.Peak(pk.season, pk.index, pk.seasons.copy(), pk.values.copy())
+                 for pk in peaks])
+
+    return results
+
+
+def old_redraw(fig, peak_graph, stats, peak):
+    # MplCanvas.redraw before persistent artists: clear and rebuild everything
+    peak = peak_lists(peak)
+    idx = list(range(len(peak[1])))
+    max_idx = peak[2].index(max(peak[2]))
+
+    peak_graph.cla()
+    stats.cla()
+    peak_graph.set_title('Peak')
+    peak_graph.set_xticks(idx)
+    peak_graph.set_xticklabels(peak[1], rotation = 70)
+    peak_graph.plot(idx, peak[2])
+    peak_graph.axvspan(max_idx, max_idx, color='C1')
+    stats.set_title('Stats Per Game')
+    stats.set_xticks(idx)
+    stats.set_xticklabels(peak[1], rotation=70)
+    stats.plot(idx, peak[3], color = 'green')
+    stats.plot(idx, peak[4], color = 'blue')
+    stats.plot(idx, peak[5], color = 'red')
+    stats.axvspan(max_idx, max_idx, color='C1')
+    stats.legend(['Points', 'Assists', 'Rebounds'])
+    fig.canvas.draw()
+
+
+def bench_redraw(careers = (3, 20)):
+    # headless Agg canvas, redraw latency for the same season axis and a new one
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from chart import Peak_Chart
+
+    results = {}
+
+    for seasons in careers:
+        peaks = []
+
+        for seed in (1, 2):
+            p = pf.Player(reg_season=fixtures.career_frame(seed, seasons),
+                          playoff=pd.DataFrame({'P': []}))
+            peaks.append(pf.determine_peak_season(p).regular)
+
+        pk = peaks[0]  # same range, same seasons
+        same_axis = pf.Peak(pk.season, pk.index, pk.seasons, pk.values[:, ::-1])
+
+        fig = Figure(figsize=(7, 5), dpi=100)
+        FigureCanvasAgg(fig)
+        fig.subplots_adjust(top = .93, hspace=.5)
+        peak_graph = fig.add_subplot(211)
+        stats = fig.add_subplot(212)
+        turn = [0]
+
+        def old_toggle():
+            turn[0] += 1
+            old_redraw(fig, peak_graph, stats, peaks[turn[0] % 2])
+
+        results[f'cla redraw, {seasons} seasons'] = timeit(old_toggle, number=10)
+
+        fig = Figure(figsize=(7, 5), dpi=100)
+        FigureCanvasAgg(fig)
+        chart = Peak_Chart(fig)
+
+        def new_toggle():
+            turn[0] += 1
+            chart.redraw(peaks[turn[0] % 2])
+
+        results[f'new axis, {seasons} seasons'] = timeit(new_toggle, number=10)
+
+        chart.redraw(peaks[0])
+
+        def same():
+            turn[0] += 1
+            chart.redraw(same_axis if turn[0] % 2 else peaks[0])
+
+        results[f'same axis (blit), {seasons} seasons'] = timeit(same, number=10)
+
+    return results
+
+
+# group name -> (title, benchmark)
+BENCHMARKS = {'index': ('Player index', bench_index),
+              'search': ('Name search', bench_search),
+              'lookup': ('Lookup stages', bench_lookup),
+              'page': ('Player page parsing', bench_page),
+              'page memory': ('Player page parsing, peak memory', bench_page_memory),
+              'letters': ('Letter page parsing', bench_letters),
+              'peak memory': ('Peak results, memory held', bench_peak_memory),
+              'sheets': ('Sheets import (fake service)', bench_sheets),
+              'sheets pool': ('Sheets lookups, leased tabs (fake service)', bench_sheets_pool),
+              'cache': ('Player cache', bench_cache),
+              'snapshot': ('League snapshot (made up players)', bench_snapshot),
+              'engine': ('Peak engine', bench_engine),
+              'crawl': ('Database rebuild (local stand-in)', bench_crawl),
+              'outbound': ('Outbound scheduler, search during a batch', bench_outbound),
+              'hedge': ('Lookups with a stalling upstream (local stand-in)', bench_hedge),
+              'prefetch': ('Searches after typing (local stand-in)', bench_prefetch),
+              'service': ('Lookup service (local stand-in)', bench_service),
+              'redraw': ('Chart redraw (Agg)', bench_redraw)}
+
+
+# group name -> (unit, scale) for groups that do not measure seconds
+UNITS = {'page memory': ('KB', 1 / 1024), 'peak memory': ('KB', 1 / 1024)}
+
+
+def report(title, results, previous = None, unit = ('us', 1e6)):
+    # previous is {name: seconds} from an earlier run, shown as a change
+    print(title)
+
+    for name, seconds in results.items():
+        line = f'    {name:<36} {seconds * unit[1]:12.1f} {unit[0]}'
+
+        if previous and previous.get(name):
+            line += f'  {(seconds / previous[name] - 1) * 100:+7.1f}%'
+
+        print(line)
+
+    print()
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+                              ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def read_results(path = RESULTS_PATH):
+    # earlier runs, oldest first
+    if not os.path.exists(path):
+        return []
+
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_results(results, path = RESULTS_PATH):
+    run = {'commit': git_commit(), 'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+           'results': results}
+
+    with open(path, 'a') as f:
+        f.write(json.dumps(run) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the local parts of the application')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help='groups to run')
+    parser.add_argument('--results', default=RESULTS_PATH, help='results file (jsonl)')
+    parser.add_argument('--no-save', action='store_true', help='do not record this run')
+    args = parser.parse_args()
+
+    runs = read_results(args.results)
+    previous = runs[-1]['results'] if runs else {}
+
+    if runs:
+        print(f"Compared with {runs[-1]['commit']} ({runs[-1]['time']})\n")
+
+    results = {}
+
+    for group in args.only or BENCHMARKS:
+        title, bench = BENCHMARKS[group]
+        results[group] = bench()
+        report(title, results[group], previous.get(group), UNITS.get(group, ('us', 1e6)))
+
+    if not args.no_save:
+        save_results(results, args.results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,428 @@
+"""
+Player cache:
+On-disk cache of fetched player pages and merged stats tables
+
+Each player (keyed by url extension) gets a directory holding the raw
+page (gzip) and the merged, typed reg_season/playoff DataFrames as
+columnar .npz arrays (float, int and text blocks), plus a small json
+record with the parsed bio. Entries expire after a TTL that is short
+for active players and long for retired ones, and the least recently
+used entries are evicted once the cache grows past its size limit.
+
+Several processes (the window, batch.py, service.py) can share the
+cache. index.json is only written under a file lock, after merging in
+what the other processes wrote since it was read, and every file of an
+entry is written under a temporary name and renamed into place, so a
+reader never sees half of one. Access times are written in batches, at
+most every ACCESS_SAVE_INTERVAL seconds and at exit. Player folders the
+index does not know about, left behind by a crash or a lost merge, are
+removed once they are ORPHAN_AGE old.
+
+Command line example (prints cache counters and size):
+"python3 cache.py"
+
+"""
+
+import os
+import re
+import gzip
+import json
+import time
+import atexit
+import shutil
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl  # POSIX only, elsewhere the index is written without a lock
+except ImportError:
+    fcntl = None
+
+DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+
+FORMAT = 2  # entries stored in another layout are dropped on read
+
+MAX_BYTES = 200 * 1024 * 1024
+ACTIVE_TTL = 12 * 60 * 60  # stats change after every game
+RETIRED_TTL = 90 * 24 * 60 * 60  # only the bio can still change
+ACCESS_SAVE_INTERVAL = 30  # seconds access times may wait to be written
+ORPHAN_AGE = 60 * 60  # seconds before a folder missing from the index is removed
+
+PLAYER_FOLDER = re.compile(r"^[a-z.'-]{1,8}\d{2}$")  # named by ext, e.g. jamesle01 (not headshots)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def current_season(now = None):
+    # start year of the current (or most recent) season, which begins in October
+    now = time.localtime(now)
+
+    return now.tm_year if now.tm_mon >= 10 else now.tm_year - 1
+
+
+def is_active(reg_season, now = None):
+    if reg_season is None or reg_season.empty:
+        return False
+
+    last = reg_season['Year'].max()
+    if pd.isna(last):
+        return False
+
+    # a player from last season still counts during the off season
+    return bool(last >= current_season(now) - 1)
+
+
+@contextmanager
+def file_lock(path):
+    # held across processes while index.json is merged and written
+    if fcntl is None:
+        yield
+        return
+
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _block(columns, rows, dtype):
+    block = np.empty((len(columns), rows), dtype=dtype)
+
+    for i, column in enumerate(columns):
+        block[i] = column
+
+    return block
+
+
+def column_kind(column):
+    # f = float64, i = int64, c = categorical, s = text
+    if pd.api.types.is_float_dtype(column):
+        return 'f'
+    if pd.api.types.is_integer_dtype(column):
+        return 'i'
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return 'c'
+
+    return 's'
+
+
+def save_df(path, df):
+    # one block per kind of column (rows are columns), no pickling,
+    # text has a null mask (see column_kind for the kinds)
+    kinds = []
+    blocks = {'f': [], 'i': [], 's': []}
+
+    for col in df.columns:
+        column = df[col]
+        kind = column_kind(column)
+        kinds.append(kind)
+        blocks['s' if kind == 'c' else kind].append(column)
+
+    nulls = _block([c.isna().to_numpy() for c in blocks['s']], len(df), bool)
+    text = _block([c.astype(object).where(c.notna(), '').astype(str).to_numpy()
+                   for c in blocks['s']], len(df), object).astype(str)
+
+    np.savez(path, columns=np.array([str(c) for c in df.columns]), kinds=np.array(kinds),
+             index=np.asarray(df.index),
+             floats=_block([c.to_numpy(np.float64) for c in blocks['f']], len(df), np.float64),
+             ints=_block([c.to_numpy(np.int64) for c in blocks['i']], len(df), np.int64),
+             text=text, nulls=nulls)
+
+
+def replace_file(folder, name, write):
+    # write(f) fills a temporary file that then replaces folder/name whole
+    tmp = os.path.join(folder, f'.{name}.{os.getpid()}.{threading.get_ident()}.tmp')
+
+    try:
+        with open(tmp, 'wb') as f:
+            write(f)
+
+        os.replace(tmp, os.path.join(folder, name))
+
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+        raise
+
+
+def load_df(path):
+    with np.load(path) as data:
+        blocks = {'f': iter(data['floats']), 'i': iter(data['ints'])}
+        text = data['text'].astype(object)
+        text[data['nulls']] = np.nan
+        blocks['s'] = iter(text)
+        columns = {}
+
+        for col, kind in zip(data['columns'].tolist(), data['kinds'].tolist()):
+            values = next(blocks['s' if kind == 'c' else kind])
+            columns[col] = pd.Categorical(values) if kind == 'c' else values
+
+        return pd.DataFrame(columns, index=data['index'])
+
+
+class PlayerCache():
+    def __init__(self, path = DIR, max_bytes = MAX_BYTES,
+                 active_ttl = ACTIVE_TTL, retired_ttl = RETIRED_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.active_ttl = active_ttl
+        self.retired_ttl = retired_ttl
+        self.stats = Counter()  # hits, misses, expired, evictions, stores
+        self.lock = threading.Lock()
+        self.entries = None  # ext -> record, loaded on first use
+
+        # changes not written to index.json yet, merged into it on save
+        self.stored = {}  # ext -> record
+        self.dropped = {}  # ext -> when the dropped record was stored
+        self.accessed = {}  # ext -> last hit
+        self.saved = 0.0  # time.monotonic() of the last save
+
+    def _index_path(self):
+        return os.path.join(self.path, 'index.json')
+
+    def _read(self):
+        try:
+            with open(self._index_path()) as f:
+                return json.load(f)
+
+        except (OSError, ValueError):
+            return {}
+
+    def _load(self):
+        if self.entries is None:
+            self.entries = self._read()
+
+    def _merge(self):
+        # index.json as written by every process, plus this one's changes
+        entries = self._read()
+
+        for ext, stored in self.dropped.items():
+            if ext in entries and entries[ext].get('stored', 0) <= stored:
+                del entries[ext]  # not stored again since
+
+        entries.update(self.stored)
+
+        for ext, accessed in self.accessed.items():
+            if ext in entries:
+                entries[ext]['accessed'] = max(entries[ext].get('accessed', 0), accessed)
+
+        self.entries = entries
+
+    def _save(self, evict = False):
+        os.makedirs(self.path, exist_ok=True)
+        tmp = self._index_path() + '.tmp'
+
+        with file_lock(os.path.join(self.path, 'index.lock')):
+            self._merge()
+
+            if evict:
+                self._evict()
+                self._remove_orphans()
+
+            with open(tmp, 'w') as f:
+                json.dump(self.entries, f)
+
+            os.replace(tmp, self._index_path())
+
+        self.stored.clear()
+        self.dropped.clear()
+        self.accessed.clear()
+        self.saved = time.monotonic()
+
+    def _drop(self, ext):
+        entry = self.entries.pop(ext, None)
+        self.stored.pop(ext, None)
+        self.accessed.pop(ext, None)
+
+        if entry is not None:
+            self.dropped[ext] = entry.get('stored', 0)
+
+        shutil.rmtree(os.path.join(self.path, ext), ignore_errors=True)
+
+    def _remove_orphans(self, now = None):
+        # folders of players the index does not know, old enough that no
+        # other process can still be writing them
+        now = time.time() if now is None else now
+
+        for name in os.listdir(self.path):
+            folder = os.path.join(self.path, name)
+
+            if name in self.entries or not PLAYER_FOLDER.match(name) or not os.path.isdir(folder):
+                continue
+
+            try:
+                if now - os.path.getmtime(folder) < ORPHAN_AGE:
+                    continue
+            except OSError:
+                continue
+
+            shutil.rmtree(folder, ignore_errors=True)
+            self.stats['orphans'] += 1
+
+    def flush(self):
+        # writes access times that are still waiting
+        with self.lock:
+            if self.accessed:
+                self._save()
+
+    def size(self):
+        with self.lock:
+            self._load()
+            return sum(e['size'] for e in self.entries.values())
+
+    def fresh(self, ext, now = None):
+        # whether get(ext) would hit, without reading the tables or counting it
+        now = time.time() if now is None else now
+
+        with self.lock:
+            self._load()
+            entry = self.entries.get(ext)
+
+            if entry is None or entry.get('format') != FORMAT:
+                return False
+
+            ttl = self.active_ttl if entry['active'] else self.retired_ttl
+
+            return now - entry['stored'] <= ttl
+
+    def get(self, ext, now = None):
+        """Returns (reg_season, playoff, bio) or None on a miss"""
+        now = time.time() if now is None else now
+
+        with self.lock:
+            self._load()
+            entry = self.entries.get(ext)
+
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+
+            if entry.get('format') != FORMAT:
+                self.stats['misses'] += 1
+                self._drop(ext)  # written by an older version
+                self._save()
+                return None
+
+            ttl = self.active_ttl if entry['active'] else self.retired_ttl
+
+            if now - entry['stored'] > ttl:
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                self._drop(ext)
+                self._save()
+                return None
+
+            folder = os.path.join(self.path, ext)
+
+            try:
+                reg_season = load_df(os.path.join(folder, 'reg_season.npz'))
+                playoff = load_df(os.path.join(folder, 'playoff.npz'))
+
+            except (OSError, ValueError, KeyError, EOFError):
+                self.stats['misses'] += 1
+                self._drop(ext)  # damaged entry
+                self._save()
+                return None
+
+            entry['accessed'] = now
+            self.accessed[ext] = now
+            self.stats['hits'] += 1
+
+            if time.monotonic() - self.saved >= ACCESS_SAVE_INTERVAL:
+                self._save()
+
+            return reg_season, playoff, entry['bio']
+
+    def page(self, ext):
+        """Returns the raw cached page, or None"""
+        try:
+            with gzip.open(os.path.join(self.path, ext, 'page.html.gz'), 'rt',
+                           encoding='utf-8') as f:
+                return f.read()
+
+        except OSError:
+            return None
+
+    def put(self, ext, html, reg_season, playoff, bio = None, now = None):
+        now = time.time() if now is None else now
+        folder = os.path.join(self.path, ext)
+
+        with self.lock:
+            self._load()
+            os.makedirs(folder, exist_ok=True)
+
+            def write_page(f):
+                with gzip.open(f, 'wt', encoding='utf-8', compresslevel=5) as page:
+                    page.write(html)
+
+            replace_file(folder, 'page.html.gz', write_page)
+            replace_file(folder, 'reg_season.npz', lambda f: save_df(f, reg_season))
+            replace_file(folder, 'playoff.npz', lambda f: save_df(f, playoff))
+
+            size = sum(os.path.getsize(os.path.join(folder, name))
+                       for name in ('page.html.gz', 'reg_season.npz', 'playoff.npz'))
+
+            entry = {'format': FORMAT, 'stored': now, 'accessed': now, 'size': size,
+                     'active': is_active(reg_season, now), 'bio': bio or {}}
+            self.entries[ext] = entry
+            self.stored[ext] = entry
+            self.dropped.pop(ext, None)
+            self.stats['stores'] += 1
+
+            self._save(evict=True)
+
+    def _evict(self):
+        # least recently used first until the cache fits again, on the merged index
+        total = sum(e['size'] for e in self.entries.values())
+
+        for ext in sorted(self.entries, key=lambda e: self.entries[e]['accessed']):
+            if total <= self.max_bytes:
+                break
+
+            total -= self.entries[ext]['size']
+            self._drop(ext)
+            self.stats['evictions'] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            self.stored.clear()
+            self.dropped.clear()
+            self.accessed.clear()
+            shutil.rmtree(self.path, ignore_errors=True)
+
+
+def get_cache():
+    global _cache
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PlayerCache()
+                atexit.register(_cache.flush)
+
+    return _cache
+
+
+def set_cache(player_cache):
+    # e.g. one in a temporary folder, None for the default
+    global _cache
+
+    with _cache_lock:
+        _cache = player_cache
+
+
+if __name__ == "__main__":
+    c = get_cache()
+    print(f'{c.size() / 1024:.1f} KB in {len(c.entries)} players at {c.path}')
@@ -0,0 +1,118 @@
+"""
+Peak charts:
+Draws the peak and stats-per-game graphs onto a matplotlib Figure
+
+The lines and peak markers are created once and only get new data on
+each redraw. They are animated artists, so when the season axis stays
+the same the cached background is restored and only they are redrawn
+(blitting). A full draw only happens when the axis changes or when the
+limits autoscale picks for the new data are not the ones on screen.
+Works with any canvas, Qt or headless Agg.
+
+"""
+
+import numpy as np
+
+YLIM_TOLERANCE = 0.005  # share of the axis height autoscaled limits may move and still blit
+
+
+class Peak_Chart():
+
+    def __init__(self, fig):
+        # fig must already have its final canvas attached
+        self.fig = fig
+        self.canvas = fig.canvas
+        self.fig.subplots_adjust(top = .93, hspace=.5)
+        self.peak_graph = self.fig.add_subplot(211)
+        self.peak_graph.set_title('Peak')
+        self.stats = self.fig.add_subplot(212)
+        self.stats.set_title('Stats Per Game')
+
+        self.peak_line, = self.peak_graph.plot([0, 0], [0, 0], animated=True)  # peak sum
+        self.peak_span = self.peak_graph.axvline(0, color='C1', visible=False,
+                                                 animated=True)  # highlights peak
+
+        self.ppg_line, = self.stats.plot([0, 0], [0, 0], color = 'green', animated=True)  # points
+        self.apg_line, = self.stats.plot([], [], color = 'blue', animated=True)  # assists
+        self.rpg_line, = self.stats.plot([], [], color = 'red', animated=True)  # rebounds
+        self.stats_span = self.stats.axvline(0, color='C1', visible=False,
+                                             animated=True)  # highlights peak
+
+        self.legend = self.stats.legend([self.ppg_line, self.apg_line, self.rpg_line],
+                                        ['Points', 'Assists', 'Rebounds'])
+        self.legend.set_visible(False)
+
+        self.artists = [self.peak_line, self.peak_span, self.ppg_line,
+                        self.apg_line, self.rpg_line, self.stats_span]
+        self.seasons = None  # season labels currently on the x axis
+        self.background = None
+        self.full_draws = 0
+        self.blits = 0
+
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+
+    def on_draw(self, event):
+        # every full draw (including resizes) refreshes the cached background
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_artists()
+
+    def draw_artists(self):
+        for artist in self.artists:
+            self.fig.draw_artist(artist)
+
+    def autoscaled(self, ax):
+        # True when autoscale would keep ax's y limits for the new data,
+        # which are then left exactly as drawn so the background still matches
+        low, high = ax.get_ylim()
+        ax.relim()
+        ax.autoscale_view(scalex=False)
+        new_low, new_high = ax.get_ylim()
+
+        if max(abs(new_low - low), abs(new_high - high)) > YLIM_TOLERANCE * (high - low):
+            return False
+
+        ax.set_ylim(low, high, auto=None)  # autoscale stays on
+
+        return True
+
+    def redraw(self, peak):
+        # peak is a peakfinder.Peak
+        seasons = peak.seasons.tolist()
+        idx = np.arange(len(seasons))  # turns season into a list of indices
+        peak_sum = peak.sums
+        max_idx = peak.index
+        ppg = peak.ppg
+        apg = peak.apg
+        rpg = peak.rpg
+
+        self.peak_line.set_data(idx, peak_sum)
+        self.ppg_line.set_data(idx, ppg)
+        self.apg_line.set_data(idx, apg)
+        self.rpg_line.set_data(idx, rpg)
+
+        for span in (self.peak_span, self.stats_span):
+            span.set_xdata([max_idx, max_idx])
+            span.set_visible(True)
+
+        if (self.background is not None and seasons == self.seasons and
+            self.autoscaled(self.peak_graph) and self.autoscaled(self.stats)):
+
+            # same axes: only the lines change
+            self.canvas.restore_region(self.background)
+            self.draw_artists()
+            self.canvas.blit(self.fig.bbox)
+            self.blits += 1
+            return
+
+        self.seasons = seasons
+
+        for ax in (self.peak_graph, self.stats):
+            ax.set_xticks(idx)
+            ax.set_xticklabels(seasons, rotation = 70)
+            ax.relim()
+            ax.autoscale_view()
+
+        self.legend.set_visible(True)
+
+        self.canvas.draw()  # on_draw caches the new background
+        self.full_draws += 1
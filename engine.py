@@ -0,0 +1,88 @@
+"""
+Vectorized peak engine:
+Finds the peak season of many players at once
+
+All players' seasons live in one typed, columnar DataFrame (one row per
+player season). Scores and peak seasons are computed with grouped
+pandas/NumPy operations instead of calling determine_peak_season once
+per player, and give the same peaks it does.
+
+"""
+
+import numpy as np
+import pandas as pd
+
+SCALAR = 2.5  # same weighting as peakfinder.peak_calculation
+
+NUMERIC_COLUMNS = ['PER', 'WS', 'FG%', 'PTS', 'AST', 'TRB']
+STORE_COLUMNS = ['player', 'Season', 'Tm'] + NUMERIC_COLUMNS
+
+
+def build_store(frames):
+    """Concatenates {player: stats DataFrame} into one typed store.
+    The frames are typed at ingest (schema.coerce), so each one's number
+    columns are taken out as one float64 block, without a cast through object.
+    """
+    frames = {player: df for player, df in frames.items() if df is not None and not df.empty}
+
+    if not frames:
+        return pd.DataFrame({col: pd.Series(dtype=float) for col in STORE_COLUMNS})
+
+    # stitched together from per frame blocks, far cheaper than DataFrame concat
+    codes = np.repeat(np.arange(len(frames)), [len(df) for df in frames.values()])
+    numbers = np.concatenate([_numbers(df) for df in frames.values()])
+    columns = {'player': pd.Categorical.from_codes(codes, categories=list(frames))}
+
+    for col in ('Season', 'Tm'):
+        columns[col] = [value for df in frames.values()
+                        for value in (df[col].tolist() if col in df.columns else [np.nan] * len(df))]
+
+    for i, col in enumerate(NUMERIC_COLUMNS):
+        columns[col] = numbers[:, i]
+
+    return pd.DataFrame(columns)
+
+
+def _numbers(df):
+    # NUMERIC_COLUMNS of one frame as a float64 block, NaN for a missing column
+    positions = [df.columns.get_loc(col) for col in NUMERIC_COLUMNS if col in df.columns]
+
+    if len(positions) == len(NUMERIC_COLUMNS):
+        try:
+            return df.take(positions, axis=1).to_numpy(np.float64)
+        except (TypeError, ValueError):
+            pass  # a frame that was not typed
+
+    return np.column_stack([pd.to_numeric(df[col], errors='coerce').to_numpy(np.float64)
+                            if col in df.columns else np.full(len(df), np.nan)
+                            for col in NUMERIC_COLUMNS])
+
+
+def score(store):
+    # normalized PER + WS for every season, scaled by each player's own best
+    grouped = store.groupby('player', observed=True, sort=False)
+    per_max = grouped['PER'].transform('max')
+    ws_max = grouped['WS'].transform('max')
+
+    return SCALAR * store['PER'] / per_max + SCALAR * store['WS'] / ws_max
+
+
+def peaks(store):
+    """One row per player: the peak season's stats and its score.
+    store['sum'] is filled in with every season's score.
+    """
+    store['sum'] = score(store)
+
+    # first season with the highest score, like idxmax in determine_peak_season
+    idx = store.groupby('player', observed=True, sort=False)['sum'].idxmax()
+
+    result = store.loc[idx.dropna().astype(np.int64)]
+
+    return result.set_index('player')
+
+
+def peaks_for(players, playoffs = False):
+    # convenience wrapper over peakfinder.Player objects
+    frames = {p.ext: (p.playoff if playoffs else p.reg_season) for p in players}
+
+    return peaks(build_store(frames))
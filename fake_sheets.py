@@ -0,0 +1,165 @@
+"""
+Local stand-in for the Google Sheets service used by sheets.py
+
+FakeSheets answers spreadsheets().values() update/get/batchUpdate/
+batchGet the way the real API does for our IMPORTHTML formulas: a
+written formula is "recalculated" from a saved player page and reading
+the tab returns the table as rows of strings. A read waits until the
+tab's last formula has recalculated (recalc seconds after it was
+written), so two lookups sharing a tab read whichever formula came last,
+like on the real spreadsheet. spreadsheets() get/batchUpdate list, add
+and delete tabs; writing or reading a tab that does not exist fails.
+Every call is counted.
+
+Example:
+    fake = FakeSheets({player_url: html}, recalc=0.05)
+    sheets.setService(fake)
+
+"""
+
+import re
+import time
+import threading
+from collections import Counter
+
+import sheets
+import tables as stat_tables
+
+FORMULA = re.compile(r'IMPORTHTML\("([^"]+)", "table",(\d+)\)')
+
+
+class _Request():
+    def __init__(self, func):
+        self.func = func
+
+    def execute(self):
+        return self.func()
+
+
+class FakeSheets():
+    def __init__(self, pages = None, latency = 0.0, recalc = 0.0):
+        self.pages = pages or {}  # player url -> page html
+        self.latency = latency  # seconds slept per call, like a round trip
+        self.recalc = recalc  # seconds an IMPORTHTML takes to recalculate
+        self.calls = Counter()
+        self.tabs = {range.split('!')[0]: i for i, range in enumerate(sheets.RANGES.values())}
+        self.cells = {}  # tab name -> (values, time they are recalculated)
+        self.parsed = {}  # player url -> parsed tables, parse once like a warm cache
+        self.lock = threading.Lock()
+
+    def import_html(self, url, table_num):
+        # IMPORTHTML numbering the way sheets.MADE_PLAYOFFS/NO_PLAYOFFS expect it
+        html = self.pages[url]
+        table_nums = sheets.MADE_PLAYOFFS if 'playoffs_per_game' in html else sheets.NO_PLAYOFFS
+        names = {num: name for name, num in table_nums.items()}
+
+        if table_num not in names:
+            return []
+
+        if url not in self.parsed:
+            self.parsed[url] = stat_tables.parse_tables(html, typed=False)  # cell text
+
+        df = self.parsed[url][names[table_num]]
+        if df.empty:
+            return []
+
+        return [list(df.columns)] + df.values.tolist()
+
+    def tab(self, range):
+        tab = range.split('!')[0]
+
+        if tab not in self.tabs:
+            raise ValueError(f'Unable to parse range: {range}')
+
+        return tab
+
+    def write(self, range, formula):
+        match = FORMULA.search(formula)
+        values = self.import_html(match.group(1), int(match.group(2))) if match else [[formula]]
+
+        with self.lock:
+            self.cells[self.tab(range)] = (values, time.monotonic() + self.recalc)
+
+    def read(self, range):
+        while True:
+            with self.lock:
+                values, ready = self.cells.get(self.tab(range), ([], 0))
+
+            wait = ready - time.monotonic()
+            if wait <= 0:
+                return list(values)
+
+            time.sleep(wait)  # the tab may be rewritten meanwhile, look again
+
+    def call(self, name, func):
+        def run():
+            self.calls[name] += 1
+            if self.latency:
+                time.sleep(self.latency)
+
+            return func()
+
+        return _Request(run)
+
+    def update_tabs(self, requests):
+        replies = []
+
+        with self.lock:
+            for request in requests:
+                if 'addSheet' in request:
+                    title = request['addSheet']['properties']['title']
+
+                    if title in self.tabs:
+                        raise ValueError(f'A sheet with the name "{title}" already exists')
+
+                    self.tabs[title] = max(self.tabs.values(), default=-1) + 1
+                    replies.append({'addSheet': {'properties': {'sheetId': self.tabs[title],
+                                                                'title': title}}})
+
+                elif 'deleteSheet' in request:
+                    sheet_id = request['deleteSheet']['sheetId']
+                    title = next(t for t, i in self.tabs.items() if i == sheet_id)
+                    del self.tabs[title]
+                    self.cells.pop(title, None)
+                    replies.append({})
+
+        return {'replies': replies}
+
+    # spreadsheets() is the fake itself, values() a view of it
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return _Values(self)
+
+    def get(self, spreadsheetId, fields = None):
+        return self.call('spreadsheets.get', lambda: {'sheets': [
+            {'properties': {'sheetId': i, 'title': t}} for t, i in self.tabs.items()]})
+
+    def batchUpdate(self, spreadsheetId, body):
+        return self.call('spreadsheets.batchUpdate', lambda: self.update_tabs(body['requests']))
+
+
+class _Values():
+    # spreadsheets().values()
+    def __init__(self, fake):
+        self.fake = fake
+
+    def update(self, spreadsheetId, valueInputOption, range, body):
+        return self.fake.call('update', lambda: self.fake.write(range, body['values'][0][0]))
+
+    def batchUpdate(self, spreadsheetId, body):
+        def run():
+            for data in body['data']:
+                self.fake.write(data['range'], data['values'][0][0])
+
+            return {}
+
+        return self.fake.call('batchUpdate', run)
+
+    def get(self, spreadsheetId, range):
+        return self.fake.call('get', lambda: {'range': range, 'values': self.fake.read(range)})
+
+    def batchGet(self, spreadsheetId, ranges):
+        return self.fake.call('batchGet', lambda: {
+            'valueRanges': [{'range': r, 'values': self.fake.read(r)} for r in ranges]})
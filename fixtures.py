@@ -0,0 +1,371 @@
+"""
+Offline fixture pages:
+Builds saved, synthetic basketball-reference pages so the parsers can
+be exercised without the network
+
+The pages follow basketball-reference's markup (ids, data-stat
+attributes, playoff tables hidden in HTML comments) with made up,
+deterministic numbers. The letter index pages are generated on demand
+from player_index.tsv, so they always list the players it holds.
+serve() puts any of these pages behind a local HTTP server that can
+add latency and fail requests, standing in for basketball-reference.
+
+To (re)write the saved pages into fixtures/:
+"python3 fixtures.py"
+
+"""
+
+import os
+import time
+import hashlib
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pandas as pd
+
+import schema
+
+DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+PER_GAME_HEADER = ['Season', 'Age', 'Tm', 'Lg', 'Pos', 'G', 'GS', 'MP', 'FG', 'FGA',
+                   'FG%', '3P', '3PA', '3P%', '2P', '2PA', '2P%', 'eFG%', 'FT', 'FTA',
+                   'FT%', 'ORB', 'DRB', 'TRB', 'AST', 'STL', 'BLK', 'TOV', 'PF', 'PTS']
+ADVANCED_HEADER = ['Season', 'Age', 'Tm', 'Lg', 'Pos', 'G', 'MP', 'PER', 'TS%', '3PAr',
+                   'FTr', 'ORB%', 'DRB%', 'TRB%', 'AST%', 'STL%', 'BLK%', 'TOV%', 'USG%',
+                   '', 'OWS', 'DWS', 'WS', 'WS/48', '', 'OBPM', 'DBPM', 'BPM', 'VORP']
+TEAMS = ['ATL', 'BOS', 'CHI', 'CLE', 'DAL', 'DEN', 'LAL', 'MIA', 'NYK', 'SAS']
+
+# the other tables a real page carries (same shape as per game here),
+# all but the first are commented out like on basketball-reference
+OTHER_TABLES = ['totals', 'per_minute', 'per_poss', 'shooting', 'pbp', 'game_highs']
+
+# ext -> (full name, nickname, first season, seasons, playoff seasons, college)
+PLAYERS = {'rookiro01': ('Rowan Rookie', None, 2019, 3, 0, None),
+           'veterve01': ('Vernon Veteran', 'Big V', 2002, 18, 12, 'State University')}
+
+
+def season_label(year):
+    return f'{year}-{str(year + 1)[-2:]}'
+
+
+def season_rows(rng, first, count, playoffs = False):
+    # (per game row, advanced row) for each season
+    rows = []
+    team = rng.choice(TEAMS)
+
+    for i in range(count):
+        year = first + i
+        age = 20 + i
+        games = rng.randint(5, 20) if playoffs else rng.randint(40, 82)
+
+        if rng.random() < 0.2:
+            team = rng.choice(TEAMS)  # changed teams in the off season
+
+        mp = round(rng.uniform(15, 40), 1)
+        fga = round(mp * rng.uniform(0.3, 0.6), 1)
+        fg = round(fga * rng.uniform(0.4, 0.55), 1)
+        pa3 = round(fga * rng.uniform(0.1, 0.4), 1)
+        p3 = round(pa3 * rng.uniform(0.3, 0.4), 1)
+        fta = round(fga * rng.uniform(0.2, 0.4), 1)
+        ft = round(fta * rng.uniform(0.65, 0.9), 1)
+        orb = round(rng.uniform(0.3, 3), 1)
+        drb = round(rng.uniform(2, 8), 1)
+        pts = round(2 * (fg - p3) + 3 * p3 + ft, 1)
+
+        def pct(made, att):
+            return f'{made / att:.3f}'.lstrip('0') if att else ''
+
+        base = [season_label(year), str(age), team, 'NBA', 'SF', str(games)]
+        per_game = base + [str(games), str(mp), str(fg), str(fga), pct(fg, fga),
+                           str(p3), str(pa3), pct(p3, pa3), str(round(fg - p3, 1)),
+                           str(round(fga - pa3, 1)), pct(fg - p3, fga - pa3),
+                           pct(fg + 0.5 * p3, fga), str(ft), str(fta), pct(ft, fta),
+                           str(orb), str(drb), str(round(orb + drb, 1)),
+                           str(round(rng.uniform(1, 9), 1)), str(round(rng.uniform(0.3, 2), 1)),
+                           str(round(rng.uniform(0.1, 2), 1)), str(round(rng.uniform(1, 4), 1)),
+                           str(round(rng.uniform(1, 4), 1)), str(pts)]
+
+        ws = round(rng.uniform(-0.5, 4 if playoffs else 18), 1)
+        advanced = base[:6] + [str(int(games * mp)), str(round(rng.uniform(8, 31), 1)),
+                               pct(pts, 2 * (fga + 0.44 * fta)), pct(pa3, fga), pct(fta, fga),
+                               str(round(rng.uniform(1, 12), 1)), str(round(rng.uniform(8, 30), 1)),
+                               str(round(rng.uniform(5, 20), 1)), str(round(rng.uniform(5, 45), 1)),
+                               str(round(rng.uniform(0.5, 3), 1)), str(round(rng.uniform(0.1, 5), 1)),
+                               str(round(rng.uniform(8, 16), 1)), str(round(rng.uniform(15, 35), 1)),
+                               '', str(round(ws * 0.6, 1)), str(round(ws * 0.4, 1)), str(ws),
+                               f'{ws / max(games * mp, 1) * 48:.3f}', '',
+                               str(round(rng.uniform(-3, 9), 1)), str(round(rng.uniform(-2, 3), 1)),
+                               str(round(rng.uniform(-4, 12), 1)), str(round(rng.uniform(-1, 9), 1))]
+
+        rows.append((per_game, advanced))
+
+    return rows
+
+
+def table_html(table_id, header, rows, footer):
+    out = [f'<table class="stats_table" id="{table_id}">', '<thead><tr>']
+
+    for h in header:
+        out.append(f'<th scope="col">{h}</th>')
+
+    out.append('</tr></thead><tbody>')
+
+    for row in rows:
+        if row[2] == 'Did Not Play':
+            out.append(f'<tr><th data-stat="season">{row[0]}</th><td>{row[1]}</td>'
+                       f'<td colspan="{len(header) - 2}">Did Not Play (injury)</td></tr>')
+            continue
+
+        out.append(f'<tr id="{table_id}.{row[0][:4]}" class="full_table">'
+                   f'<th data-stat="season">{row[0]}</th>')
+        out.extend(f'<td>{cell}</td>' for cell in row[1:])
+        out.append('</tr>')
+
+    out.append('</tbody><tfoot><tr>')
+    out.extend(f'<td>{cell}</td>' for cell in footer)
+    out.append('</tr></tfoot></table>')
+
+    return ''.join(out)
+
+
+def career_row(width):
+    return ['Career', '', '', 'NBA'] + [''] * (width - 4)
+
+
+def nav_html():
+    # the site menu, a few hundred links on every page
+    links = [f'<li><a href="/teams/{team}/{year}.html">{team} {year}</a></li>'
+             for team in TEAMS for year in range(1990, 2025)]
+
+    return '<div class="nav"><ul>' + ''.join(links) + '</ul></div>'
+
+
+def player_page(ext, seed = None, info = None):
+    # info is a PLAYERS style tuple, for players not in PLAYERS
+    name, nickname, first, count, playoff_count, college = info or PLAYERS[ext]
+    rng = random.Random(seed if seed is not None else ext)
+
+    regular = season_rows(rng, first, count)
+    if count > 5:
+        # one injured season in the middle of a long career
+        dnp = season_label(first + count // 2)
+        regular[count // 2] = ([dnp, '', 'Did Not Play'], [dnp, '', 'Did Not Play'])
+
+    playoffs = season_rows(rng, first + 1, playoff_count, playoffs=True)
+
+    info = ['<div id="info"><div id="meta">',
+            '<div class="media-item"><img src="https://www.basketball-reference.com/req/'
+            f'headshots/{ext}.jpg" alt="Photo of {name}"></div>',
+            f'<div><h1><span>{name}</span></h1>',
+            f'<p><strong>{name}</strong></p>']
+
+    if nickname:
+        info.append(f'<p>({nickname})</p>')
+
+    info.append('<p>\n<strong>Position:</strong>\n  Small Forward and Power Forward\n\n'
+                '  &#9642;\n  \n<strong>Shoots:</strong>\n  Right\n</p>')
+    info.append('<p><span itemprop="height">6-8</span>,&nbsp;'
+                '<span itemprop="weight">230lb</span></p>')
+
+    if college:
+        info.append(f'<p><strong>College:</strong>\n  <a href="/cbb/">{college}</a></p>')
+
+    info.append('</div></div></div>')
+
+    page = ['<!DOCTYPE html><html><head><title>', name, ' Stats</title></head><body>',
+            '<div id="header"><img src="https://cdn.ssref.net/req/logos/bbr-logo.svg" '
+            'alt="logo">', nav_html(), '</div>', ''.join(info),
+            '<div id="all_per_game" class="table_wrapper">',
+            table_html('per_game', PER_GAME_HEADER, [r[0] for r in regular],
+                       career_row(len(PER_GAME_HEADER))),
+            '</div><div id="all_advanced" class="table_wrapper">',
+            table_html('advanced', ADVANCED_HEADER, [r[1] for r in regular],
+                       career_row(len(ADVANCED_HEADER))),
+            '</div>']
+
+    if playoffs:
+        # basketball-reference ships the playoff tables commented out
+        page.append('<div id="all_playoffs_per_game" class="table_wrapper"><!--\n')
+        page.append(table_html('playoffs_per_game', PER_GAME_HEADER, [r[0] for r in playoffs],
+                               career_row(len(PER_GAME_HEADER))))
+        page.append('\n--></div><div id="all_playoffs_advanced" class="table_wrapper"><!--\n')
+        page.append(table_html('playoffs_advanced', ADVANCED_HEADER, [r[1] for r in playoffs],
+                               career_row(len(ADVANCED_HEADER))))
+        page.append('\n--></div>')
+
+    for i, table_id in enumerate(OTHER_TABLES):
+        rows = [r[0] for r in regular]
+        table = table_html(table_id, PER_GAME_HEADER, rows, career_row(len(PER_GAME_HEADER)))
+        page.append(f'<div id="all_{table_id}" class="table_wrapper">')
+        page.append(table if i == 0 else '<!--\n' + table + '\n-->')
+        page.append('</div>')
+
+    page.append('<div id="footer">' + nav_html() + '</div></body></html>')
+
+    return ''.join(page)
+
+
+def career_frame(seed, seasons = None):
+    # a merged regular season table, like peakfinder.merge_tables builds
+    rng = random.Random(seed)
+    seasons = seasons or rng.randint(1, 20)
+    rows = season_rows(rng, 1950 + rng.randint(0, 50), seasons)
+
+    reg = schema.coerce(pd.DataFrame([r[0] for r in rows], columns=PER_GAME_HEADER), 'Regular')
+    reg = reg.drop(['Age', 'Tm', 'Lg', 'Pos', 'G', 'MP'], axis=1)
+    adv = pd.DataFrame([r[1] for r in rows], columns=ADVANCED_HEADER)
+    adv = schema.coerce(adv, 'Regular Advanced')
+
+    return pd.merge(reg, adv, how='outer', on=['Season', 'Year'])
+
+
+def page_path(ext):
+    return os.path.join(DIR, ext + '.html')
+
+
+def load_page(ext):
+    with open(page_path(ext), encoding='utf-8') as f:
+        return f.read()
+
+
+def letter_page(letter, players):
+    # the /players/<letter>/ index, players is a list of (name, ext)
+    rows = []
+
+    for name, ext in players:
+        rows.append(f'<tr><th scope="row" class="left" data-append-csv="{ext}" '
+                    f'data-stat="player"><a href="/players/{letter}/{ext}.html">'
+                    f'{name.title()}</a></th><td class="right" data-stat="year_min">'
+                    f'2000</td></tr>')
+
+    return ('<!DOCTYPE html><html><head><title>Players</title></head><body>'
+            '<table class="sortable stats_table" id="players"><thead><tr>'
+            '<th class="poptip sort_default_asc center" data-stat="player">Player</th>'
+            '<th data-stat="year_min">From</th></tr></thead><tbody>'
+            + ''.join(rows) + '</tbody></table></body></html>')
+
+
+def letter_pages(index = None):
+    # letter -> page, built from the player index (a player's letter is ext[0])
+    import player_index
+
+    index = index or player_index.get_index()
+    letters = {letter: [] for letter in 'abcdefghijklmnopqrstuvwxyz'}
+
+    for name, ext in sorted(index.pairs(), key=lambda pair: pair[1]):
+        letters.setdefault(ext[0], []).append((name, ext))
+
+    return {letter: letter_page(letter, players) for letter, players in letters.items()}
+
+
+def saved_site():
+    # url path -> page for the saved player pages and the letter pages, ready for serve()
+    pages = {}
+
+    for ext in PLAYERS:
+        pages[f'/players/{ext[0]}/{ext}.html'] = load_page(ext)
+
+    for letter, page in letter_pages().items():
+        pages[f'/players/{letter}/'] = page
+
+    return pages
+
+
+def crowd_site(count):
+    """url path -> page for count made up players (extensions loadaa01,
+    loadab01, ...), for load tests that need more than PLAYERS
+    """
+    pages = {}
+
+    for i in range(count):
+        ext = f'load{chr(97 + i // 26 % 26)}{chr(97 + i % 26)}01'
+        rng = random.Random(ext)
+        first = rng.randint(1960, 2015)
+        seasons = rng.randint(4, 18)
+        playoffs = rng.choice([0, rng.randint(3, seasons - 1)])
+        info = (f'Load Player{i}', None, first, seasons, playoffs, None)
+        pages[f'/players/l/{ext}.html'] = player_page(ext, info=info)
+
+    return pages
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+
+        with server.lock:
+            server.requests += 1
+            server.hits[self.path] = server.hits.get(self.path, 0) + 1
+            fail = server.hits[self.path] <= server.fail_first
+            stall = server.stall if server.hits[self.path] == 1 else 0.0
+
+        if server.delay or stall:
+            time.sleep(server.delay + stall)
+
+        page = server.pages.get(self.path)
+
+        if fail:
+            self.send_response(503)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if page is None:
+            self.send_error(404)
+            return
+
+        body = page.encode('utf-8')
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output clean
+
+
+def serve(pages, delay = 0.0, fail_first = 0, stall = 0.0):
+    """Serves pages ({url path: html}) on a local port in a background
+    thread. Every request sleeps delay seconds, the first request for
+    each path stalls another stall seconds, and the first fail_first
+    requests for each path get a 503. Pages carry an ETag and conditional
+    requests for an unchanged page get a 304. Call server.shutdown() when done.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    server.daemon_threads = True
+    server.pages = pages
+    server.delay = delay
+    server.fail_first = fail_first
+    server.stall = stall
+    server.requests = 0
+    server.hits = {}
+    server.lock = threading.Lock()
+    server.url = f'http://127.0.0.1:{server.server_port}'
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+def main():
+    os.makedirs(DIR, exist_ok=True)
+
+    for ext in PLAYERS:
+        with open(page_path(ext), 'w', encoding='utf-8') as f:
+            f.write(player_page(ext))
+
+
+if __name__ == "__main__":
+    main()
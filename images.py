@@ -0,0 +1,88 @@
+"""
+Headshot cache:
+Keeps downloaded player headshots in memory (bounded, least recently
+used out first) with an optional on-disk tier, so viewing a player again
+never downloads the picture again and nothing is written to the working
+directory
+
+"""
+
+import os
+import threading
+from collections import OrderedDict, Counter
+
+import outbound
+import tracing
+
+DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'headshots')
+
+MAX_IMAGES = 64  # headshots kept in memory
+DISK_CACHE = True  # also keep headshots in DIR between runs
+TIMEOUT = 10  # seconds
+
+_images = OrderedDict()  # ext -> jpeg bytes
+_lock = threading.Lock()
+stats = Counter()  # memory hits, disk hits, downloads
+
+
+def _remember(ext, data):
+    with _lock:
+        _images[ext] = data
+        _images.move_to_end(ext)
+
+        while len(_images) > MAX_IMAGES:
+            _images.popitem(last=False)
+
+
+def cached(ext):
+    # headshot bytes from the memory or disk cache, None if it was never downloaded
+    with _lock:
+        data = _images.get(ext)
+
+        if data is not None:
+            _images.move_to_end(ext)
+            stats['memory hits'] += 1
+            return data
+
+    path = os.path.join(DIR, ext + '.jpg')
+
+    if DISK_CACHE and os.path.exists(path):
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        stats['disk hits'] += 1
+        _remember(ext, data)
+        return data
+
+    return None
+
+
+def get(ext, url, lane = outbound.INTERACTIVE):
+    """Returns the headshot bytes for ext, downloading url (through
+    outbound.py, in lane) only if the picture is in neither the memory
+    nor the disk cache.
+    """
+    data = cached(ext)
+
+    if data is not None:
+        return data
+
+    path = os.path.join(DIR, ext + '.jpg')
+
+    with tracing.span('headshot download'):
+        data = outbound.get(url, lane, TIMEOUT, timeout=TIMEOUT).content
+
+    tracing.count('bytes downloaded', len(data))
+    stats['downloads'] += 1
+    _remember(ext, data)
+
+    if DISK_CACHE:
+        os.makedirs(DIR, exist_ok=True)
+        tmp = path + '.tmp'
+
+        with open(tmp, 'wb') as f:
+            f.write(data)
+
+        os.replace(tmp, path)
+
+    return data
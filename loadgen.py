@@ -0,0 +1,134 @@
+"""
+Load generator for service.py:
+Fires concurrent peak requests and reports throughput and latency
+
+Everything runs locally: made up player pages
+(fixtures.crowd_site) are served by fixtures.serve() with a delay
+standing in for basketball-reference, peakfinder reads them with the
+disk cache off, and a service is started on a free port. Players are
+picked with Zipf-like popularity, so a few are requested far more
+often than the rest, like dashboards do.
+
+Command line example:
+"python3 loadgen.py --requests 2000 --clients 32 --delay 0.2 --baseline"
+
+"""
+
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import fixtures
+import peakfinder as pf
+import service
+
+PLAYERS = 200
+REQUESTS = 1000
+CLIENTS = 16
+DELAY = 0.1  # seconds the stand-in takes per page
+
+
+def popular(exts, count, seed = 0):
+    # count picks from exts, the i-th player weighted 1 / (i + 1)
+    rng = random.Random(seed)
+
+    return rng.choices(exts, weights=[1 / (i + 1) for i in range(len(exts))], k=count)
+
+
+def fire(url, exts, clients = CLIENTS):
+    """GETs /peak for every ext in exts from clients threads.
+    Returns (seconds, [latency], Counter of status codes).
+    """
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one(ext):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+
+        start = time.perf_counter()
+        status = local.session.get(url + '/peak', params={'ext': ext}, timeout=60).status_code
+        elapsed = time.perf_counter() - start
+
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] += 1
+
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(clients) as pool:
+        list(pool.map(one, exts))
+
+    return time.perf_counter() - start, latencies, statuses
+
+
+def run(players = PLAYERS, count = REQUESTS, clients = CLIENTS, delay = DELAY, **options):
+    """Load test against a local stand-in, options go to service.Service.
+    Returns a dict of results, upstream is the pages the stand-in served.
+    """
+    site = fixtures.crowd_site(players)
+    upstream = fixtures.serve(site, delay)
+    exts = [path.rsplit('/', 1)[1][:-len('.html')] for path in site]
+
+    site_before, cache_before = pf.SITE, pf.USE_CACHE
+    pf.SITE, pf.USE_CACHE = upstream.url, False
+
+    server = service.serve(service.Service(**options))
+
+    try:
+        seconds, latencies, statuses = fire(server.url, popular(exts, count), clients)
+        metrics = server.service.metrics()
+
+    finally:
+        server.shutdown()
+        upstream.shutdown()
+        pf.SITE, pf.USE_CACHE = site_before, cache_before
+
+    return {'requests': count, 'seconds': seconds, 'throughput': count / seconds,
+            'p50': service.percentile(latencies, 50), 'p99': service.percentile(latencies, 99),
+            'statuses': dict(statuses), 'upstream': upstream.requests,
+            'lookups': metrics.get('lookups', 0), 'coalesced': metrics.get('coalesced', 0),
+            'result hits': metrics.get('result hits', 0)}
+
+
+def print_results(title, results):
+    print(title)
+    print(f"    {results['requests']} requests in {results['seconds']:.2f}s, "
+          f"{results['throughput']:.0f} requests/s")
+    print(f"    latency p50 {results['p50'] * 1000:.1f} ms, p99 {results['p99'] * 1000:.1f} ms")
+    print(f"    statuses {results['statuses']}")
+    print(f"    upstream pages {results['upstream']}, lookups {results['lookups']}, "
+          f"coalesced {results['coalesced']}, result hits {results['result hits']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the peak service')
+    parser.add_argument('--players', type=int, default=PLAYERS)
+    parser.add_argument('--requests', type=int, default=REQUESTS)
+    parser.add_argument('--clients', type=int, default=CLIENTS)
+    parser.add_argument('--delay', type=float, default=DELAY, help='stand-in seconds per page')
+    parser.add_argument('--max-lookups', type=int, default=service.MAX_LOOKUPS)
+    parser.add_argument('--baseline', action='store_true',
+                        help='also run with single flight and the result cache off')
+    args = parser.parse_args()
+
+    runs = {'single flight + result cache': {}}
+
+    if args.baseline:
+        runs['every request looked up'] = {'single_flight': False, 'ttl': 0}
+
+    for title, options in runs.items():
+        results = run(args.players, args.requests, args.clients, args.delay,
+                      max_lookups=args.max_lookups, **options)
+        print_results(title, results)
+
+
+if __name__ == "__main__":
+    main()
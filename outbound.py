@@ -0,0 +1,345 @@
+"""
+Outbound request scheduler:
+Every request to basketball-reference goes through here
+
+One pooled keep-alive session is shared by every caller. Before a
+request is sent it takes a token from its host's bucket (LIMITS), and
+callers waiting on a token are served lane by lane: interactive
+searches always go ahead of background work (the league batch, the
+player database crawl, prefetching). A 429 or 503 pauses the whole host
+for its Retry-After (or a backoff when there is none) before the
+request is tried again, so one throttled job does not keep hammering
+the site while everyone else waits out the ban. stats() reports the
+queue depth and wait times of each lane.
+
+Command line example (fetches a page and prints the stats):
+"python3 outbound.py https://www.basketball-reference.com/players/a/"
+
+"""
+
+import sys
+import time
+import heapq
+import itertools
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import tasks
+import tracing
+
+INTERACTIVE = 0  # a user is waiting on it
+BACKGROUND = 1  # batch jobs, crawls, prefetching
+LANES = {INTERACTIVE: 'interactive', BACKGROUND: 'background'}
+
+# host -> (requests per second, burst), hosts not listed are not limited.
+# basketball-reference blocks clients going over about 20 requests a minute
+LIMITS = {'www.basketball-reference.com': (20 / 60, 10)}
+
+CONNECTIONS = 16  # keep-alive connections kept per host
+RETRIES = 3  # tries after a 429/503 before the response is handed back
+BACKOFF = 1.0  # seconds paused after a 429/503 without a Retry-After, doubled per try
+MAX_PAUSE = 300  # longest Retry-After honoured, in seconds
+
+RETRY_STATUSES = (429, 503)
+
+
+class QueueTimeout(TimeoutError):
+    """No token came free for the request within its queue timeout"""
+
+
+class _Host():
+    # token bucket and pause of one host
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waiting = []  # heap of [lane, seq, cancelled, queued at]
+
+    def refill(self, now):
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+
+        self.updated = now
+
+    def ready_in(self, now):
+        # seconds until a token can be handed out
+        pause = self.paused_until - now
+
+        if not self.rate:
+            return max(pause, 0)
+
+        return max(pause, (1 - self.tokens) / self.rate, 0)
+
+
+def retry_after(response, attempt):
+    # seconds to pause the host for, from the Retry-After header (seconds or a date)
+    value = response.headers.get('Retry-After')
+
+    if value is not None:
+        try:
+            seconds = float(value)
+
+        except ValueError:
+            try:
+                seconds = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                seconds = None
+
+        if seconds is not None:
+            return min(max(seconds, 0), MAX_PAUSE)
+
+    return min(BACKOFF * 2 ** attempt, MAX_PAUSE)
+
+
+class Scheduler():
+    """Shared session plus per host token buckets, see the module docstring.
+    limits is {host: (rate, burst)}.
+    """
+
+    def __init__(self, limits = None, connections = CONNECTIONS, retries = RETRIES):
+        self.limits = LIMITS if limits is None else limits
+        self.retries = retries
+        self.cond = threading.Condition()
+        self.hosts = {}
+        self.seq = itertools.count()
+        self.session = self._session(connections)
+        self.stats_lock = threading.Lock()
+        self.counts = {lane: {'requests': 0, 'waited': 0.0, 'max wait': 0.0} for lane in LANES}
+        self.throttled = 0  # 429/503 responses seen
+
+    def _session(self, connections):
+        # connection errors are retried here, 429/503 by the scheduler
+        retry = Retry(total=2, backoff_factor=0.5, status_forcelist=[500, 502, 504],
+                      respect_retry_after_header=False)
+        adapter = HTTPAdapter(pool_connections=connections, pool_maxsize=connections,
+                              max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        return session
+
+    def _host(self, host):
+        # called holding the lock
+        if host not in self.hosts:
+            self.hosts[host] = _Host(*self.limits.get(host, (None, 1)))
+
+        return self.hosts[host]
+
+    def limit(self, host):
+        # (requests per second, burst) of host, rate None when it is not limited
+        with self.cond:
+            return self.limits.get(host, (None, 1))
+
+    def set_limit(self, host, rate, burst = None):
+        """Changes host's rate limit (requests per second), keeping its
+        burst unless one is given. Callers already queued see it at once.
+        """
+        with self.cond:
+            burst = self.limits.get(host, (None, 1))[1] if burst is None else burst
+            self.limits = {**self.limits, host: (rate, burst)}  # LIMITS stays as it is
+
+            if host in self.hosts:
+                bucket = self.hosts[host]
+                bucket.refill(time.monotonic())
+                bucket.rate, bucket.burst = rate, burst
+                bucket.tokens = min(bucket.tokens, burst)
+
+            self.cond.notify_all()
+
+    def acquire(self, host, lane = INTERACTIVE, timeout = None, cancel = None):
+        """Waits for a token for host, lower lanes first, then in arrival
+        order. Returns the seconds waited. Raises QueueTimeout, or
+        tasks.Cancelled once the cancel Event is set (no token is taken).
+        """
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+
+        with self.cond:
+            bucket = self._host(host)
+            entry = [lane, next(self.seq), False, start]
+            heapq.heappush(bucket.waiting, entry)
+
+            try:
+                while True:
+                    while bucket.waiting[0][2]:
+                        heapq.heappop(bucket.waiting)  # callers that gave up
+
+                    now = time.monotonic()
+                    bucket.refill(now)
+                    wait = bucket.ready_in(now)
+
+                    if bucket.waiting[0] is entry and wait <= 0:
+                        heapq.heappop(bucket.waiting)
+
+                        if bucket.rate:
+                            bucket.tokens -= 1
+
+                        self.cond.notify_all()  # the next in line re-checks
+                        return now - start
+
+                    if cancel is not None and cancel.is_set():
+                        raise tasks.Cancelled()
+
+                    if deadline is not None:
+                        if now >= deadline:
+                            raise QueueTimeout(f'no {LANES[lane]} slot for {host} after {timeout}s')
+
+                        wait = min(wait, deadline - now) if wait > 0 else deadline - now
+
+                    if cancel is not None:
+                        wait = min(wait, tasks.POLL) if wait > 0 else tasks.POLL
+
+                    self.cond.wait(wait if wait > 0 else None)
+
+            except BaseException:
+                entry[2] = True
+                self.cond.notify_all()
+                raise
+
+    def spare(self, host):
+        """Tokens host could hand out right now with nobody queued ahead,
+        0 while it is paused or has callers waiting, None if not limited.
+        Nothing is taken.
+        """
+        with self.cond:
+            bucket = self._host(host)
+            now = time.monotonic()
+
+            if any(not cancelled for _, _, cancelled, _ in bucket.waiting):
+                return 0
+            if bucket.paused_until > now:
+                return 0
+            if not bucket.rate:
+                return None
+
+            bucket.refill(now)
+
+            return bucket.tokens
+
+    def pause(self, host, seconds):
+        # no token for host is handed out for seconds, whatever the lane
+        with self.cond:
+            bucket = self._host(host)
+            bucket.paused_until = max(bucket.paused_until, time.monotonic() + seconds)
+            self.cond.notify_all()
+
+    def get(self, url, lane = INTERACTIVE, queue_timeout = None, **kwargs):
+        """requests.get through the scheduler, kwargs go to requests. A 429
+        or 503 pauses the host and the request is tried again (up to
+        retries times) once the pause is over.
+        """
+        host = urlsplit(url).hostname
+        task = tasks.current()  # its hedge clock stops while the request is queued
+
+        for attempt in range(self.retries + 1):
+            if task is not None:
+                task.queued()
+
+            waited = self.acquire(host, lane, queue_timeout, task and task.cancel)
+
+            if task is not None:
+                task.started()
+
+            self._record(lane, waited)
+            tracing.count('queue wait ms', round(waited * 1000))
+
+            response = self.session.get(url, **kwargs)
+
+            if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                return response
+
+            with self.stats_lock:
+                self.throttled += 1
+
+            self.pause(host, retry_after(response, attempt))
+
+        return response
+
+    def _record(self, lane, waited):
+        with self.stats_lock:
+            counts = self.counts[lane]
+            counts['requests'] += 1
+            counts['waited'] += waited
+            counts['max wait'] = max(counts['max wait'], waited)
+
+    def stats(self):
+        """Per lane: requests sent, requests queued now, how long the oldest
+        of them has waited and the mean/max wait per request, in seconds. Per host: tokens
+        left and seconds of pause left.
+        """
+        now = time.monotonic()
+        stats = {}
+
+        with self.cond:
+            queued = {lane: 0 for lane in LANES}
+            oldest = {lane: now for lane in LANES}
+
+            for bucket in self.hosts.values():
+                for lane, _, cancelled, start in bucket.waiting:
+                    if not cancelled:
+                        queued[lane] += 1
+                        oldest[lane] = min(oldest[lane], start)
+
+            hosts = {host: {'tokens': round(bucket.tokens, 2) if bucket.rate else None,
+                            'paused': round(max(bucket.paused_until - now, 0), 2)}
+                     for host, bucket in self.hosts.items()}
+
+        with self.stats_lock:
+            for lane, name in LANES.items():
+                counts = self.counts[lane]
+                stats[name] = {'requests': counts['requests'], 'queued': queued[lane],
+                               'waiting for': now - oldest[lane],
+                               'mean wait': counts['waited'] / counts['requests']
+                               if counts['requests'] else 0.0,
+                               'max wait': counts['max wait']}
+
+            stats['throttled'] = self.throttled
+
+        stats['hosts'] = hosts
+
+        return stats
+
+
+_scheduler = None
+_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _scheduler
+
+    if _scheduler is None:
+        with _lock:
+            if _scheduler is None:
+                _scheduler = Scheduler()
+
+    return _scheduler
+
+
+def set_scheduler(scheduler):
+    # e.g. one with other limits for a local stand-in, None for the default
+    global _scheduler
+
+    with _lock:
+        _scheduler = scheduler
+
+
+def get(url, lane = INTERACTIVE, queue_timeout = None, **kwargs):
+    return get_scheduler().get(url, lane, queue_timeout, **kwargs)
+
+
+def stats():
+    return get_scheduler().stats()
+
+
+if __name__ == "__main__":
+    response = get(sys.argv[1], timeout=20)
+    print(response.status_code, len(response.content), 'bytes')
+    print(stats())
@@ -7,30 +7,95 @@ this file specifically holds the GUI design of peakfinder.py
 Command line example:
 "python3 peak_ui.py"
 
+To see where startup time goes (time per import, time to first window):
+"python3 peak_ui.py profile"
+
 Created by Jack Ribarich
 August 4th, 2020
 
 """
 
 import sys
+import startup
+
+PROFILE = __name__ == '__main__' and sys.argv[1:2] == ['profile']
+
+if PROFILE:
+    startup.profile()
+
 import os
-import numpy as np
+import threading
+from collections import OrderedDict
 from PyQt5 import QtCore, QtGui
 from PyQt5.QtWidgets import *
 
 import matplotlib
-import matplotlib.pyplot as plt
 matplotlib.use('Qt5Agg')
-import peakfinder as pf
+import player_index
+import prefetch
+from tasks import Cancelled
 
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg, NavigationToolbar2QT as NavigationToolbar
 from matplotlib.figure import Figure
+from chart import Peak_Chart
+
+# peakfinder (pandas, bs4, requests) is only needed once a search runs,
+# it is imported in the background after the window is shown
+WARM_UP = ['pandas', 'bs4', 'requests', 'peakfinder']
 
 b_width = " 5px"  # border width
 b_type = " outset" # solid, dashed, inset, outset, groove, ridge
 b_color = " #c45002" # orange border color
 
-last_player = None
+max_pixmaps = 32  # scaled headshots kept by Player_Info_Widget
+
+# retrieve() stages in the order they run, for the progress bar
+STAGES = ['Finding player', 'Loading snapshot', 'Loading saved stats',
+          'Downloading player page', 'Reading stats', 'Finding peak']
+
+
+class Worker_Signals(QtCore.QObject):
+    progress = QtCore.pyqtSignal(int, str)  # request id, stage
+    finished = QtCore.pyqtSignal(int, object, object)  # request id, player, peak data
+    failed = QtCore.pyqtSignal(int, str)  # request id, error message
+
+
+class Retrieve_Worker(QtCore.QRunnable):
+    # runs pf.retrieve off the GUI thread, results come back through signals
+
+    def __init__(self, request_id, name, ext = None):
+        QtCore.QRunnable.__init__(self)
+        self.request_id = request_id
+        self.name = name
+        self.ext = ext  # picked from players who share the name, None for the newest
+        self.key = (player_index.normalize(name), ext)  # same player, same key
+        self.cancel = threading.Event()
+        self.signals = Worker_Signals()
+
+    def run(self):
+        import peakfinder as pf  # already loaded unless the warm up is still running
+
+        exts = player_index.lookup(self.key[0])
+        ext = self.ext or (exts[-1] if exts else None)
+
+        try:
+            # counts the prefetch hit rate and keeps prefetching out of the way
+            with prefetch.get_prefetcher().search(ext, self.cancel):
+                player, peak_data = pf.retrieve(self.name, self.report, self.cancel, self.ext)
+
+        except Cancelled:
+            return
+
+        except Exception as err:
+            self.signals.failed.emit(self.request_id, str(err))
+            return
+
+        if not self.cancel.is_set():
+            self.signals.finished.emit(self.request_id, player, peak_data)
+
+    def report(self, stage):
+        self.signals.progress.emit(self.request_id, stage)
+
 
 class Peak_Widget(QWidget):
     
@@ -64,15 +129,16 @@ class Peak_Widget(QWidget):
         layout.addWidget(self.APG_label, 3, 1, 1, 1)
         layout.addWidget(self.RPG_label, 4, 1, 1, 1)
 
-    def update(self, peak):
-        self.season_label.setText('<b>Season: </b>' + peak[0])
-        self.team_label.setText('<b>Team: </b>' + peak[1])
-        self.PER_label.setText('<b>PER: </b>' + str(peak[2]))
-        self.WS_label.setText('<b>Win Shares: </b>' + str(peak[3]))
-        self.FG_label.setText('<b>FG%: </b>' + str(round(float(peak[4])*100, 1)))
-        self.PPG_label.setText('<b>PPG: </b>' + str(peak[5]))
-        self.APG_label.setText('<b>APG: </b>' + str(peak[6]))
-        self.RPG_label.setText('<b>RPG: </b>' + str(peak[7]))
+    def update(self, season):
+        # season is the peak row, a pf.Peak_Season
+        self.season_label.setText('<b>Season: </b>' + season.season)
+        self.team_label.setText('<b>Team: </b>' + season.team)
+        self.PER_label.setText('<b>PER: </b>' + str(season.per))
+        self.WS_label.setText('<b>Win Shares: </b>' + str(season.ws))
+        self.FG_label.setText('<b>FG%: </b>' + str(round(season.fg_pct*100, 1)))
+        self.PPG_label.setText('<b>PPG: </b>' + str(season.pts))
+        self.APG_label.setText('<b>APG: </b>' + str(season.ast))
+        self.RPG_label.setText('<b>RPG: </b>' + str(season.trb))
 
 class Player_Info_Widget(QWidget):
     
@@ -94,8 +160,10 @@ class Player_Info_Widget(QWidget):
         self.hand_label = QLabel('<b>Shoots: </b>')
         self.college_label = QLabel('<b>College: </b>')
         self.pic_label = QLabel()
-        self.pixmap = QtGui.QPixmap('bball_logo.png').scaled(150, 150, QtCore.Qt.KeepAspectRatio,
-                                                              QtCore.Qt.SmoothTransformation)
+        self.logo = QtGui.QPixmap('bball_logo.png').scaled(150, 150, QtCore.Qt.KeepAspectRatio,
+                                                            QtCore.Qt.SmoothTransformation)
+        self.pixmap = self.logo
+        self.pixmaps = OrderedDict()  # ext -> headshot scaled to 150x150
         self.pic_label.setPixmap(self.pixmap)
         self.pic_label.setAlignment(QtCore.Qt.AlignCenter)
     
@@ -112,20 +180,33 @@ class Player_Info_Widget(QWidget):
         name = (p.name.split(' ')[0].capitalize() + 
                 ' ' + p.name.split(' ')[1].capitalize())  # capitalizes player name
 
-        self.nick_label.setText('<b>Nickname: </b>' + p.nicknames)
+        # bio fields are None when the bio ran late, see peakfinder.player_stats
+        def field(value):
+            return 'unavailable' if value is None else value
+
+        self.nick_label.setText('<b>Nickname: </b>' + field(p.nicknames))
         self.name_label.setText('<b>Name: </b>' + name)
-        self.pos_label.setText('<b>Position: </b>' + p.position)
-        self.height_label.setText('<b>Height: </b>' + p.height)
-        self.hand_label.setText('<b>Shoots: </b>' + p.hand)
-        self.college_label.setText('<b>College: </b>' + p.college)
+        self.pos_label.setText('<b>Position: </b>' + field(p.position))
+        self.height_label.setText('<b>Height: </b>' + field(p.height))
+        self.hand_label.setText('<b>Shoots: </b>' + field(p.hand))
+        self.college_label.setText('<b>College: </b>' + field(p.college))
         
-        if os.path.isfile(p.ext + '.jpg'):
-            self.pixmap = QtGui.QPixmap(p.ext + '.jpg').scaled(150, 150, QtCore.Qt.KeepAspectRatio,
-                                                              QtCore.Qt.SmoothTransformation)
+        if p.ext in self.pixmaps:
+            self.pixmaps.move_to_end(p.ext)  # already decoded and scaled
+            self.pixmap = self.pixmaps[p.ext]
+
+        elif p.pic is not None:
+            pixmap = QtGui.QPixmap()
+            pixmap.loadFromData(p.pic)
+            self.pixmap = pixmap.scaled(150, 150, QtCore.Qt.KeepAspectRatio,
+                                        QtCore.Qt.SmoothTransformation)
+            self.pixmaps[p.ext] = self.pixmap
+
+            if len(self.pixmaps) > max_pixmaps:
+                self.pixmaps.popitem(last=False)  # least recently viewed
 
         else:
-            self.pixmap = QtGui.QPixmap('bball_logo.png').scaled(150, 150, QtCore.Qt.KeepAspectRatio,
-                                                              QtCore.Qt.SmoothTransformation)
+            self.pixmap = self.logo
 
         self.pic_label.setPixmap(self.pixmap)
         self.pic_label.setAlignment(QtCore.Qt.AlignCenter)
@@ -135,44 +216,15 @@ class MplCanvas(FigureCanvasQTAgg):
     
     def __init__(self, parent=None, width=7, height=5, dpi=100):
         self.fig = Figure(figsize=(width, height), dpi=dpi)
-        self.fig.subplots_adjust(top = .93, hspace=.5)
-        self.peak_graph = self.fig.add_subplot(211)
-        self.peak_graph.set_title('Peak')
-        self.stats = self.fig.add_subplot(212)
-        self.stats.set_title('Stats Per Game')
         super(MplCanvas, self).__init__(self.fig)
 
-    def redraw(self, peak):
-        # seasons = peak[1], peak sum = peak[2], ppg/apg/rpg = peak[3,4,5]
-        x = peak[1]
-        idx = np.arange(len(peak[1]))  # turns season into a list of indices
-        peak_sum = peak[2]
-        max_idx = peak[2].index(max(peak[2])) 
-        ppg = peak[3]
-        apg = peak[4]
-        rpg = peak[5]
-
-        self.peak_graph.cla()  # clears frame
-        self.stats.cla()  # clears frame
-        self.fig.canvas.draw_idle()  # clears canvas
-        
-        self.peak_graph.set_title('Peak')
-        self.peak_graph.set_xticks(idx)
-        self.peak_graph.set_xticklabels(peak[1], rotation = 70)
-        self.peak_graph.plot(idx, peak_sum)  # peak sum
-        self.peak_graph.axvspan(max_idx, max_idx, color='C1')  # highlights peak
-
+        # persistent lines updated in place, see chart.py
+        self.chart = Peak_Chart(self.fig)
+        self.peak_graph = self.chart.peak_graph
+        self.stats = self.chart.stats
 
-        self.stats.set_title('Stats Per Game')
-        self.stats.set_xticks(idx)
-        self.stats.set_xticklabels(peak[1], rotation=70)
-        # self.stats.set_yticks(np.arange(0, max(ppg) + 1, 1))
-        self.stats.plot(idx, ppg, color = 'green')  # points
-        self.stats.plot(idx, apg, color = 'blue')   # assists
-        self.stats.plot(idx, rpg, color = 'red')  # rebounds
-        self.stats.axvspan(max_idx, max_idx, color='C1') # highlights peak
-
-        self.stats.legend(['Points', 'Assists', 'Rebounds'])
+    def redraw(self, peak):
+        self.chart.redraw(peak)
 
 
 class Search_Options_Widget(QWidget):
@@ -188,8 +240,10 @@ class Search_Options_Widget(QWidget):
         self.graph_widg = graph_widg
         self.name = None
         self.prev_name = None  # previous name
-        self.player = pf.Player()
+        self.player = None
         self.peak_data = None
+        self.worker = None  # lookup in flight
+        self.request_id = 0
 
         # Creates search button
         self.search_button = QPushButton('Find Peak')
@@ -203,6 +257,14 @@ class Search_Options_Widget(QWidget):
         self.search_box.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Fixed)
         self.search_box.returnPressed.connect(self.search_button.click)
 
+        # Live completions from the player index while typing
+        self.completer_model = QtCore.QStringListModel(self)
+        self.completer = QCompleter(self.completer_model, self)
+        self.completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.completer.setCaseSensitivity(QtCore.Qt.CaseInsensitive)
+        self.search_box.setCompleter(self.completer)
+        self.search_box.textEdited.connect(self.update_completions)
+
         self.reg_button = QRadioButton('Regular Season')
         self.reg_button.setChecked(True)
         self.reg_button.toggled.connect(self.button_clicked)
@@ -220,44 +282,117 @@ class Search_Options_Widget(QWidget):
         layout.addWidget(self.reg_button, 1, 1)
         layout.addWidget(self.playoff_button, 2, 1)
 
+        # Shows which stage a running lookup is at
+        self.progress_bar = QProgressBar(self)
+        self.progress_bar.setRange(0, len(STAGES))
+        self.progress_bar.setTextVisible(True)
+        self.progress_bar.hide()
+        layout.addWidget(self.progress_bar, 3, 0, 1, 2)
+
+
+    def update_completions(self, text):
+        names = player_index.complete(text, 8)
+
+        # narrowed down to a few players: fetch them before the search is made
+        candidates = names if len(names) <= prefetch.CANDIDATES else []
+        prefetch.get_prefetcher().suggest([ext for n in candidates for ext in player_index.lookup(n)])
+
+        if len(names) < 3 and len(text.strip()) > 2:  # likely a typo
+            names += [n for n in player_index.fuzzy(text, 5) if n not in names]
+
+        self.completer_model.setStringList([n.title() for n in names])
 
     def button_clicked(self):
-        global last_player
-        remove_flag = 0
+        text = self.search_box.text()
+
+        if text != '' and text != self.name:
+            self.start_search(text)
+
+        elif self.worker is None and self.peak_data is not None:
+            self.show_peak()  # radio button toggled, same player
+
+    def choose_player(self, name, exts):
+        # players who share a name (father and son), newest first
+        labels = [f'{name.title()} ({ext})' for ext in reversed(exts)]
+        label, ok = QInputDialog.getItem(self, 'Several players', 'Players named '
+                                         + name.title() + ':', labels, 0, False)
+
+        return exts[len(exts) - 1 - labels.index(label)] if ok else None
+
+    def start_search(self, name):
+        exts = player_index.lookup(player_index.normalize(name))
+        ext = None
+
+        if len(exts) > 1:
+            ext = self.choose_player(name, exts)
+
+            if ext is None:
+                return  # chooser closed
+
+        if self.worker is not None:
+            if self.worker.key == (player_index.normalize(name), ext):
+                return  # already looking this player up
+
+            self.worker.cancel.set()  # stale, its result will be ignored
+
+        self.request_id += 1
+        self.worker = Retrieve_Worker(self.request_id, name, ext)
+        self.worker.signals.progress.connect(self.search_progress)
+        self.worker.signals.finished.connect(self.search_finished)
+        self.worker.signals.failed.connect(self.search_failed)
 
-        if self.player.ext != None:
-            self.prev_name = self.player.ext
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFormat('Searching...')
+        self.progress_bar.show()
 
-        if (self.name != self.search_box.text() and
-            self.search_box.text() != '' and
-            self.name != None and 
-            self.prev_name != None):
+        QtCore.QThreadPool.globalInstance().start(self.worker)
 
-            remove_flag = 1
+    def search_progress(self, request_id, stage):
+        if request_id != self.request_id:
+            return
+
+        self.progress_bar.setValue(STAGES.index(stage) + 1 if stage in STAGES else 0)
+        self.progress_bar.setFormat(stage + '...')
+
+    def search_failed(self, request_id, message):
+        if request_id != self.request_id:
+            return
 
-        if (self.name == None or 
-            (self.name != self.search_box.text() and
-            self.search_box.text() != '')):
+        self.worker = None
+        self.progress_bar.hide()
+        QMessageBox.about(self, "Information", "Could not load player: " + message)
 
-            self.name = self.search_box.text()
-            self.player, self.peak_data = pf.retrieve(self.name)
+    def search_finished(self, request_id, player, peak_data):
+        if request_id != self.request_id:
+            return  # a newer search replaced this one
 
-        if self.player == None:
-            QMessageBox.about(self, "Information", "Invalid Player: check spelling")
-            self.player = pf.Player()
+        name = self.worker.name
+        self.worker = None
+        self.progress_bar.hide()
+
+        if player == None:
+            message = "Invalid Player: check spelling"
+            suggestions = player_index.fuzzy(name, 3)
+
+            if suggestions:
+                message += "\n\nDid you mean: " + ", ".join(n.title() for n in suggestions) + "?"
+
+            QMessageBox.about(self, "Information", message)
             return
 
-        if remove_flag == 1:
-            pf.remove_pic(self.prev_name)
+        self.name = name
+        self.player = player
+        self.peak_data = peak_data
 
-        last_player = self.player.ext
+        self.show_peak()
 
+    def show_peak(self):
         if self.playoff_button.isChecked() == False:
-            peak = self.peak_data[0]  # peak_data holds both regular season and playoffs
+            peak = self.peak_data.regular  # peak_data holds both regular season and playoffs
             self.search_box.clear()  # if player is spelled correctly
 
         else:
-            peak = self.peak_data[1]  # only executes if playoff box selected
+            peak = self.peak_data.playoffs  # only executes if playoff box selected
 
             if peak == None:
                 QMessageBox.about(self, "Information", self.name + " has never made the playoffs")
@@ -268,7 +403,7 @@ class Search_Options_Widget(QWidget):
 
         Player_Info_Widget.update(self.info_widg, self.player)
 
-        Peak_Widget.update(self.peak_widg, peak[0])  # peak[0] is peak list with essential info
+        Peak_Widget.update(self.peak_widg, peak.season)  # the peak season's row
 
         MplCanvas.redraw(self.graph_widg, peak)
 
@@ -279,8 +414,6 @@ class MainWindow(QMainWindow):
         super(MainWindow, self).__init__(*args, **kwargs)
 
         graph_widg = MplCanvas(self, width=7, height=5, dpi=100)
-        graph_widg.peak_graph.plot([0,0], [0,0])
-        graph_widg.stats.plot([0,0], [0,0])
 
         # the .addWidget has params of (widget, row, col, rowspan, colspan)
         layout = QGridLayout()
@@ -309,7 +442,24 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("Basketball Peak Finder")
         self.show()
 
+def warm_up_done():
+    # runs on the warm up thread: Sheets backend and the name search index
+    import peakfinder as pf
+
+    if pf.TABLE_BACKEND == 'sheets':
+        import sheets
+
+    player_index.warm_up()
+
+    prefetch.get_prefetcher().warm()  # players searched most, from earlier runs
+
+    if PROFILE:
+        startup.mark('search index ready')
+        startup.report()
+
+
 def main():
+    startup.mark('imports done')
     app = QApplication([])
 
     if sys.platform == 'darwin':
@@ -320,13 +470,14 @@ def main():
     path = os.path.join(os.path.dirname(sys.modules[__name__].__file__), 'bball_logo.png')
     app.setWindowIcon(QtGui.QIcon(path))
     w = MainWindow()
-    app.exec_()
+    startup.mark('window shown')
 
-    try:
-        os.remove(last_player + '.jpg')
+    # once the event loop is running, load what the first search needs
+    QtCore.QTimer.singleShot(0, lambda: startup.warm_up(WARM_UP, warm_up_done))
 
-    except:
-        pass  # do nothing if last player didnt have a pic
+    app.exec_()
+    prefetch.get_prefetcher().close()
+    QtCore.QThreadPool.globalInstance().waitForDone()
 
     sys.exit()
 
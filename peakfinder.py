@@ -10,22 +10,59 @@ August 4th, 2020
 
 """
 
-import sys
 import os
-import requests
-from threading import Thread
-import ast
-from bs4 import BeautifulSoup
+import sys
+import time
+from typing import NamedTuple, Optional
+
+import numpy as np
 import pandas as pd
-import sheets
+import player_index
+import player_bio
+import tables as stat_tables
+import cache
+import images
+import outbound
+import snapshot
+import tasks
+import tracing
+from tasks import Cancelled, TaskFailed
 from rich import print  # easily read stuff on the command line
 
+# where stats tables come from: 'html' parses the player page locally,
+# 'sheets' imports them through Google Sheets IMPORTHTML
+TABLE_BACKEND = 'html'
+
+USE_CACHE = True  # keep fetched pages and tables in cache.py's on-disk cache
+
+SITE = 'https://www.basketball-reference.com'  # point at a local stand-in to work offline
+
+# snapshot.py file every lookup is served from, nothing is downloaded while it is set
+SNAPSHOT = os.environ.get('PEAKFINDER_SNAPSHOT') or None
+
+FETCH_TIMEOUT = 20  # seconds to wait on basketball-reference
+
+BIO_FIELDS = player_bio.Bio._fields
+
+# seconds each step of a lookup may take before it fails with TaskTimeout,
+# the bio and headshot are optional and only go missing when they run late
+DEADLINES = {'page': FETCH_TIMEOUT + 5, 'bio': 5, 'tables': 120, 'headshot': 5}
+
+LOOKUP_DEADLINE = 60  # seconds a whole lookup may take, no step gets more than is left
+
+# seconds after which a second attempt of a step is started, the first to
+# finish wins. tables are only hedged with the sheets backend
+HEDGE_AFTER = {'page': 4, 'tables': 20}
+
 
 class Player():
+    __slots__ = ('name', 'ext', 'nicknames', 'position', 'height', 'hand', 'college',
+                 'reg_season', 'playoff', 'adv_data', 'pic_url', 'pic', 'missing')
+
     def __init__(self, name = None, ext = None, 
         nicknames = None, position = None, height = None, 
         hand = None, college = None, reg_season = None, 
-        playoff = None, adv_data = None):
+        playoff = None, adv_data = None, pic_url = None, pic = None):
         self.name = name
         self.ext = ext  
         self.nicknames = nicknames  # list
@@ -36,6 +73,9 @@ class Player():
         self.reg_season = reg_season  # panda DataFrame
         self.playoff = playoff  # panda DataFrame
         self.adv_data = adv_data # panda Dataframe of Advanced Stats
+        self.pic_url = pic_url  # headshot link, None if player has no pic
+        self.pic = pic  # headshot jpeg bytes
+        self.missing = {}  # optional part ('bio', 'headshot') -> why it is missing
 
     def __repr__(self):
         return(f"""Nicknames: {self.nicknames}\nPosition: {self.position}
@@ -44,6 +84,59 @@ Regular Season Stats:\n{self.reg_season}\n
 Playoff Stats:\n{self.playoff}\n""")
 
 
+class Peak_Season(NamedTuple):
+    # the peak season's row
+    season: str
+    team: str
+    per: float
+    ws: float
+    fg_pct: float
+    pts: float
+    ast: float
+    trb: float
+
+
+class Peak():
+    """A player's peak over one kind of season (regular or playoffs):
+    the peak row plus the per season series, stored as one float64 block
+    with a row each for the peak score, ppg, apg and rpg.
+    """
+    __slots__ = ('season', 'index', 'seasons', 'values')
+
+    def __init__(self, season, index, seasons, values):
+        self.season = season  # Peak_Season
+        self.index = index  # position of the peak season in seasons
+        self.seasons = seasons  # season labels ('2009-10'), numpy str array
+        self.values = values  # float64, shape (4, seasons)
+
+    @property
+    def sums(self):
+        return self.values[0]  # peak score of every season
+
+    @property
+    def ppg(self):
+        return self.values[1]
+
+    @property
+    def apg(self):
+        return self.values[2]
+
+    @property
+    def rpg(self):
+        return self.values[3]
+
+    def __len__(self):
+        return len(self.seasons)
+
+    def __repr__(self):
+        return f'Peak({self.season!r}, {len(self)} seasons)'
+
+
+class Peak_Data(NamedTuple):
+    regular: Peak
+    playoffs: Optional[Peak]  # None if the player never made the playoffs
+
+
 def usage():
     print("""
         To run this application:\n
@@ -53,81 +146,40 @@ def usage():
 
     exit()
 
-def get_pic(soup):
-    link = soup.select("img[src^=http]")
-    lnk = link[1]["src"]
-    
-    if '.svg' in lnk:
-        return  # player has no pic
-
-    with open(os.path.basename(lnk),"wb") as f:
-        f.write(requests.get(lnk).content)
-
-
-def remove_pic(ext):
-    try: 
-        os.remove(f'{ext}.jpg')
-
-    except:
-        return  # do nothing if player picture doesn't exist
-
-
 def peak_calculation(df):
+    # df is typed (schema.coerce), PER and WS are already floats
     scalar = 2.5
-    flt = lambda x: x.astype(float)  # changes data into floats
 
-    PER = scalar*flt(df['PER'])/flt(df['PER']).max()
-    WS = scalar*flt(df['WS'])/flt(df['WS']).max()
+    PER = scalar*df['PER']/df['PER'].max()
+    WS = scalar*df['WS']/df['WS'].max()
 
     calc = PER + WS
 
     return calc
 
 
-def determine_peak_season(p): 
-    peak_data = [None, None]
-    peak_list = None
-    seasons = None
-    seas_sum = None
-    ppg = None 
-    apg = None
-    rpg  = None
-    reg = p.reg_season 
-    plof = p.playoff
-
-    reg['sum'] = peak_calculation(reg)
-    idx = reg['sum'].idxmax()  # max season index
+def find_peak(df):
+    # Peak of one stats table, df['sum'] is filled in with every season's score
+    df['sum'] = peak_calculation(df)
+    idx = df['sum'].idxmax()  # max season index
+    row = df.loc[idx]
 
-    peak_list = [reg.loc[idx, 'Season'], reg.loc[idx, 'Tm'], reg.loc[idx, 'PER'], 
-                reg.loc[idx, 'WS'], reg.loc[idx, 'FG%'], reg.loc[idx, 'PTS'], 
-                reg.loc[idx, 'AST'], reg.loc[idx, 'TRB']]
-    
-    seasons = reg['Season'].tolist()
-    seas_sum = reg['sum'].tolist()
+    season = Peak_Season(str(row['Season']), str(row['Tm']),
+                         *(float(row[col]) for col in ('PER', 'WS', 'FG%', 'PTS', 'AST', 'TRB')))
 
-    ppg = [float(i) for i in reg['PTS'].tolist()]
-    apg = [float(i) for i in reg['AST'].tolist()]
-    rpg = [float(i) for i in reg['TRB'].tolist()]
-    
-    peak_data[0] = [peak_list, seasons, seas_sum, ppg, apg, rpg]
+    values = df[['sum', 'PTS', 'AST', 'TRB']].to_numpy(dtype=np.float64).T
 
-    if not plof.empty:  # playoffs
-        plof['sum'] = peak_calculation(plof)
-        idx = plof['sum'].idxmax()
+    return Peak(season, df.index.get_loc(idx), df['Season'].to_numpy(dtype=str), values)
 
-        peak_list = [plof.loc[idx, 'Season'], plof.loc[idx, 'Tm'], plof.loc[idx, 'PER'], 
-                    plof.loc[idx, 'WS'], plof.loc[idx, 'FG%'], plof.loc[idx, 'PTS'], 
-                    plof.loc[idx, 'AST'], plof.loc[idx, 'TRB']]
 
-        seasons = plof['Season'].tolist()
-        seas_sum = plof['sum'].tolist()
-        ppg = [float(i) for i in plof['PTS'].tolist()]
-        apg = [float(i) for i in plof['AST'].tolist()]
-        rpg = [float(i) for i in plof['TRB'].tolist()]
+def determine_peak_season(p):
+    regular = find_peak(p.reg_season)
+    playoffs = None
 
-        peak_data[1] = [peak_list, seasons, seas_sum, ppg, apg, rpg]
+    if not p.playoff.empty:  # playoffs
+        playoffs = find_peak(p.playoff)
 
-    return peak_data
+    return Peak_Data(regular, playoffs)
 
 
 def get_player(p, name):
@@ -135,187 +187,297 @@ def get_player(p, name):
 
     if name == 'debug':
         player_input = input(question)
-        p.name = player_input.strip().lower()
+        p.name = player_index.normalize(player_input)
 
     else:
-        p.name = name.strip().lower()
+        p.name = player_index.normalize(name)
     
-    with open('player_database.txt') as f:
-        player_dict = ast.literal_eval(f.read())
-    
-    try:
-        p.ext = player_dict[p.name]  # search player.py dict
+    exts = player_index.lookup(p.name)  # every player with this name
+
+    if not exts:
+        return
 
-    except: 
-            return
+    p.ext = exts[-1]  # highest numbered ext, the latest of the name to debut
 
 
 def player_info(soup, p):
-    position_dict = {'Point Guard': 'PG', 'Shooting Guard': 'SG', 
-                    'Small Forward': 'SF', 'Power Forward': 'PF',
-                    'Center': 'C'}
-    nicknames = 'None'
-    nick_flag = 0
-    pos_flag = 0
-    coll_flag = 0
-    college = 'None'  # implement later where it says hs or if foreign
-    
-    height_item = soup.find('span', {'itemprop': 'height'})
-    height = height_item.text.strip()
+    # bio fields (and headshot link) from an already parsed page
+    set_bio(p, player_bio.bio_from_info(soup.find('div', {'id': 'info'}))._asdict())
 
-    info = soup.find('div', {'id' : 'info'})
 
-    for x in info.find_all('p'):
-        word = x.text.strip()
+def player_url(ext):
+    url = SITE + '/players/'
+    end = '.html'
 
-        if nick_flag == 0 and len(word) != 0:  # nickname
-            if ('(' in word and 
-                'born' not in word and
-                 'formerly' not in word):  # the b for born for players who've legally changed names
-                nicknames = word[1:-1]  # takes off parenthesis
-                nicknames = ','.join(list(nicknames.split(','))[:1]) # take first 2 if multiple
-                nick_flag = 1
+    return url + ext[0] + '/' + ext + end
 
-        for i in x.find_all('strong'):
-            if 'Position' in i.text:  # position and shooting
-                pos_flag = 1
-                nick_flag = 1  # no nickname
 
-            if 'College' in i.text:  # College
-                coll_flag = 1
+def fetch_page(player_url, lane = outbound.INTERACTIVE):
+    # background callers queue behind searches for as long as it takes
+    queue_timeout = FETCH_TIMEOUT if lane == outbound.INTERACTIVE else None
+    response = outbound.get(player_url, lane, queue_timeout, timeout=FETCH_TIMEOUT)
+    response.raise_for_status()  # a missing page fails the 'page' step, not the parsing
+    tracing.count('bytes downloaded', len(response.content))
 
-        if pos_flag == 1: 
-            position = word.replace('\n', '')
+    return response.text
 
-            sep1 = ':'
-            first = position.split(sep1, 1)[1]
 
-            sep2 = '▪'
-            position = first.split(sep2, 1)[0].strip()
+def read_bio(html):
+    with tracing.span('parse bio'):
+        return player_bio.parse_bio(html)
 
-            # the shooting hand is in the second part of the line
-            hand = first.split(sep2, 1)[1].split(sep1, 1)[1].strip()
 
-            pos_flag = 0
+def player_data(p, player_url, html = None):
+    # bio and headshot link, the headshot itself is loaded by headshot()
+    if html is None:
+        html = fetch_page(player_url)
 
-        if coll_flag == 1:
-            college = word.replace('\n', '')
+    set_bio(p, read_bio(html)._asdict())
 
-            sep = ':'
-            college = college.split(sep, 1)[1].strip()
 
-            coll_flag = 0
+def sheets_tables(player_url, html = None):
+    import sheets  # google api client, only loaded when the Sheets backend is used
 
-    cleaned_pos = [val for key,val in position_dict.items() if key in position]
-    cleaned_pos = '/'.join(cleaned_pos)
+    tables = {}
 
-    p.nicknames = nicknames
-    p.position = cleaned_pos
-    p.height = height
-    p.hand = hand
-    p.college = college
+    if html is not None:
+        # the page already says if there are playoff tables, so one
+        # batched write and one batched read cover every table
+        if 'playoffs_per_game' in html:
+            table_nums = sheets.MADE_PLAYOFFS
+        else:
+            table_nums = sheets.NO_PLAYOFFS
 
+        dfs = sheets.getDFs(player_url, {sheets.RANGES[name]: num
+                                         for name, num in table_nums.items()})
 
-def player_data(p, player_url):
-    response = requests.get(player_url)
-    soup = BeautifulSoup(response.text, 'html.parser')
+        return {name: dfs[sheets.RANGES[name]] for name in table_nums}
 
-    # Create threads
-    t3 = Thread(target=get_pic, args=(soup, ))
-    t4 = Thread(target=player_info, args=(soup, p))
-    
-    t3.start()
-    t4.start()
+    # one slot (set of tabs) for the whole lookup, the tables go to different tabs
+    with sheets.getPool().lease() as slot:
+        def get(name, table_nums):
+            return sheets.getDF(player_url, None, 0, table_nums[name], sheets.RANGES[name], slot)
 
-    # Block until both Threads are done
-    t3.join()
-    t4.join()
+        tables['Playoffs Advanced'] = get('Playoffs Advanced', sheets.MADE_PLAYOFFS)
 
-def player_tables(p, player_url):
-    made_playoffs = {'Regular': 1, 'Playoffs': 2, 'Regular Advanced': 5, 'Playoffs Advanced': 6}
-    no_playoffs = {'Regular': 1, 'Regular Advanced': 3}
-    drop_list = ['Age', 'Tm' ,'Lg', 'Pos', 'G', 'MP']
-    REG_RANGE = 'Regular!A1:AD'
-    PLOFADV_RANGE = 'Playoffs_Adv!A1:AC'
-    REGADV_RANGE = 'RegAdv!A1:AC'
-    PLAYOFF_RANGE = 'Playoffs!A1:AD'
+        if tables['Playoffs Advanced'] is not None and not tables['Playoffs Advanced'].empty:
+            names = ['Regular', 'Regular Advanced', 'Playoffs']
+            table_nums = sheets.MADE_PLAYOFFS
+
+        else:
+            names = ['Regular', 'Regular Advanced']
+            table_nums = sheets.NO_PLAYOFFS
+
+        tables.update(tasks.run({name: (get, (name, table_nums), DEADLINES['tables'])
+                                 for name in names}))
 
-    adv_playoff_df = sheets.getDF(player_url, None, 0, made_playoffs['Playoffs Advanced'], PLOFADV_RANGE)
+    return tables
+
+
+def merge_tables(p, tables):
+    # tables are typed by schema.coerce, so only season rows are left
+    drop_list = ['Age', 'Tm' ,'Lg', 'Pos', 'G', 'MP']
+    keys = ['Season', 'Year']
 
-    if not adv_playoff_df.empty:
-        # Create threads
-        t5 = Thread(target=sheets.getDF, args=(player_url, p, 1, made_playoffs['Regular'], REG_RANGE))
-        t6 = Thread(target=sheets.getDF, args=(player_url, p, 2, made_playoffs['Regular Advanced'], REGADV_RANGE))
-        t7 = Thread(target=sheets.getDF, args=(player_url, p, 3, made_playoffs['Playoffs'], PLAYOFF_RANGE))
+    for name in ('Regular', 'Regular Advanced'):
+        if tables.get(name) is None or tables[name].empty:
+            raise ValueError(f'no {name.lower()} stats table for {p.ext}')
 
-        t5.start()
-        t6.start()
-        t7.start()
+    p.reg_season = tables['Regular']
+    p.adv_data = tables['Regular Advanced']
+    adv_playoff_df = tables.get('Playoffs Advanced')
 
-        # Block until all threads are done
-        t5.join()
-        t6.join()
-        t7.join()
+    if adv_playoff_df is not None and not adv_playoff_df.empty:
+        p.playoff = tables['Playoffs']
 
         # Drop unneccesary columns to make JOIN smoother
-        p.reg_season.drop(drop_list, axis=1, inplace=True)
-        p.playoff.drop(drop_list, axis=1, inplace=True)
+        p.reg_season = p.reg_season.drop(drop_list, axis=1, errors='ignore')
+        p.playoff = p.playoff.drop(drop_list, axis=1, errors='ignore')
 
         # merges advanced stats into stats
-        p.reg_season = pd.merge(p.reg_season, p.adv_data, how='outer', on='Season')
-        p.playoff = pd.merge(p.playoff, adv_playoff_df, how='outer', on='Season')
-        
-        # Drop rows that don't match 'YEAR-YEAR' format such as 'Career'
-        p.reg_season = p.reg_season[p.reg_season['Season'].str.contains('-', na=False)]
-        p.playoff = p.playoff[p.playoff['Season'].str.contains('-', na=False)]
+        p.reg_season = pd.merge(p.reg_season, p.adv_data, how='outer', on=keys)
+        p.playoff = pd.merge(p.playoff, adv_playoff_df, how='outer', on=keys)
     
     else:
-        # Create threads
-        t5 = Thread(target=sheets.getDF, args=(player_url, p, 1, no_playoffs['Regular'], REG_RANGE))
-        t6 = Thread(target=sheets.getDF, args=(player_url, p, 2, no_playoffs['Regular Advanced'], REGADV_RANGE))
-        
-        t5.start()
-        t6.start()
-
-        # Block until both threads are done
-        t5.join()
-        t6.join()
-
-        p.reg_season.drop(drop_list, axis=1, inplace=True)
+        p.reg_season = p.reg_season.drop(drop_list, axis=1, errors='ignore')
         p.playoff = pd.DataFrame({'P' : []})  # empty dataframe
 
-        # merges advanced stats into stat
-        p.reg_season = pd.merge(p.reg_season, p.adv_data, how='outer', on='Season')
+        # merges advanced stats into stat, seasons missing from either table are dropped
+        p.reg_season = pd.merge(p.reg_season, p.adv_data, how='inner', on=keys)
 
-        # Drop rows that don't match 'YEAR-YEAR' format such as 'Career'
-        p.reg_season = p.reg_season[p.reg_season['Season'].str.contains('-')].dropna()
 
+def player_tables(p, player_url, html = None):
+    # merged tables on a new Player, so a hedged second try never writes over p
+    if TABLE_BACKEND == 'sheets' or html is None:
+        with tracing.span('sheets tables'):
+            tables = sheets_tables(player_url, html)
 
-def player_stats(p):
-    url = 'https://www.basketball-reference.com/players/'
-    end = '.html'
+    else:
+        with tracing.span('parse tables'):
+            tables = stat_tables.parse_tables(html)
 
-    thread_list = []
+    merged = Player(name=p.name, ext=p.ext)
 
-    player_url = url + p.ext[0] + '/' + p.ext + end
+    with tracing.span('merge tables'):
+        merge_tables(merged, tables)
 
-    # Create threads
-    t1 = Thread(target=player_data, args=(p, player_url))
-    t2 = Thread(target=player_tables, args=(p, player_url))
-    
-    t1.start()
-    t2.start()
+    return merged
+
+
+def get_bio(p):
+    return {field: getattr(p, field) for field in BIO_FIELDS}
+
+
+def set_bio(p, bio):
+    for field in BIO_FIELDS:
+        setattr(p, field, bio.get(field))
+
+
+def stage(progress, cancel, text):
+    # reports the next stage of a retrieve, or stops it if it was cancelled
+    if cancel is not None and cancel.is_set():
+        raise Cancelled()
+
+    if progress is not None:
+        progress(text)
+
+
+def from_snapshot(p):
+    # tables and bio from the SNAPSHOT file, TaskFailed if p is not in it
+    with tracing.span('snapshot lookup'):
+        found = snapshot.get_snapshot(SNAPSHOT).get(p.ext)
+
+    if found is None:
+        raise TaskFailed('snapshot', KeyError(f'{p.ext} is not in {SNAPSHOT}'))
+
+    p.reg_season, p.playoff, bio = found
+    set_bio(p, bio)
+
+
+def deadline(step, start):
+    # the step's own deadline, cut to what is left of the lookup's
+    return max(min(DEADLINES[step], LOOKUP_DEADLINE - (time.monotonic() - start)), 0)
+
+
+def headshot(p, start):
+    # starts loading the headshot on the shared pool, see wait_headshot
+    if p.pic_url is None:
+        return None
+
+    return tasks.Batch({'headshot': (images.get, (p.ext, p.pic_url), deadline('headshot', start))},
+                       optional=('headshot', ))
+
+
+def wait_headshot(p, pics, cancel):
+    if pics is None:
+        return
+
+    p.pic = pics.wait(cancel).get('headshot')
+
+    if 'headshot' in pics.missing:
+        p.missing['headshot'] = str(pics.missing['headshot'])
+
+
+def player_stats(p, progress = None, cancel = None, pic = True):
+    """Runs every step on the shared tasks pool, within LOOKUP_DEADLINE.
+    A step the peak needs (page, tables) that fails or runs past its
+    deadline raises TaskFailed naming the step. The bio and headshot are
+    optional: when they fail or run late the peak is still returned and
+    p.missing says what is missing and why. pic=False skips the headshot.
+    With SNAPSHOT set everything comes from the snapshot, and the headshot
+    only from images.py's cache.
+    """
+    start = time.monotonic()
+    url = player_url(p.ext)
 
-    # Block until both threads are done
-    t1.join()
-    t2.join()
+    if SNAPSHOT is not None:
+        stage(progress, cancel, 'Loading snapshot')
+        from_snapshot(p)
 
-    peak_data = determine_peak_season(p)
+        if pic and p.pic_url is not None:
+            p.pic = images.cached(p.ext)
+
+            if p.pic is None:
+                p.missing['headshot'] = 'not in the headshot cache, working offline'
+
+        with tracing.span('determine peak'):
+            return determine_peak_season(p)
+
+    if USE_CACHE:
+        with tracing.span('cache lookup'):
+            cached = cache.get_cache().get(p.ext)
+
+        if cached is not None:
+            stage(progress, cancel, 'Loading saved stats')
+            p.reg_season, p.playoff, bio = cached
+            set_bio(p, bio)
+
+            # headshot downloads while the peak is found
+            pics = headshot(p, start) if pic else None
+
+            with tracing.span('determine peak'):
+                peak_data = determine_peak_season(p)
+
+            wait_headshot(p, pics, cancel)
+
+            return peak_data
+
+    # fetched once, both the bio and the tables come from this page
+    stage(progress, cancel, 'Downloading player page')
+    html = tasks.run({'page': (fetch_page, (url, ), deadline('page', start))}, cancel,
+                     {'page': HEDGE_AFTER['page']})['page']
+
+    stage(progress, cancel, 'Reading stats')
+    hedge = {'tables': HEDGE_AFTER['tables']} if TABLE_BACKEND == 'sheets' else None
+    tables = tasks.Batch({'tables': (player_tables, (p, url, html), deadline('tables', start))},
+                         hedge)
+    pics = None
+
+    try:
+        # the bio is quick, the headshot downloads while the tables are read
+        bio = tasks.Batch({'bio': (read_bio, (html, ), deadline('bio', start))}, optional=('bio', ))
+        results = bio.wait(cancel)
+
+        if 'bio' in results:
+            set_bio(p, results['bio']._asdict())
+        else:
+            p.missing['bio'] = str(bio.missing['bio'])
+
+        pics = headshot(p, start) if pic else None
+        merged = tables.wait(cancel)['tables']
+
+    except BaseException:
+        tables.cancel()
+
+        if pics is not None:
+            pics.cancel()
+
+        raise
+
+    p.reg_season, p.playoff, p.adv_data = merged.reg_season, merged.playoff, merged.adv_data
+
+    if USE_CACHE and 'bio' not in p.missing:  # kept only once it is complete
+        with tracing.span('cache store'):
+            cache.get_cache().put(p.ext, html, p.reg_season, p.playoff, get_bio(p))
+
+    stage(progress, cancel, 'Finding peak')
+
+    with tracing.span('determine peak'):
+        peak_data = determine_peak_season(p)
+
+    wait_headshot(p, pics, cancel)
 
     return peak_data
  
 
-def retrieve(name):
+def retrieve(name, progress = None, cancel = None, ext = None):
+    """progress is called with the name of each stage as it starts.
+    Setting the cancel Event stops the lookup at the next stage by
+    raising Cancelled. A failed or timed out step raises TaskFailed.
+    ext picks one of the players who share name (see get_player).
+    With tracing on (see tracing.py) every stage is timed, debug mode
+    turns it on and prints the timings.
+    """
     debug = 0
     if len(sys.argv) > 1:
         if sys.argv[1] == 'help':
@@ -323,16 +485,27 @@ def retrieve(name):
         elif sys.argv[1] == 'debug':
             debug = 1
 
+            if not tracing.ENABLED:
+                tracing.enable(tracing.EXPORT_PATH)
+
     player = Player()  #  creates player class
 
-    get_player(player, name)  # retrieves player url extension
+    with tracing.trace('retrieve', player=name):
+        stage(progress, cancel, 'Finding player')
+
+        with tracing.span('find player'):
+            get_player(player, name)  # retrieves player url extension
+
+        if ext is not None and ext in player_index.lookup(player.name):
+            player.ext = ext
 
-    if player.ext == None:
-        return None, None
+        if player.ext == None:
+            return None, None
 
-    peak_data = player_stats(player)  # retrieves, stores, and formats data
+        peak_data = player_stats(player, progress, cancel)  # retrieves, stores, and formats data
 
     if debug == 1:
         print(repr(player))
+        print(tracing.summary(tracing.last))
 
     return player, peak_data
\ No newline at end of file
@@ -0,0 +1,124 @@
+"""
+Player bio parser:
+Reads the nicknames, position, height, shooting hand, college and
+headshot link from a basketball-reference player page
+
+Only the page's info block (div#info, which also holds the headshot) is
+cut out and parsed, the stats tables and the rest of the page are never
+built. Uses the same parser backend as tables.py.
+
+Command line example (prints the bio of a saved page):
+"python3 player_bio.py page.html"
+
+"""
+
+import re
+import sys
+from typing import NamedTuple, Optional
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from tables import PARSER
+
+POSITIONS = {'Point Guard': 'PG', 'Shooting Guard': 'SG', 'Small Forward': 'SF',
+             'Power Forward': 'PF', 'Center': 'C'}
+
+_DIV = re.compile(r'<div\b|</div\s*>')
+
+
+class Bio(NamedTuple):
+    nicknames: str  # first nickname, 'None' if there is none
+    position: str  # e.g. 'SF/PF'
+    height: str  # e.g. '6-8'
+    hand: str  # shooting hand
+    college: str  # 'None' if the player did not go to college
+    pic_url: Optional[str]  # headshot link, None if the player has no picture
+
+
+def info_source(html):
+    # the <div id="info"> block cut out of the page text, or None
+    pos = html.find('id="info"')
+    if pos == -1:
+        return None
+
+    start = html.rfind('<div', 0, pos)
+    depth = 0
+
+    for match in _DIV.finditer(html, start):
+        depth += 1 if match.group().startswith('<div') else -1
+
+        if depth == 0:
+            return html[start:match.end()]
+
+    return None
+
+
+def info_block(html):
+    source = info_source(html)
+
+    if source is None:
+        # unusual markup, let the parser find the block in the whole page
+        soup = BeautifulSoup(html, PARSER, parse_only=SoupStrainer('div', id='info'))
+    else:
+        soup = BeautifulSoup(source, PARSER)
+
+    return soup.find('div', id='info')
+
+
+def headshot_link(info):
+    img = info.select_one('img[src^=http]')
+
+    if img is None or '.svg' in img['src']:
+        return None  # player has no pic
+
+    return img['src']
+
+
+def bio_from_info(info):
+    """Bio from the parsed div#info of a player page"""
+    nicknames = 'None'
+    position = ''
+    hand = 'None'
+    college = 'None'  # implement later where it says hs or if foreign
+    nick_found = False
+
+    height = info.find('span', {'itemprop': 'height'}).text.strip()
+
+    for x in info.find_all('p'):
+        word = x.text.strip()
+        labels = [i.text for i in x.find_all('strong')]
+
+        if not nick_found and word:  # nickname comes before the position
+            if ('(' in word and
+                'born' not in word and
+                'formerly' not in word):  # the b for born for players who've legally changed names
+                nicknames = word[1:-1]  # takes off parenthesis
+                nicknames = nicknames.split(',')[0]  # first one if multiple
+                nick_found = True
+
+        if any('Position' in label for label in labels):  # position and shooting
+            nick_found = True  # no nickname
+            first = word.replace('\n', '').split(':', 1)[1]
+
+            position = first.split('▪', 1)[0].strip()
+
+            # the shooting hand is in the second part of the line
+            hand = first.split('▪', 1)[1].split(':', 1)[1].strip()
+
+        if any('College' in label for label in labels):
+            college = word.replace('\n', '').split(':', 1)[1].strip()
+
+    position = '/'.join(val for key, val in POSITIONS.items() if key in position)
+
+    return Bio(nicknames, position, height, hand, college, headshot_link(info))
+
+
+def parse_bio(html):
+    """Bio from the text of a player page"""
+    return bio_from_info(info_block(html))
+
+
+if __name__ == "__main__":
+    with open(sys.argv[1], encoding='utf-8') as f:
+        for field, value in parse_bio(f.read())._asdict().items():
+            print(f'{field}: {value}')
@@ -0,0 +1,240 @@
+"""
+Player Index:
+Load-once lookup table of every NBA player's url extension
+
+The index lives in player_index.tsv as sorted "name<TAB>ext" lines.
+It is read once per process into two parallel lists, so an exact
+lookup is a binary search, and players who share a name (father/son)
+are kept as neighbouring entries instead of overwriting each other.
+
+For misspelled or partial names the index also answers prefix
+completions (on any word of the name) and trigram fuzzy matches.
+
+The shipped index was built from player_database.txt, whose name ->
+ext dict holds one player per name, so it has no same-name players
+yet. A crawl (python3 players.py) writes the index straight from the
+letter pages and keeps all of them; rebuilding from the dict loses
+them again:
+"python3 player_index.py"
+
+"""
+
+import os
+import ast
+import threading
+from collections import Counter
+from bisect import bisect_left, bisect_right
+from unidecode import unidecode  # same normalization as players.py
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+DATABASE_PATH = os.path.join(DIR, 'player_database.txt')
+INDEX_PATH = os.path.join(DIR, 'player_index.tsv')
+
+_index = None
+_lock = threading.Lock()
+
+
+def normalize(name):
+    return unidecode(name.strip().lower())
+
+
+def trigrams(word):
+    word = '  ' + word + ' '  # pad so short names and word starts count
+
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+class PlayerIndex():
+    def __init__(self, names = None, exts = None):
+        self.names = names or []  # sorted lowercase names
+        self.exts = exts or []  # url extension at the same position
+        self._words = None  # sorted (name from word i onwards, position)
+        self._grams = None  # trigram -> positions of distinct names
+
+    def __len__(self):
+        return len(self.names)
+
+    def lookup(self, name):
+        # every ext stored under name, oldest player first
+        lo = bisect_left(self.names, name)
+        hi = bisect_right(self.names, name, lo)
+
+        return self.exts[lo:hi]
+
+    def pairs(self):
+        return zip(self.names, self.exts)
+
+    def _build_search(self):
+        # built on first use so plain lookups never pay for it
+        words = []
+        grams = {}
+
+        for i, name in enumerate(self.names):
+            if i and name == self.names[i - 1]:
+                continue  # same name, different player
+
+            start = 0
+            while start != -1:
+                words.append((name[start:], i))
+                start = name.find(' ', start)
+                start = start + 1 if start != -1 else -1
+
+            for g in trigrams(name):
+                grams.setdefault(g, []).append(i)
+
+        words.sort()
+        self._grams = grams
+        self._words = words
+
+    def complete(self, prefix, limit = 10):
+        # names with a word starting with prefix, full name matches first
+        if self._words is None:
+            self._build_search()
+
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+
+        found = []
+        lo = bisect_left(self.names, prefix)
+
+        for name in self.names[lo:]:
+            if len(found) == limit or not name.startswith(prefix):
+                break
+
+            if not found or found[-1] != name:
+                found.append(name)
+
+        lo = bisect_left(self._words, (prefix, -1))
+
+        for word, i in self._words[lo:]:
+            if len(found) == limit or not word.startswith(prefix):
+                break
+
+            if self.names[i] not in found:
+                found.append(self.names[i])
+
+        return found
+
+    def fuzzy(self, query, limit = 5, cutoff = 0.3):
+        # names ranked by trigram similarity (Dice coefficient)
+        if self._grams is None:
+            self._build_search()
+
+        query = normalize(query)
+        if not query:
+            return []
+
+        query_grams = trigrams(query)
+        counts = Counter()
+
+        for g in query_grams:
+            counts.update(self._grams.get(g, ()))
+
+        size = len(query_grams)
+        scored = []
+
+        for i, shared in counts.items():
+            score = 2 * shared / (size + len(self.names[i]) + 1)
+            if score >= cutoff:
+                scored.append((-score, self.names[i]))
+
+        scored.sort()
+
+        return [name for _, name in scored[:limit]]
+
+
+def from_pairs(pairs):
+    pairs = sorted(set(pairs))
+
+    return PlayerIndex([n for n, _ in pairs], [e for _, e in pairs])
+
+
+def read_database(path = DATABASE_PATH):
+    # the old dict format, only parsed when (re)building the index
+    with open(path) as f:
+        player_dict = ast.literal_eval(f.read())
+
+    return list(player_dict.items())
+
+
+def write_index(index, path = INDEX_PATH):
+    tmp = path + '.tmp'
+
+    with open(tmp, 'w', encoding='utf-8') as f:
+        for name, ext in index.pairs():
+            f.write(name + '\t' + ext + '\n')
+
+    os.replace(tmp, path)  # never leave a half written index behind
+
+
+def read_index(path = INDEX_PATH):
+    names = []
+    exts = []
+
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            name, ext = line.rstrip('\n').split('\t')
+            names.append(name)
+            exts.append(ext)
+
+    return PlayerIndex(names, exts)
+
+
+def build(db_path = DATABASE_PATH, index_path = INDEX_PATH):
+    index = from_pairs(read_database(db_path))
+    write_index(index, index_path)
+
+    return index
+
+
+def get_index():
+    global _index
+
+    if _index is None:
+        with _lock:
+            if _index is None:
+                if os.path.exists(INDEX_PATH):
+                    _index = read_index()
+                else:
+                    _index = from_pairs(read_database())
+
+                    try:
+                        write_index(_index)
+                    except OSError:
+                        pass  # read-only install, keep the in-memory copy
+
+    return _index
+
+
+def set_index(index):
+    # swap in a freshly built index (players.py after an update)
+    global _index
+
+    with _lock:
+        _index = index
+
+
+def lookup(name):
+    return get_index().lookup(name)
+
+
+def complete(prefix, limit = 10):
+    return get_index().complete(prefix, limit)
+
+
+def fuzzy(query, limit = 5):
+    return get_index().fuzzy(query, limit)
+
+
+def warm_up():
+    # loads the index and builds the search tables before the first keystroke
+    index = get_index()
+
+    if index._words is None:
+        index._build_search()
+
+
+if __name__ == "__main__":
+    index = build()
+    print(f'{len(index)} players written to {INDEX_PATH}')
@@ -6,18 +6,49 @@ To update:
 1.  source venv/bin/activate
 2. python3 players.py
 
+The 26 letter pages are fetched concurrently through outbound.py (its
+shared session, basketball-reference's rate limit and Retry-After
+handling), behind any searches made meanwhile. Against the real site
+the wall time is set by that limit, not by the concurrency: at
+outbound.LIMITS' 20 requests a minute with a burst of 10, the 26 pages
+take about 48s whatever WORKERS is. The concurrency only overlaps the
+parsing with the downloads and pays off against hosts that are not
+limited. --rate (requests per second) lowers outbound's limit for the
+host to slow the crawl down further; it never raises it:
+python3 players.py --rate 0.2
+
+For in-season refreshes only the letter pages that changed since the
+last crawl are re-read, and a report of added/renamed/removed players
+is printed:
+python3 players.py update
+
 By Jack Ribarich
 Date: August 1, 2020
 
 """
 
-import requests
-import ast
-from bs4 import BeautifulSoup
+import os
+import sys
+import json
+import hashlib
+import string
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from bs4 import BeautifulSoup, SoupStrainer
 from unidecode import unidecode  # for converting non-English letters
+import player_index
+import outbound
+
+URL = "https://www.basketball-reference.com/players/"
+LETTERS = string.ascii_lowercase
+WORKERS = 8  # letter pages downloaded at once
+RATE = None  # lowers outbound's requests per second for the host, None keeps it
+TIMEOUT = 20  # seconds
+STATE_PATH = os.path.join(player_index.DIR, 'player_database_state.json')
 
 def test():
-	response = requests.get('https://www.basketball-reference.com/players/a/')
+	response = outbound.get('https://www.basketball-reference.com/players/a/', outbound.BACKGROUND)
 	soup = BeautifulSoup(response.text, 'html.parser')
 	players = soup.find_all('th', class_='left')
 
@@ -29,38 +60,224 @@ def test():
 
 def find():
 	player = input("What player's html do you want? ")
-	with open('player_database.txt') as f:
-		player_dict = ast.literal_eval(f.read())
 
-	print(player_dict[player])
+	print(player_index.lookup(player.strip().lower()))
 
 
-def main():
-	url = "https://www.basketball-reference.com/players/"
-	end = "/"
+def limit_rate(url, rate):
+	# one limit per host, outbound's: rate can only make it stricter
+	if not rate:
+		return
 
-	player_dict = {}
+	scheduler = outbound.get_scheduler()
+	host = urlsplit(url).hostname
+	current = scheduler.limit(host)[0]
+
+	if current is None or rate < current:
+		scheduler.set_limit(host, rate)
+
+
+def fetch_letter(url, headers = None):
+	# background lane: searches made meanwhile go ahead of the crawl
+	response = outbound.get(url, outbound.BACKGROUND, timeout=TIMEOUT, headers=headers)
+	response.raise_for_status()
+
+	return response
+
+
+def conditional_headers(record):
+	# lets the server answer 304 Not Modified for a page we already have
+	headers = {}
+
+	if record and record.get('etag'):
+		headers['If-None-Match'] = record['etag']
+
+	if record and record.get('last_modified'):
+		headers['If-Modified-Since'] = record['last_modified']
+
+	return headers
+
+
+def parse_letter(html):
+	# only the player cells are built, not the whole page
+	soup = BeautifulSoup(html, 'html.parser', parse_only=SoupStrainer('th', class_='left'))
+	players = []
+
+	for x in soup.find_all('th', class_='left'):
+		name = unidecode(x.find('a').text.lower())
+		players.append((name, x.get('data-append-csv')))
+
+	return players
+
+
+def crawl(url = URL, letters = LETTERS, workers = WORKERS, rate = RATE, state = None):
+	"""Fetches the letter pages concurrently and parses each one as soon as
+	it arrives. Returns {letter: [(name, ext), ...]}.
+
+	state ({letter: record}, see load_state) is updated in place. Pages
+	already in it are requested conditionally, and only parsed again if
+	the server sends a new page whose content hash changed.
+	"""
+	limit_rate(url, rate)
+	state = {} if state is None else state
+	pages = {}
+
+	with ThreadPoolExecutor(workers) as pool:
+		futures = {pool.submit(fetch_letter, url + letter + '/',
+		                       conditional_headers(state.get(letter))): letter
+		           for letter in letters}
+
+		# parsing overlaps with the downloads still in flight
+		for future in as_completed(futures):
+			letter = futures[future]
+			response = future.result()
+			record = state.get(letter)
+
+			if response.status_code == 304 and record:
+				pages[letter] = record['players']
+				continue
+
+			digest = hashlib.sha256(response.content).hexdigest()
+
+			if record and record['sha256'] == digest:
+				players = record['players']  # new headers, same page
+			else:
+				players = parse_letter(response.text)
+
+			state[letter] = {'etag': response.headers.get('ETag'),
+			                 'last_modified': response.headers.get('Last-Modified'),
+			                 'sha256': digest, 'players': players}
+			pages[letter] = players
+
+	return pages
+
+
+def load_state(path = STATE_PATH):
+	# letter -> {etag, last_modified, sha256, players} from the last crawl
+	try:
+		with open(path) as f:
+			state = json.load(f)
+
+	except (OSError, ValueError):
+		return {}
+
+	for record in state.values():
+		record['players'] = [tuple(p) for p in record['players']]
+
+	return state
 
-	i = ord('a')  # start with 'a' last names
 
-	# iterate over alphabet and store url into dictionary
-	while i <= ord('z'):
-		response = requests.get(url + chr(i) + end)
-		soup = BeautifulSoup(response.text, 'html.parser')
-		players = soup.find_all('th', class_='left')
+def save_state(state, path = STATE_PATH):
+	tmp = path + '.tmp'
 
-		for x in players:
-			player_dict[unidecode(x.find('a').text.lower())] = x.get('data-append-csv')
-		
-		i += 1
+	with open(tmp, 'w') as f:
+		json.dump(state, f)
 
-	# write dictionary a file
-	f = open('player_database.txt', 'w')
+	os.replace(tmp, path)
+
+
+def diff(old_pairs, new_pairs):
+	# changes keyed by url extension, which never changes for a player
+	old = {ext: name for name, ext in old_pairs}
+	new = {ext: name for name, ext in new_pairs}
+
+	return {'added': sorted((new[e], e) for e in new if e not in old),
+	        'removed': sorted((old[e], e) for e in old if e not in new),
+	        'renamed': sorted((old[e], new[e], e) for e in new if e in old and old[e] != new[e])}
+
+
+def apply_diff(pairs, changes):
+	removed = {ext for _, ext in changes['removed']}
+	renamed = {ext: name for _, name, ext in changes['renamed']}
+
+	pairs = [(renamed.get(ext, name), ext) for name, ext in pairs if ext not in removed]
+
+	return pairs + changes['added']
+
+
+def write_database(player_list, path = player_index.DATABASE_PATH):
+	player_dict = {}
+
+	for name, ext in player_list:
+		player_dict[name] = ext
+
+	# write dictionary a file, swapped in whole so readers never see half of it
+	tmp = path + '.tmp'
+	f = open(tmp, 'w')
 	f.write(str(player_dict))
 	f.close()
+	os.replace(tmp, path)
+
+	# write the sorted lookup index used by peakfinder.py
+	index = player_index.from_pairs(player_list)
+	player_index.write_index(index)
+	player_index.set_index(index)
+
+
+def main(url = URL, workers = WORKERS, rate = RATE):
+	state = {}
+	pages = crawl(url, LETTERS, workers, rate, state=state)
+
+	player_list = []  # keeps players who share a name
+
+	# same a-z order as the old one page at a time loop
+	for letter in LETTERS:
+		player_list.extend(pages[letter])
+
+	write_database(player_list)
+	save_state(state)
+
+
+def update(url = URL, workers = WORKERS, rate = RATE):
+	"""Re-crawls with conditional requests, re-parses only the letter pages
+	that changed and applies the add/rename/remove diff to the index.
+	Returns the report of what changed.
+	"""
+	state = load_state()
+	old_hashes = {letter: record['sha256'] for letter, record in state.items()}
+
+	pages = crawl(url, LETTERS, workers, rate, state=state)
+	changed = [l for l in LETTERS if state[l]['sha256'] != old_hashes.get(l)]
+
+	current = list(player_index.get_index().pairs())
+	new_pairs = [p for l in LETTERS for p in pages[l]]
+	old_pairs = [p for p in current if p[1][0] in changed]
+	changes = diff(old_pairs, [p for p in new_pairs if p[1][0] in changed])
+
+	if any(changes.values()):
+		write_database(apply_diff(current, changes))
+
+	save_state(state)
+
+	changes['letters'] = changed
+
+	return changes
+
+
+def print_report(changes):
+	print(f"Changed letter pages: {', '.join(changes['letters']) or 'none'}")
+
+	for name, ext in changes['added']:
+		print(f'  + {name} ({ext})')
+
+	for old, new, ext in changes['renamed']:
+		print(f'  ~ {old} -> {new} ({ext})')
+
+	for name, ext in changes['removed']:
+		print(f'  - {name} ({ext})')
+
+	print(f"{len(changes['added'])} added, {len(changes['renamed'])} renamed, "
+	      f"{len(changes['removed'])} removed")
 
 
 if __name__ == "__main__":
-	main()  # creates/updates player database
+	rate = RATE
+	if '--rate' in sys.argv:
+		rate = float(sys.argv[sys.argv.index('--rate') + 1])
+
+	if 'update' in sys.argv[1:]:
+		print_report(update(rate=rate))  # only re-reads the letters that changed
+	else:
+		main(rate=rate)  # creates/updates player database
 	#find()  # finds a specific player
 	#test()  # tests how to find certain html elements
\ No newline at end of file
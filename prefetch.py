@@ -0,0 +1,411 @@
+"""
+Speculative prefetch:
+Fetches the players a search is likely to land on before it is made
+
+While a name is typed, once its completions narrow down to CANDIDATES
+players or fewer, those players are fetched into the disk cache
+(cache.py, the headshot into images.py's) so the search that follows
+is answered from disk. At startup the players searched most are warmed
+the same way, recent searches counting for more.
+
+Prefetching never competes with a search. It runs on a thread of its
+own in outbound's background lane, starts nothing while a search is
+running or while the host has fewer than RESERVE spare requests in its
+rate limit, and fetches at most BUDGET players per BUDGET_WINDOW.
+Candidates of an earlier keystroke are dropped as soon as the text
+changes, and a search for a player that is being prefetched waits for
+that fetch instead of sending the same request. stats() gives the hit
+rate (the share of searches whose player had been prefetched); totals
+across runs are kept with the search history.
+
+Command line example (most searched players and hit rates so far):
+"python3 prefetch.py"
+
+"""
+
+import os
+import json
+import time
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# cache, images, outbound and peakfinder pull in pandas and requests, they
+# are imported on the prefetch thread so the window still opens quickly
+
+HISTORY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache',
+                            'search_history.json')
+HISTORY_SIZE = 500  # players kept, the least recently searched go first
+HALF_LIFE = 14 * 24 * 60 * 60  # a search counts half as much two weeks later
+
+CANDIDATES = 3  # completions narrowed down to this many players are prefetched
+SETTLE = 0.3  # seconds the candidates have to stay the same before they are fetched
+WARM_PLAYERS = 5  # players from the history warmed at startup
+BUDGET = 20  # players prefetched per BUDGET_WINDOW at most
+BUDGET_WINDOW = 10 * 60
+RESERVE = 3  # spare requests in the host's rate limit left for searches
+JOIN_TIMEOUT = 30  # seconds a search waits on a prefetch of the same player
+CANCEL_POLL = 0.1  # seconds between checks of a search's cancel Event while it waits
+
+TYPING = 'typing'
+HISTORY = 'history'
+
+_prefetcher = None
+_lock = threading.Lock()
+
+
+def read_history(path = HISTORY_PATH):
+    # {'players': {ext: [searches, last searched]}, 'totals': {counter: n}}
+    history = {}
+
+    if path is not None:
+        try:
+            with open(path) as f:
+                history = json.load(f)
+
+        except (OSError, ValueError):
+            pass
+
+    history.setdefault('players', {})
+    history.setdefault('totals', {})
+
+    return history
+
+
+def write_history(history, path = HISTORY_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+
+    with open(tmp, 'w') as f:
+        json.dump(history, f)
+
+    os.replace(tmp, path)
+
+
+def most_searched(history, count = WARM_PLAYERS, now = None):
+    # players searched most, each search weighing less as it gets older
+    now = time.time() if now is None else now
+    players = history['players']
+
+    def weight(ext):
+        searches, last = players[ext]
+        return searches * 0.5 ** ((now - last) / HALF_LIFE)
+
+    return sorted(players, key=weight, reverse=True)[:count]
+
+
+def hit_rate(counts):
+    searches = counts.get('searches', 0)
+
+    return (counts.get('hits', 0) + counts.get('joined', 0)) / searches if searches else None
+
+
+def fetch_player(ext):
+    """Puts ext's page, tables and bio in the disk cache, in the background
+    lane. Returns the Player, None when there was nothing to fetch.
+    """
+    import peakfinder as pf
+    import batch
+    import cache
+
+    if not pf.USE_CACHE or pf.SNAPSHOT is not None or cache.get_cache().fresh(ext):
+        return None
+
+    return batch.fetch_player(ext)  # stored in the cache
+
+
+def fetch_headshot(p):
+    # into images.py's cache, optional like in a lookup
+    import images
+    import outbound
+
+    if p.pic_url is not None:
+        try:
+            images.get(p.ext, p.pic_url, outbound.BACKGROUND)
+        except OSError:
+            pass
+
+
+class Prefetcher():
+    """Background prefetching within a budget, see the module docstring.
+    fetch(ext) warms one player (see fetch_player), headshot(player) its
+    picture once a search no longer has to wait for it (None skips it).
+    history_path=None keeps the history in memory only.
+    """
+
+    def __init__(self, budget = BUDGET, window = BUDGET_WINDOW, reserve = RESERVE,
+                 settle = SETTLE, fetch = fetch_player, headshot = fetch_headshot,
+                 history_path = HISTORY_PATH):
+        self.budget = budget
+        self.window = window
+        self.reserve = reserve
+        self.settle = settle
+        self.fetch = fetch
+        self.headshot = headshot
+        self.history_path = history_path
+        self.history = read_history(history_path)
+
+        self.cond = threading.Condition()
+        self.queue = deque()  # (ext, source, not before)
+        self.running = None  # ext being fetched
+        self.prefetched = set()  # exts fetched this run
+        self.spent = deque()  # when each prefetch in the budget window started
+        self.searching = 0  # searches running
+        self.counts = Counter()
+        self.thread = None
+        self.closed = False
+        self.save_lock = threading.Lock()  # history writes, taken without self.cond
+        self.saves = 0  # history copies taken
+        self.written = 0  # the newest of them on disk
+
+    def _queue(self, exts, source, settle):
+        # called holding the lock, replaces the queued players of source
+        now = time.monotonic()
+        old = {job[0]: job for job in self.queue if job[1] == source}
+        queue = deque(job for job in self.queue if job[1] != source)
+        queued = {job[0] for job in queue}
+        wanted = [ext for ext in dict.fromkeys(exts) if ext not in self.prefetched
+                  and ext != self.running and ext not in queued]
+
+        # a candidate that is still wanted keeps its place and its start time
+        queue.extend(old.get(ext) or (ext, source, now + settle) for ext in wanted)
+        self.counts['cancelled'] += len(set(old) - set(wanted))
+        self.queue = queue
+
+        if self.queue and self.thread is None and not self.closed:
+            self.thread = threading.Thread(target=self._run, name='prefetch', daemon=True)
+            self.thread.start()
+
+        self.cond.notify_all()
+
+    def suggest(self, exts):
+        """Players the text typed so far narrows down to, [] when it does
+        not narrow down. Replaces the candidates of the last keystroke.
+        """
+        with self.cond:
+            self._queue(exts, TYPING, self.settle)
+
+    def warm(self, count = WARM_PLAYERS):
+        # queues the players most worth having ready, for startup
+        with self.cond:
+            self._queue(most_searched(self.history, count), HISTORY, 0)
+
+    @contextmanager
+    def search(self, ext, cancel = None):
+        """Wraps the search for ext (None if the name is not known). Counts
+        it as a hit or a miss, waits for a prefetch of ext that is under
+        way, drops the typing candidates and holds every other prefetch
+        until the search is done. Setting cancel (the search's Event) ends
+        the wait, and the search is then not counted.
+        """
+        history = None
+
+        with self.cond:
+            self.searching += 1
+            self.queue = deque(job for job in self.queue if job[0] != ext)
+            self._queue([], TYPING, 0)  # the text was submitted, its candidates are stale
+
+            joined = ext is not None and self.running == ext
+            deadline = time.monotonic() + JOIN_TIMEOUT
+
+            while self.running == ext and ext is not None and time.monotonic() < deadline:
+                if cancel is not None and cancel.is_set():
+                    break
+
+                self.cond.wait(min(deadline - time.monotonic(), CANCEL_POLL))
+
+            if ext is not None and not (cancel is not None and cancel.is_set()):
+                if ext not in self.prefetched:
+                    outcome = 'misses'
+                else:
+                    outcome = 'joined' if joined else 'hits'
+                    self.prefetched.discard(ext)  # later searches would hit the cache anyway
+
+                self._record(ext, outcome)
+                history = self._copy()
+
+        self._save(history)
+
+        try:
+            yield
+
+        finally:
+            with self.cond:
+                self.searching -= 1
+                self.cond.notify_all()
+
+    def _record(self, ext, outcome):
+        # called holding the lock, counts a search and adds it to the history
+        players = self.history['players']
+        totals = self.history['totals']
+
+        self.counts['searches'] += 1
+        self.counts[outcome] += 1
+
+        for key in ('searches', outcome):
+            totals[key] = totals.get(key, 0) + 1
+
+        players[ext] = [players.get(ext, [0, 0])[0] + 1, time.time()]
+
+        if len(players) > HISTORY_SIZE:
+            for old in sorted(players, key=lambda e: players[e][1])[:len(players) - HISTORY_SIZE]:
+                del players[old]
+
+    def _copy(self):
+        # called holding the lock: (number, history) for _save, which writes
+        # it without the lock so suggest() never waits on the disk
+        self.saves += 1
+
+        return self.saves, {'players': dict(self.history['players']),
+                            'totals': dict(self.history['totals'])}
+
+    def _save(self, history):
+        if history is None or self.history_path is None:
+            return
+
+        number, history = history
+
+        with self.save_lock:
+            if number < self.written:
+                return  # a newer copy is already on disk
+
+            try:
+                write_history(history, self.history_path)
+                self.written = number
+            except OSError:
+                pass  # the history only makes startup warmer
+
+    def _next(self, scheduler, host):
+        # called holding the lock: the next player to fetch, None once
+        # there is nothing left. Waits while a search runs
+        while self.queue and not self.closed:
+            now = time.monotonic()
+            spare = scheduler.spare(host)  # None when the host is not rate limited
+
+            while self.spent and now - self.spent[0] >= self.window:
+                self.spent.popleft()
+
+            ext, source, not_before = self.queue[0]
+            wait = None
+
+            if self.searching:
+                pass  # woken when the search is done
+
+            elif not_before > now:
+                wait = not_before - now
+
+            elif len(self.spent) >= self.budget:
+                self.queue.popleft()
+                self.counts['over budget'] += 1
+                continue
+
+            elif spare is not None and spare < self.reserve + 1:
+                wait = 0.5  # searches may need what is left of the rate limit
+
+            else:
+                self.queue.popleft()
+                self.spent.append(now)
+                self.running = ext
+                return ext
+
+            self.cond.wait(wait)
+
+        return None
+
+    def _run(self):
+        import peakfinder as pf
+        import outbound
+
+        while True:
+            scheduler = outbound.get_scheduler()
+            host = urlsplit(pf.SITE).hostname
+
+            with self.cond:
+                ext = self._next(scheduler, host)
+
+                if ext is None:
+                    self.thread = None
+                    return
+
+            failed = False
+
+            try:
+                player = self.fetch(ext)
+
+            except Exception:
+                player = None
+                failed = True
+
+            history = None
+
+            with self.cond:
+                self.running = None
+
+                if player is not None:
+                    self.prefetched.add(ext)
+                    self.counts['prefetched'] += 1
+                    totals = self.history['totals']
+                    totals['prefetched'] = totals.get('prefetched', 0) + 1
+                    history = self._copy()
+
+                else:
+                    self.counts['failed' if failed else 'not needed'] += 1
+
+                    if not failed:
+                        self.spent.pop()  # only fetches count against the budget
+
+                self.cond.notify_all()  # a search waiting on ext goes ahead
+
+            self._save(history)
+
+            if player is not None and self.headshot is not None:
+                self.headshot(player)
+
+    def stats(self):
+        """Counters of this run: searches (hits, joined a prefetch under
+        way, misses), prefetched, cancelled, over budget, not needed
+        (already cached) and failed, plus the hit rate and how much of
+        the budget is left.
+        """
+        with self.cond:
+            stats = dict(self.counts)
+            now = time.monotonic()
+            spent = sum(now - start < self.window for start in self.spent)
+            stats.update({'hit rate': hit_rate(self.counts), 'queued': len(self.queue),
+                          'budget left': self.budget - spent})
+
+        return stats
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.queue.clear()
+            self.cond.notify_all()
+
+
+def get_prefetcher():
+    global _prefetcher
+
+    if _prefetcher is None:
+        with _lock:
+            if _prefetcher is None:
+                _prefetcher = Prefetcher()
+
+    return _prefetcher
+
+
+def stats():
+    return get_prefetcher().stats()
+
+
+if __name__ == "__main__":
+    history = read_history()
+    totals = history['totals']
+    rate = hit_rate(totals)
+
+    for ext in most_searched(history, 10):
+        print(f'{ext:<12} {history["players"][ext][0]} searches')
+
+    print(f'{totals.get("searches", 0)} searches, {totals.get("prefetched", 0)} players prefetched, '
+          f'hit rate {"-" if rate is None else f"{rate:.0%}"}')
@@ -0,0 +1,93 @@
+"""
+Stats table schema:
+Checks and types a player's stats tables once, as they come in
+
+Both table backends (tables.py and sheets.py) hand back raw strings.
+coerce() turns a table into typed columns: numbers as float64, team,
+league and position as categoricals, and a start year (int) next to
+each season label. Rows that are not a season (Career, "3 Yrs") are
+dropped, and a table missing a required column or holding text in a
+number column raises SchemaError right away, naming the table.
+
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+SEASON = re.compile(r'^\d{4}-\d{2}$')  # e.g. 2009-10
+
+NUMERIC = {'Age', 'G', 'GS', 'MP', 'FG', 'FGA', 'FG%', '3P', '3PA', '3P%', '2P', '2PA',
+           '2P%', 'eFG%', 'FT', 'FTA', 'FT%', 'ORB', 'DRB', 'TRB', 'AST', 'STL', 'BLK',
+           'TOV', 'PF', 'PTS', 'PER', 'TS%', '3PAr', 'FTr', 'ORB%', 'DRB%', 'TRB%', 'AST%',
+           'STL%', 'BLK%', 'TOV%', 'USG%', 'OWS', 'DWS', 'WS', 'WS/48', 'OBPM', 'DBPM',
+           'BPM', 'VORP'}
+CATEGORICAL = {'Tm', 'Lg', 'Pos'}
+
+# table name (as in tables.TABLE_IDS and sheets.RANGES) -> columns it must have
+REQUIRED = {'Regular': ('Season', 'Tm', 'FG%', 'PTS', 'AST', 'TRB'),
+            'Playoffs': ('Season', 'Tm', 'FG%', 'PTS', 'AST', 'TRB'),
+            'Regular Advanced': ('Season', 'Tm', 'PER', 'WS'),
+            'Playoffs Advanced': ('Season', 'Tm', 'PER', 'WS')}
+
+
+class SchemaError(ValueError):
+    """A stats table that does not look like the one on basketball-reference"""
+
+
+def is_typed(df):
+    return 'Year' in df.columns
+
+
+def _bad_number(name, columns, numbers, cells):
+    # message naming the first cell that is not a number
+    season = columns.index('Season')
+
+    for row in cells:
+        for i in numbers:
+            try:
+                float(row[i] or 'nan')
+            except ValueError:
+                return f'{name} table has {str(row[i])!r} in number column {columns[i]} ({row[season]})'
+
+
+def coerce(df, name):
+    """Typed copy of the raw stats table called name (see REQUIRED).
+    Empty tables stay empty.
+    """
+    if df is None or df.empty or is_typed(df):
+        return df
+
+    missing = [col for col in REQUIRED[name] if col not in df.columns]
+    if missing:
+        raise SchemaError(f'{name} table has no {", ".join(missing)} column')
+
+    columns = [col for col in df.columns if col not in ('', None)]  # drops blank spacers
+    cells = np.char.strip(df[columns].fillna('').to_numpy(dtype=str))
+    seasons = cells[:, columns.index('Season')]
+    cells = cells[[SEASON.match(season) is not None for season in seasons]]
+
+    numbers = [i for i, col in enumerate(columns) if col in NUMERIC]
+
+    try:
+        values = np.where(cells[:, numbers] == '', 'nan', cells[:, numbers]).astype(np.float64)
+
+    except ValueError:
+        raise SchemaError(_bad_number(name, columns, numbers, cells)) from None
+
+    typed = {}
+    values = iter(values.T)
+
+    for i, col in enumerate(columns):
+        if col in NUMERIC:
+            typed[col] = next(values)
+        elif col in CATEGORICAL:
+            typed[col] = pd.Categorical(cells[:, i].astype(object))
+        else:
+            typed[col] = cells[:, i].astype(object)
+
+        if col == 'Season':
+            typed['Year'] = cells[:, i].astype('U4').astype(np.int64)  # '2009-10' -> 2009
+
+    return pd.DataFrame(typed)
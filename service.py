@@ -0,0 +1,333 @@
+"""
+Lookup service:
+Serves player peaks as JSON over local HTTP, for dashboards and scripts
+
+GET /peak?name=lebron james (or ?ext=jamesle01) returns the player's
+bio and regular season / playoff peaks, GET /metrics the request,
+lookup and latency counters. A name several players share answers for
+the newest of them, with "candidates" listing every one's ext.
+
+Requests for a player that is already being looked up wait for that
+lookup instead of starting their own (single flight), finished lookups
+are answered from memory for RESULT_TTL seconds, and at most
+MAX_LOOKUPS lookups run at once; a request that cannot start one
+within QUEUE_TIMEOUT seconds gets a 503. A lookup that is only missing
+its bio (it ran past its deadline) is still answered, with "missing"
+saying why, but is not kept in memory.
+
+Command line example:
+"python3 service.py --port 8080 --max-lookups 4"
+
+"""
+
+import re
+import json
+import time
+import argparse
+import threading
+from collections import Counter, OrderedDict, deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+import peakfinder as pf
+import player_index
+import outbound
+from tasks import TaskFailed
+
+PORT = 8080
+MAX_LOOKUPS = 4  # lookups running at once, the rest wait for a slot
+QUEUE_TIMEOUT = 10  # seconds a lookup may wait for a slot before a 503
+RESULT_TTL = 600  # seconds a finished lookup is served from memory
+RESULT_SIZE = 512  # finished lookups kept, least recently used go first
+LATENCIES = 10000  # most recent /peak latencies kept for the percentiles
+
+EXT = re.compile(r'^[a-z.\'-]{1,8}\d{2}$')  # e.g. jamesle01
+
+
+class Busy(Exception):
+    """No lookup slot came free within the queue timeout"""
+
+
+class _Flight():
+    # one lookup in progress, shared by every request for the same player
+    def __init__(self):
+        self.done = threading.Event()
+        self.body = None
+        self.complete = False
+        self.error = None
+
+
+def peak_json(peak):
+    if peak is None:
+        return None
+
+    season = peak.season._asdict()
+
+    return {'season': {key: value if isinstance(value, str) else float(value)
+                       for key, value in season.items()},
+            'seasons': peak.seasons.tolist(), 'scores': peak.sums.tolist(),
+            'ppg': peak.ppg.tolist(), 'apg': peak.apg.tolist(), 'rpg': peak.rpg.tolist()}
+
+
+def lookup(ext):
+    """(JSON body, complete) for one player, stats from the page (or the
+    disk cache), no headshot. A lookup whose bio ran late still has its
+    peaks, missing says why the bio is not there and it is not complete.
+    """
+    p = pf.Player(ext=ext)
+    peak_data = pf.player_stats(p, pic=False)
+
+    body = {'ext': ext, 'bio': None if 'bio' in p.missing else pf.get_bio(p),
+            'regular': peak_json(peak_data.regular),
+            'playoffs': peak_json(peak_data.playoffs),
+            'missing': p.missing}
+
+    return json.dumps(body).encode('utf-8'), not p.missing
+
+
+def percentile(values, q):
+    if not values:
+        return None
+
+    values = sorted(values)
+
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+class Service():
+    """Single flight, cached and bounded lookups keyed by url extension.
+    fetch(ext) returns (body, complete), only complete bodies are kept.
+    single_flight=False and ttl=0 turn the sharing off, for comparisons.
+    """
+
+    def __init__(self, max_lookups = MAX_LOOKUPS, ttl = RESULT_TTL, size = RESULT_SIZE,
+                 queue_timeout = QUEUE_TIMEOUT, single_flight = True, fetch = lookup):
+        self.slots = threading.BoundedSemaphore(max_lookups)
+        self.ttl = ttl
+        self.size = size
+        self.queue_timeout = queue_timeout
+        self.single_flight = single_flight
+        self.fetch = fetch
+
+        self.lock = threading.Lock()
+        self.flights = {}  # ext -> _Flight
+        self.results = OrderedDict()  # ext -> (stored, body)
+        self.running = 0
+        self.stats = Counter()
+        self.latencies = deque(maxlen=LATENCIES)
+        self.start = time.time()
+
+    def get(self, ext):
+        """JSON body (bytes) for ext. Raises Busy when no lookup slot came
+        free and TaskFailed when a step of the lookup failed; requests
+        sharing a lookup all get its result or its error.
+        """
+        with self.lock:
+            hit = self.results.get(ext)
+
+            if hit is not None and time.monotonic() - hit[0] < self.ttl:
+                self.results.move_to_end(ext)
+                self.stats['result hits'] += 1
+                return hit[1]
+
+            flight = self.flights.get(ext) if self.single_flight else None
+            leader = flight is None
+
+            if leader:
+                flight = _Flight()
+                self.stats['lookups'] += 1
+
+                if self.single_flight:
+                    self.flights[ext] = flight
+
+            else:
+                self.stats['coalesced'] += 1
+
+        if leader:
+            self._fly(ext, flight)
+        else:
+            flight.done.wait()
+
+        if flight.error is not None:
+            raise flight.error
+
+        return flight.body
+
+    def _fly(self, ext, flight):
+        try:
+            if not self.slots.acquire(timeout=self.queue_timeout):
+                raise Busy(f'no lookup slot free after {self.queue_timeout}s')
+
+            try:
+                with self.lock:
+                    self.running += 1
+
+                flight.body, flight.complete = self.fetch(ext)
+
+            finally:
+                with self.lock:
+                    self.running -= 1
+
+                self.slots.release()
+
+        except Exception as err:
+            flight.error = err
+
+        with self.lock:
+            if self.flights.get(ext) is flight:
+                del self.flights[ext]
+
+            if flight.error is None and not flight.complete:
+                self.stats['partial'] += 1
+
+            if flight.complete and self.ttl > 0:
+                self.results[ext] = (time.monotonic(), flight.body)
+                self.results.move_to_end(ext)
+
+                while len(self.results) > self.size:
+                    self.results.popitem(last=False)
+
+        flight.done.set()
+
+    def peak(self, query):
+        # (status, body) for GET /peak
+        ext = query.get('ext')
+        name = query.get('name')
+
+        if ext is None and name is not None:
+            exts = player_index.lookup(player_index.normalize(name))
+
+            if not exts:
+                suggestions = player_index.fuzzy(name, 3)
+                return 404, {'error': f'no player named {name!r}', 'suggestions': suggestions}
+
+            ext = exts[-1]  # newest player, like peakfinder.get_player
+            candidates = exts if len(exts) > 1 else None
+
+        else:
+            candidates = None
+
+        if ext is None or not EXT.match(ext):
+            return 400, {'error': 'give a player name or ext'}
+
+        try:
+            body = self.get(ext)
+
+            if candidates is not None:  # the others are a ?ext= away
+                body = dict(json.loads(body), candidates=candidates)
+
+            return 200, body
+
+        except Busy as err:
+            return 503, {'error': str(err)}
+
+        except TaskFailed as err:
+            return 502, {'error': str(err), 'step': err.name}
+
+    def record(self, path, status, seconds):
+        with self.lock:
+            self.stats[f'status {status}'] += 1
+
+            if path == '/peak':
+                self.latencies.append(seconds)
+
+    def metrics(self):
+        with self.lock:
+            latencies = list(self.latencies)
+            metrics = dict(self.stats)
+            metrics.update({'in flight': len(self.flights), 'running': self.running,
+                            'results kept': len(self.results),
+                            'uptime': round(time.time() - self.start, 1)})
+
+        metrics['latency ms'] = {}
+
+        for q in (50, 90, 99):
+            seconds = percentile(latencies, q)
+            metrics['latency ms'][f'p{q}'] = None if seconds is None else round(seconds * 1000, 2)
+
+        metrics['outbound'] = outbound.stats()  # queue depth and waits per lane
+
+        return metrics
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        start = time.perf_counter()
+        service = self.server.service
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        try:
+            if url.path == '/peak':
+                status, body = service.peak(query)
+            elif url.path == '/metrics':
+                status, body = 200, service.metrics()
+            else:
+                status, body = 404, {'error': 'not found'}
+
+        except Exception as err:  # a bug, still answered and counted
+            status, body = 500, {'error': f'{type(err).__name__}: {err}'}
+
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+
+        if status == 503:
+            self.send_header('Retry-After', '1')
+
+        self.end_headers()
+        self.wfile.write(body)
+
+        service.record(url.path, status, time.perf_counter() - start)
+
+    def log_message(self, format, *args):
+        pass  # one line per request would drown out the metrics
+
+
+def make_server(service, port = PORT, host = '127.0.0.1'):
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.service = service
+    server.url = f'http://{host}:{server.server_port}'
+
+    return server
+
+
+def serve(service, port = 0, host = '127.0.0.1'):
+    """Runs service on a background thread (port 0 picks a free one),
+    server.url is its address. Call server.shutdown() when done.
+    """
+    server = make_server(service, port, host)
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve player peaks as JSON')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--max-lookups', type=int, default=MAX_LOOKUPS,
+                        help='lookups running at once')
+    parser.add_argument('--ttl', type=float, default=RESULT_TTL,
+                        help='seconds a finished lookup is served from memory')
+    args = parser.parse_args()
+
+    player_index.warm_up()
+
+    server = make_server(Service(args.max_lookups, args.ttl), args.port, args.host)
+
+    print(f'Serving peaks on {server.url}/peak?name=...')
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
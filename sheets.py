@@ -5,10 +5,18 @@
     This file contains functions related to creating
     and accessing sheets using Google's Sheets API
 
+    Every lookup leases its own set of tabs from a SheetPool
+    (getPool), so lookups can run at once without reading back
+    another player's tables.
+
 """
 from __future__ import print_function
 
+import re
+import time
 import os.path
+import threading
+from contextlib import contextmanager, nullcontext
 import pandas as pd
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
@@ -16,12 +24,43 @@ from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+import tracing
+import schema
+
 # If modifying these scopes, delete the file token.json.
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
 
 # The ID and range of a sample spreadsheet.
 SAMPLE_SPREADSHEET_ID = '1KS682cdzXrCMYYmjyvBZdMSIrmPvGXbI_BX_3wuyRNs'
 
+# IMPORTHTML table numbers change depending on if the player made the playoffs
+MADE_PLAYOFFS = {'Regular': 1, 'Playoffs': 2, 'Regular Advanced': 5, 'Playoffs Advanced': 6}
+NO_PLAYOFFS = {'Regular': 1, 'Regular Advanced': 3}
+RANGES = {'Regular': 'Regular!A1:AD', 'Playoffs': 'Playoffs!A1:AD',
+          'Regular Advanced': 'RegAdv!A1:AC', 'Playoffs Advanced': 'Playoffs_Adv!A1:AC'}
+TABLE_NAMES = {range: name for name, range in RANGES.items()}
+
+# Each lookup leases a slot, its own set of the tabs above, so lookups
+# running at once never overwrite each other's formulas. Slot 0 is the
+# tabs above, slot n is "Regular_n", "RegAdv_n", ... which are added to
+# the spreadsheet when every slot is leased and deleted again once
+# they have sat unused for SLOT_IDLE seconds.
+MAX_SLOTS = 8
+SLOT_IDLE = 300
+LEASE_TIMEOUT = 60  # seconds to wait for a free slot when MAX_SLOTS are leased
+
+_SLOT_SUFFIX = re.compile(r'_\d+!')
+
+# The credentials are authorized once per process. Each thread builds
+# its own spreadsheets() resource from them, since a resource sits on
+# one httplib2.Http, which is not thread-safe
+_creds = None
+_sheet = None  # set by setService, shared by every thread instead
+_generation = 0  # bumped by setService, drops the threads' resources
+_local = threading.local()
+_pool = None
+_lock = threading.Lock()
+
 
 def authorizeSheet():
     """Shows basic usage of the Sheets API.
@@ -59,26 +98,302 @@ def getAccess(creds):
 
     return sheet
 
-def fillSheet(sheet, player_link, tableNum, range):
+def getService():
+    """Returns this thread's spreadsheets() resource, built on the
+    thread's first call. Authorizing happens only once per process.
+    """
+    global _creds
+
+    if _sheet is not None:
+        return _sheet
+
+    if getattr(_local, 'generation', None) != _generation or _local.sheet is None:
+        if _creds is None:
+            with _lock:
+                if _creds is None:
+                    with tracing.span('sheets auth'):
+                        _creds = authorizeSheet()
+
+        _local.sheet = getAccess(_creds)
+        _local.generation = _generation
+
+    return _local.sheet
+
+def setService(sheet):
+    """Replaces the spreadsheets() resources with one every thread shares,
+    e.g. a local (thread-safe) fake. Passing None makes the next
+    getService() authorize again and every thread build a new resource.
+    The slot pool starts over with the new service.
+    """
+    global _sheet, _creds, _generation, _pool
+
+    with _lock:
+        _sheet = sheet
+        _creds = None
+        _generation += 1
+        _pool = None
+
+def getPool():
+    global _pool
+
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = SheetPool()
+
+    return _pool
+
+def baseRange(range):
+    # 'Regular_3!A1:AD' -> 'Regular!A1:AD'
+    return _SLOT_SUFFIX.sub('!', range, count=1)
+
+
+class Slot():
+    """One leased set of tabs, range() maps a range of RANGES onto them"""
+
+    def __init__(self, number):
+        self.number = number
+
+    def range(self, range):
+        if self.number == 0:
+            return range
+
+        tab, cells = range.split('!')
+
+        return f'{tab}_{self.number}!{cells}'
+
+    def tabs(self):
+        return [self.range(range).split('!')[0] for range in RANGES.values()]
+
+
+class SheetPool():
+    """Leases slots to lookups, adding tabs when every slot is taken and
+    deleting them once they sit unused. Use as
+    "with getPool().lease() as slot:" and read back before leaving it.
+    """
+
+    def __init__(self, maxSlots = MAX_SLOTS, idle = SLOT_IDLE, timeout = LEASE_TIMEOUT):
+        self.maxSlots = maxSlots
+        self.idle = idle
+        self.timeout = timeout
+        self.cond = threading.Condition()
+        self.free = [(Slot(0), time.monotonic())]  # (slot, released), newest last
+        self.leased = set()  # numbers of the leased slots
+        self.adding = set()  # numbers of the slots whose tabs are being added
+        self.tabIds = None  # tab title -> sheetId, read the first time tabs are added
+        self.discover = threading.Lock()
+        self.stats = {'leases': 0, 'waits': 0, 'grown': 0, 'shrunk': 0}
+
+    def size(self):
+        return len(self.free) + len(self.leased) + len(self.adding)
+
+    def lease(self, slot = None):
+        # a slot that is already held is passed through, nothing is leased
+        if slot is not None:
+            return nullcontext(slot)
+
+        return self._leased()
+
+    @contextmanager
+    def _leased(self):
+        slot = self.acquire()
+
+        try:
+            yield slot
+        finally:
+            self.release(slot)
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+
+        with self.cond:
+            self.stats['leases'] += 1
+
+            while not self.free and self.size() >= self.maxSlots:
+                self.stats['waits'] += 1
+                left = deadline - time.monotonic()
+
+                if left <= 0 or not self.cond.wait(left):
+                    raise TimeoutError(f'no sheet slot free after {self.timeout}s')
+
+            if self.free:
+                slot = self.free.pop()[0]  # newest, so the oldest go idle
+                self.leased.add(slot.number)
+                return slot
+
+            used = {slot.number for slot, _ in self.free} | self.leased | self.adding
+            slot = Slot(min(set(range(1, self.maxSlots + 1)) - used))
+            self.adding.add(slot.number)
+
+        try:
+            self._addTabs(slot)
+
+        finally:
+            with self.cond:
+                self.adding.discard(slot.number)
+                self.cond.notify()
+
+        with self.cond:
+            self.leased.add(slot.number)
+            self.stats['grown'] += 1
+
+        return slot
+
+    def release(self, slot):
+        now = time.monotonic()
+
+        with self.cond:
+            self.leased.discard(slot.number)
+            self.free.append((slot, now))
+            self.cond.notify()
+
+        self.shrink(now)
+
+    def shrink(self, now = None, idle = None):
+        """Deletes the tabs of slots unused for idle (default SLOT_IDLE)
+        seconds. Slot 0, the original tabs, is always kept.
+        """
+        now = time.monotonic() if now is None else now
+        idle = self.idle if idle is None else idle
+
+        with self.cond:
+            old = [slot for slot, released in self.free
+                   if slot.number != 0 and now - released >= idle]
+
+            if not old:
+                return
+
+            self.free = [entry for entry in self.free if entry[0] not in old]
+            self.adding.update(slot.number for slot in old)  # numbers stay taken until deleted
+
+        try:
+            self._deleteTabs(old)
+
+        finally:
+            with self.cond:
+                self.adding.difference_update(slot.number for slot in old)
+                self.stats['shrunk'] += len(old)
+                self.cond.notify_all()
+
+    def _addTabs(self, slot):
+        sheet = getService()
+
+        with self.discover:
+            if self.tabIds is None:
+                # tabs left by an earlier run are reused instead of added again
+                tracing.count('sheets calls')
+                result = sheet.get(spreadsheetId=SAMPLE_SPREADSHEET_ID,
+                                   fields='sheets.properties(sheetId,title)').execute()
+                tabIds = {s['properties']['title']: s['properties']['sheetId']
+                          for s in result.get('sheets', [])}
+
+                with self.cond:
+                    self.tabIds = tabIds
+
+        with self.cond:
+            known = set(self.tabIds)
+
+        missing = [tab for tab in slot.tabs() if tab not in known]
+        if not missing:
+            return
+
+        tracing.count('sheets calls')
+
+        with tracing.span('sheets add tabs', slot=slot.number):
+            result = sheet.batchUpdate(
+                spreadsheetId=SAMPLE_SPREADSHEET_ID,
+                body=dict(requests=[{'addSheet': {'properties': {'title': tab}}}
+                                    for tab in missing])
+            ).execute()
+
+        with self.cond:
+            for reply in result.get('replies', []):
+                properties = reply['addSheet']['properties']
+                self.tabIds[properties['title']] = properties['sheetId']
+
+    def _deleteTabs(self, slots):
+        with self.cond:
+            ids = [self.tabIds.pop(tab) for slot in slots for tab in slot.tabs()
+                   if tab in (self.tabIds or {})]
+
+        if not ids:
+            return
+
+        tracing.count('sheets calls')
+
+        with tracing.span('sheets delete tabs', slots=len(slots)):
+            getService().batchUpdate(
+                spreadsheetId=SAMPLE_SPREADSHEET_ID,
+                body=dict(requests=[{'deleteSheet': {'sheetId': id}} for id in ids])
+            ).execute()
+
+
+def importFormula(player_link, tableNum):
     pre = '=ARRAYFORMULA(SUBSTITUTE(IMPORTHTML("'
     after = '", "table",'
     end = '),"*",""))'
-    text = pre + player_link + after + str(tableNum) + end
 
-    sheet.values().update(
-        spreadsheetId=SAMPLE_SPREADSHEET_ID,
-        valueInputOption='USER_ENTERED',
-        range=range,
-        body=dict(
-            values=[[text]])
-    ).execute()
+    return pre + player_link + after + str(tableNum) + end
+
+def fillSheet(sheet, player_link, tableNum, range):
+    text = importFormula(player_link, tableNum)
+    tracing.count('sheets calls')
+
+    with tracing.span('sheets write', range=range):
+        sheet.values().update(
+            spreadsheetId=SAMPLE_SPREADSHEET_ID,
+            valueInputOption='USER_ENTERED',
+            range=range,
+            body=dict(
+                values=[[text]])
+        ).execute()
+
+
+def fillSheets(sheet, player_link, tables):
+    """Writes every IMPORTHTML formula in one batchUpdate.
+    tables maps range -> IMPORTHTML table number.
+    """
+    data = [dict(range=range, values=[[importFormula(player_link, tableNum)]])
+            for range, tableNum in tables.items()]
+    tracing.count('sheets calls')
+
+    with tracing.span('sheets write', ranges=len(data)):
+        sheet.values().batchUpdate(
+            spreadsheetId=SAMPLE_SPREADSHEET_ID,
+            body=dict(
+                valueInputOption='USER_ENTERED',
+                data=data)
+        ).execute()
 
 
 def retrieveDF(sheet, range):
-    result = sheet.values().get(spreadsheetId=SAMPLE_SPREADSHEET_ID,
-                                    range=range).execute()
-    values = result.get('values', [])
+    tracing.count('sheets calls')
+
+    # the read waits for IMPORTHTML to recalculate
+    with tracing.span('sheets read', range=range):
+        result = sheet.values().get(spreadsheetId=SAMPLE_SPREADSHEET_ID,
+                                        range=range).execute()
+
+    return valuesToDF(result.get('values', []), TABLE_NAMES.get(baseRange(range)))
+
+
+def retrieveDFs(sheet, ranges):
+    """Reads every range in one batchGet, returns range -> DataFrame"""
+    tracing.count('sheets calls')
 
+    with tracing.span('sheets read', ranges=len(ranges)):
+        result = sheet.values().batchGet(spreadsheetId=SAMPLE_SPREADSHEET_ID,
+                                         ranges=list(ranges)).execute()
+    value_ranges = result.get('valueRanges', [])
+
+    return {range: valuesToDF(vr.get('values', []), TABLE_NAMES.get(baseRange(range)))
+            for range, vr in zip(ranges, value_ranges)}
+
+
+def valuesToDF(values, name = None):
+    """DataFrame of a sheet's values, typed by schema.coerce when name
+    (a key of RANGES) says which table it is.
+    """
     if not values:
         print('No data found.')
         return
@@ -95,14 +410,33 @@ def retrieveDF(sheet, range):
 
     df = df[~df["Tm"].str.contains('Did Not Play', na=False)]
 
+    if name is not None:
+        df = schema.coerce(df, name)
+
     return df
 
 
-def getDF(player_link, p, retType, tableNum, range):
-    creds = authorizeSheet()
-    sheet = getAccess(creds)
-    fillSheet(sheet, player_link, tableNum, range)
-    df = retrieveDF(sheet, range)
+def getDFs(player_link, tables):
+    """Batched getDF: one write and one read for all tables, in a leased slot.
+    tables maps range (of RANGES) -> IMPORTHTML table number.
+    """
+    sheet = getService()
+
+    with getPool().lease() as slot:
+        leased = {slot.range(range): tableNum for range, tableNum in tables.items()}
+        fillSheets(sheet, player_link, leased)
+        dfs = retrieveDFs(sheet, list(leased))
+
+    return {range: dfs[slot.range(range)] for range in tables}
+
+
+def getDF(player_link, p, retType, tableNum, range, slot = None):
+    # range is one of RANGES, written and read in slot (leased here if None)
+    sheet = getService()
+
+    with getPool().lease(slot) as slot:
+        fillSheet(sheet, player_link, tableNum, slot.range(range))
+        df = retrieveDF(sheet, slot.range(range))
 
     # For Multi-Threading Purposes
     if retType == 0:
@@ -0,0 +1,443 @@
+"""
+League snapshot:
+One compressed, versioned file holding every player's stats tables and
+bio, so lookups can run with no network at all
+
+export() writes the typed reg_season/playoff tables (merged like
+peakfinder does) and the bio of every player into one file. Each column
+is stored once for all players, cut into chunks of CHUNK_ROWS rows that
+are compressed on their own, and text is stored as codes into a
+vocabulary. Opening a snapshot memory-maps the file and reads only its
+header and player list; looking a player up decompresses just the
+chunks holding that player's rows. With peakfinder.SNAPSHOT set (or the
+PEAKFINDER_SNAPSHOT environment variable) every lookup is served from
+the snapshot and nothing is downloaded.
+
+File layout: MAGIC and the format (uint32), the blocks, the header
+(zlib compressed json saying where every block is), then the header's
+offset and length (uint64, uint32) and MAGIC again.
+
+Command line examples:
+"python3 snapshot.py export league.snap --fetch-workers 4"
+"python3 snapshot.py info league.snap"
+"PEAKFINDER_SNAPSHOT=league.snap python3 peak_ui.py"
+
+"""
+
+import os
+import mmap
+import json
+import zlib
+import time
+import struct
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+import cache
+import player_bio
+
+MAGIC = b'PEAKSNAP'
+FORMAT = 1  # snapshots in another format are refused, not misread
+
+CHUNK_ROWS = 4096  # rows per compressed chunk of a column
+LEVEL = 6  # zlib level, 0 stores the chunks as they are
+CHUNKS_KEPT = 256  # decompressed chunks kept in memory per open snapshot
+
+BIO_FIELDS = player_bio.Bio._fields
+
+# column kind (cache.column_kind) -> stored dtype, text is stored as vocabulary codes
+DTYPES = {'f': '<f8', 'i': '<i8', 'c': '<i4', 's': '<i4'}
+_STAGING = {'f': np.float64, 'i': np.int64, 'c': object, 's': object}  # dtype while writing
+
+_START = struct.Struct('<8sI4x')  # MAGIC, format, padding so blocks start 8 byte aligned
+_FOOTER = struct.Struct('<QI8s')  # header offset and length, MAGIC
+
+_snapshots = {}  # path -> open Snapshot
+_lock = threading.Lock()
+
+
+class SnapshotError(ValueError):
+    """Not a snapshot, a damaged one, or one written in another format"""
+
+
+class _Writer():
+    # appends blocks to f, returns [offset, length] for the header
+    def __init__(self, f, level):
+        self.f = f
+        self.level = level
+
+    def block(self, data, compress = True):
+        if compress and self.level:
+            data = zlib.compress(data, self.level)
+
+        offset = self.f.tell()
+        self.f.write(data)
+        self.f.write(b'\0' * (-len(data) % 8))  # keeps the next block aligned
+
+        return [offset, len(data)]
+
+    def array(self, values, dtype):
+        # never compressed, read in place through the memory map
+        return self.block(np.ascontiguousarray(values, dtype=dtype).tobytes(), compress=False)
+
+    def json(self, value):
+        return self.block(json.dumps(value).encode('utf-8'))
+
+
+def _frames_table(frames):
+    # (row offsets, layout per player, layouts, {column: (kind, values)}) of one table
+    frames = [pd.DataFrame() if df is None else df for df in frames]
+    offsets = np.concatenate([[0], np.cumsum([len(df) for df in frames], dtype=np.int64)])
+    layouts = {}  # column names -> layout number
+    layout = []
+    kinds = {}  # first player with the column decides its kind
+    parts = {}  # column -> [(first row, values)]
+
+    for df, first in zip(frames, offsets):
+        names = tuple(str(col) for col in df.columns)
+        layout.append(layouts.setdefault(names, len(layouts)))
+
+        for col, (_, column) in zip(names, df.items()):
+            if col not in kinds:
+                kinds[col] = cache.column_kind(column)
+
+            parts.setdefault(col, []).append((first, column.to_numpy(_STAGING[kinds[col]])))
+
+    columns = {}
+
+    for col, kind in kinds.items():
+        # rows of players without the column are never read back, their layout does not have it
+        if kind == 'i':
+            values = np.zeros(offsets[-1], np.int64)
+        else:
+            values = np.full(offsets[-1], np.nan, _STAGING[kind])
+
+        for first, part in parts[col]:
+            values[first:first + len(part)] = part
+
+        columns[col] = (kind, values)
+
+    return offsets, layout, [list(names) for names in layouts], columns
+
+
+def _bio_table(bios):
+    # one row per player, every field is text
+    offsets = np.arange(len(bios) + 1, dtype=np.int64)
+    columns = {field: ('s', np.array([bio.get(field) for bio in bios], dtype=object))
+               for field in BIO_FIELDS}
+
+    return offsets, [0] * len(bios), [list(BIO_FIELDS)], columns
+
+
+def _write_table(writer, offsets, layout, layouts, columns, chunk_rows):
+    table = {'rows': int(offsets[-1]), 'offsets': writer.array(offsets, '<i8'),
+             'layout': writer.array(layout, '<i4'), 'layouts': layouts, 'columns': {}}
+
+    for col, (kind, values) in columns.items():
+        vocab = None
+
+        if kind in 'cs':
+            codes, uniques = pd.factorize(values, sort=True)  # nulls get -1
+            values = codes
+            vocab = writer.json([str(value) for value in uniques])
+
+        values = np.asarray(values, dtype=DTYPES[kind])
+        chunks = [writer.block(values[start:start + chunk_rows].tobytes())
+                  for start in range(0, len(values), chunk_rows)]
+
+        table['columns'][col] = {'kind': kind, 'chunks': chunks, 'vocab': vocab}
+
+    return table
+
+
+def write(path, players, level = LEVEL, chunk_rows = CHUNK_ROWS):
+    """Writes players, an iterable of (ext, reg_season, playoff, bio), to
+    a snapshot at path (replaced in one step). Tables are typed and merged
+    like peakfinder.merge_tables leaves them. Returns the player count.
+    """
+    players = {player[0]: player for player in players}
+    exts = sorted(players)
+    players = [players[ext] for ext in exts]
+    tmp = path + '.tmp'
+
+    with open(tmp, 'wb') as f:
+        f.write(_START.pack(MAGIC, FORMAT))
+        writer = _Writer(f, level)
+
+        header = {'format': FORMAT, 'created': time.time(), 'players': len(exts),
+                  'chunk rows': chunk_rows, 'compressed': level > 0,
+                  'exts': writer.json(exts), 'tables': {}}
+
+        for i, name in enumerate(('reg_season', 'playoff')):
+            table = _frames_table([player[i + 1] for player in players])
+            header['tables'][name] = _write_table(writer, *table, chunk_rows)
+
+        table = _bio_table([player[3] or {} for player in players])
+        header['tables']['bio'] = _write_table(writer, *table, chunk_rows)
+
+        data = zlib.compress(json.dumps(header).encode('utf-8'))
+        offset = f.tell()
+        f.write(data)
+        f.write(_FOOTER.pack(offset, len(data), MAGIC))
+
+    os.replace(tmp, path)
+
+    return len(exts)
+
+
+class Snapshot():
+    """Read only view of a snapshot file. get(ext) returns (reg_season,
+    playoff, bio) like cache.PlayerCache.get, or None for a player that
+    is not in it. Safe to share between threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < _START.size + _FOOTER.size:
+                raise SnapshotError(f'{path} is not a snapshot')
+
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            self._open()
+
+        except BaseException:
+            self.map.close()
+            raise
+
+        self.lock = threading.Lock()
+        self.chunks = OrderedDict()  # (table, column, chunk) -> values
+        self.vocabs = {}  # (table, column) -> values, nan last for the null code
+
+    def _open(self):
+        magic, version = _START.unpack_from(self.map, 0)
+        offset, length, end = _FOOTER.unpack_from(self.map, len(self.map) - _FOOTER.size)
+
+        if magic != MAGIC or end != MAGIC:
+            raise SnapshotError(f'{self.path} is not a snapshot')
+
+        if version != FORMAT:
+            raise SnapshotError(f'{self.path} is snapshot format {version}, '
+                                f'this version reads format {FORMAT}')
+
+        try:
+            self.header = json.loads(zlib.decompress(self.map[offset:offset + length]))
+            self.exts = self._json(self.header['exts'])
+
+        except (zlib.error, ValueError, KeyError) as err:
+            raise SnapshotError(f'{self.path} is damaged: {err}') from None
+
+        self.index = {ext: i for i, ext in enumerate(self.exts)}
+        self.tables = self.header['tables']
+        count = len(self.exts)
+
+        # row offsets and layouts stay in the file, only the pages read are loaded
+        self.offsets = {name: np.frombuffer(self.map, '<i8', count + 1, table['offsets'][0])
+                        for name, table in self.tables.items()}
+        self.layouts = {name: np.frombuffer(self.map, '<i4', count, table['layout'][0])
+                        for name, table in self.tables.items()}
+
+    def _read(self, block):
+        offset, length = block
+        data = self.map[offset:offset + length]
+
+        return zlib.decompress(data) if self.header['compressed'] else data
+
+    def _json(self, block):
+        return json.loads(self._read(block))
+
+    def _chunk(self, name, col, number):
+        key = (name, col, number)
+
+        with self.lock:
+            values = self.chunks.get(key)
+
+            if values is not None:
+                self.chunks.move_to_end(key)
+                return values
+
+        column = self.tables[name]['columns'][col]
+        values = np.frombuffer(self._read(column['chunks'][number]), DTYPES[column['kind']])
+
+        with self.lock:
+            self.chunks[key] = values
+
+            while len(self.chunks) > CHUNKS_KEPT:
+                self.chunks.popitem(last=False)
+
+        return values
+
+    def _vocab(self, name, col):
+        key = (name, col)
+
+        with self.lock:
+            vocab = self.vocabs.get(key)
+
+        if vocab is None:
+            vocab = np.array(self._json(self.tables[name]['columns'][col]['vocab']) + [np.nan],
+                             dtype=object)
+
+            with self.lock:
+                self.vocabs[key] = vocab
+
+        return vocab
+
+    def _rows(self, name, col, start, stop):
+        # values of rows start to stop of one column, decompressing only their chunks
+        kind = self.tables[name]['columns'][col]['kind']
+        size = self.header['chunk rows']
+
+        if stop > start:
+            first = start // size
+            values = np.concatenate([self._chunk(name, col, number)
+                                     for number in range(first, (stop - 1) // size + 1)])
+            values = values[start - first * size:stop - first * size]
+        else:
+            values = np.empty(0, DTYPES[kind])
+
+        vocab = self._vocab(name, col) if kind in 'cs' else None
+
+        if kind == 'c':
+            # the vocabulary is sorted, so the codes used are the player's categories in order
+            used = np.unique(values[values >= 0])
+            codes = np.where(values >= 0, np.searchsorted(used, values), -1)
+            return pd.Categorical.from_codes(codes, vocab[used])
+
+        return vocab[values] if kind == 's' else values  # the null code -1 picks the nan
+
+    def _frame(self, name, i):
+        start, stop = int(self.offsets[name][i]), int(self.offsets[name][i + 1])
+        columns = self.tables[name]['layouts'][self.layouts[name][i]]
+
+        return pd.DataFrame({col: self._rows(name, col, start, stop) for col in columns},
+                            columns=columns)
+
+    def __len__(self):
+        return len(self.exts)
+
+    def __contains__(self, ext):
+        return ext in self.index
+
+    def get(self, ext):
+        i = self.index.get(ext)
+
+        if i is None:
+            return None
+
+        bio = {}
+
+        for field in self.tables['bio']['layouts'][0]:
+            value = self._rows('bio', field, i, i + 1)[0]
+            bio[field] = None if pd.isna(value) else value
+
+        return self._frame('reg_season', i), self._frame('playoff', i), bio
+
+    def info(self):
+        return {'path': self.path, 'format': self.header['format'],
+                'created': time.strftime('%Y-%m-%d %H:%M', time.localtime(self.header['created'])),
+                'players': len(self.exts), 'bytes': len(self.map),
+                'rows': {name: table['rows'] for name, table in self.tables.items()},
+                'compressed': self.header['compressed']}
+
+    def close(self):
+        self.offsets = self.layouts = None  # views into the map have to go first
+        self.chunks.clear()
+        self.map.close()
+
+
+def get_snapshot(path):
+    # one open Snapshot per path, shared by every lookup
+    snapshot = _snapshots.get(path)
+
+    if snapshot is None:
+        with _lock:
+            snapshot = _snapshots.get(path)
+
+            if snapshot is None:
+                snapshot = _snapshots[path] = Snapshot(path)
+
+    return snapshot
+
+
+def export(path, exts = None, fetch_workers = 4, level = LEVEL, progress = None):
+    """Snapshot of every player in exts (default: the whole player index),
+    taken from the disk cache where it has them and fetched in the
+    background lane otherwise. Players that fail are left out, returns
+    {ext: error} for them. progress(done, ext, error) is called per player.
+    """
+    import peakfinder as pf  # both import this module
+    import batch
+
+    exts = batch.all_exts() if exts is None else list(exts)
+    players = []
+    failed = {}
+
+    with ThreadPoolExecutor(fetch_workers) as pool:
+        futures = {pool.submit(batch.fetch_player, ext): ext for ext in exts}
+
+        for done, future in enumerate(as_completed(futures), 1):
+            ext = futures[future]
+
+            try:
+                p = future.result()
+                players.append((ext, p.reg_season, p.playoff, pf.get_bio(p)))
+
+            except Exception as err:
+                failed[ext] = repr(err)
+
+            if progress is not None:
+                progress(done, ext, failed.get(ext))
+
+    write(path, players, level)
+
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export or inspect a league snapshot')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    exporting = commands.add_parser('export', help='write a snapshot of every player')
+    exporting.add_argument('path')
+    exporting.add_argument('--fetch-workers', type=int, default=4, help='pages fetched at once')
+    exporting.add_argument('--limit', type=int, default=None, help='only the first N players')
+    exporting.add_argument('--level', type=int, default=LEVEL, help='zlib level, 0 for none')
+
+    showing = commands.add_parser('info', help='describe a snapshot')
+    showing.add_argument('path')
+
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        import batch
+
+        start = time.perf_counter()
+
+        def progress(done, ext, error):
+            print(f'[{done}] {ext} {error or ""}')
+
+        failed = export(args.path, batch.all_exts()[:args.limit], args.fetch_workers,
+                        args.level, progress)
+
+        print(f'{len(failed)} players failed, {time.perf_counter() - start:.1f}s -> {args.path}')
+
+    else:
+        start = time.perf_counter()
+        snapshot = Snapshot(args.path)
+        opened = time.perf_counter() - start
+
+        for key, value in snapshot.info().items():
+            print(f'{key:<12} {value}')
+
+        print(f'{"opened in":<12} {opened * 1000:.1f} ms')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Startup profile:
+Times the application's cold start, import by import
+
+profile() wraps the import statement so each top-level import of a
+module not loaded yet is timed (modules it pulls in count towards it),
+mark() records how long after START a startup step finished, and
+warm_up() imports the lookup modules on a background thread once the
+window is up. report() prints everything.
+
+Command line example:
+"python3 peak_ui.py profile"
+
+"""
+
+import sys
+import time
+import builtins
+import importlib
+import threading
+
+START = time.perf_counter()
+
+imports = []  # (module, seconds) in the order they finished
+marks = []  # (step, seconds since START)
+
+_import = builtins.__import__
+_local = threading.local()
+
+
+def _timed_import(name, globals = None, locals = None, fromlist = (), level = 0):
+    depth = getattr(_local, 'depth', 0)
+
+    if depth or level or name in sys.modules:
+        return _import(name, globals, locals, fromlist, level)
+
+    _local.depth = 1
+    start = time.perf_counter()
+
+    try:
+        return _import(name, globals, locals, fromlist, level)
+
+    finally:
+        imports.append((name, time.perf_counter() - start))
+        _local.depth = 0
+
+
+def profile():
+    # times every import from here on, call before the heavy imports
+    builtins.__import__ = _timed_import
+
+
+def mark(step):
+    marks.append((step, time.perf_counter() - START))
+
+
+def warm_up(modules, done = None):
+    """Imports modules on a daemon thread so the first search does not
+    wait for them, then calls done() (on that thread) if given.
+    """
+    def run():
+        _local.depth = 1  # only the modules themselves are timed
+
+        for name in modules:
+            start = time.perf_counter()
+            importlib.import_module(name)
+            imports.append((name + ' (background)', time.perf_counter() - start))
+
+        mark('background imports done')
+
+        if done is not None:
+            done()
+
+    thread = threading.Thread(target=run, name='warm up', daemon=True)
+    thread.start()
+
+    return thread
+
+
+def report():
+    print('Imports')
+
+    for name, seconds in sorted(imports, key=lambda item: -item[1]):
+        if seconds >= 0.001:
+            print(f'    {name:<40} {seconds * 1000:8.1f} ms')
+
+    print('Startup')
+
+    for step, seconds in marks:
+        print(f'    {step:<40} {seconds * 1000:8.1f} ms')
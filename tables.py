@@ -0,0 +1,157 @@
+"""
+Stats table parser:
+Pulls a player's stats tables straight out of a basketball-reference
+player page, instead of round tripping through Google Sheets IMPORTHTML
+
+The DataFrames match what sheets.retrieveDF produces: one string column
+per table header, "*" stripped from cells and "Did Not Play" rows
+removed. Tables that basketball-reference hides inside HTML comments
+are parsed too.
+
+Tables are typed and checked by schema.coerce unless typed=False.
+
+Given the page as text, only the wanted tables are cut out of it and
+parsed, never the rest of the page. lxml is used when it is installed,
+html.parser otherwise.
+
+Command line example (prints the tables of a saved page):
+"python3 tables.py page.html"
+
+"""
+
+import sys
+import pandas as pd
+from bs4 import BeautifulSoup, Comment
+
+import schema
+
+try:
+    import lxml  # faster parser backend, optional
+    PARSER = 'lxml'
+except ImportError:
+    PARSER = 'html.parser'
+
+# table ids on the player page, older and newer page layouts
+TABLE_IDS = {'Regular': ('per_game', 'per_game_stats'),
+             'Playoffs': ('playoffs_per_game', 'playoffs_per_game_stats'),
+             'Regular Advanced': ('advanced',),
+             'Playoffs Advanced': ('playoffs_advanced',)}
+
+HEADER_ALIASES = {'Team': 'Tm'}  # newer pages renamed some columns
+
+
+def find_tables(soup):
+    # every table on the page by id, including commented out ones
+    found = {}
+
+    for table in soup.find_all('table', id=True):
+        found[table['id']] = table
+
+    for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
+        if '<table' not in comment:
+            continue
+
+        inner = BeautifulSoup(comment, 'html.parser')
+
+        for table in inner.find_all('table', id=True):
+            found.setdefault(table['id'], table)
+
+    return found
+
+
+def table_source(html, table_id):
+    # the <table> with this id cut out of the page text (commented out or not), or None
+    key = f'id="{table_id}"'
+    pos = html.find(key)
+
+    while pos != -1:
+        start = html.rfind('<', 0, pos)
+
+        if html.startswith('<table', start):
+            end = html.find('</table>', pos)
+            return html[start:end + len('</table>')] if end != -1 else None
+
+        pos = html.find(key, pos + len(key))
+
+    return None
+
+
+def slice_tables(html):
+    # table id -> parsed <table>, for the ids in TABLE_IDS only
+    found = {}
+
+    for ids in TABLE_IDS.values():
+        for table_id in ids:
+            source = table_source(html, table_id)
+
+            if source is not None:
+                found[table_id] = BeautifulSoup(source, PARSER).find('table')
+
+    return found
+
+
+def row_cells(tr):
+    cells = []
+
+    for cell in tr.find_all(['th', 'td'], recursive=False):
+        cells.append(cell.get_text().strip().replace('*', ''))
+
+        # IMPORTHTML leaves the cells a colspan covers blank
+        cells.extend([''] * (int(cell.get('colspan', 1)) - 1))
+
+    return cells
+
+
+def table_to_df(table):
+    thead = table.find('thead')
+    if thead is None:
+        return pd.DataFrame()
+
+    header_rows = [tr for tr in thead.find_all('tr')
+                   if 'over_header' not in tr.get('class', [])]
+    header = [HEADER_ALIASES.get(h, h) for h in row_cells(header_rows[-1])]
+
+    rows = []
+    for section in table.find_all(['tbody', 'tfoot'], recursive=False):
+        for tr in section.find_all('tr', recursive=False):
+            if 'thead' in tr.get('class', []):
+                continue  # header repeated mid table
+
+            cells = row_cells(tr)
+            cells = (cells + [''] * len(header))[:len(header)]
+            rows.append(cells)
+
+    df = pd.DataFrame(rows, columns=header)
+
+    # blank spacer columns carry no data
+    df = df.loc[:, [h != '' for h in header]]
+
+    if df.empty or 'Tm' not in df.columns:
+        return df
+
+    # drop rows where player was injured
+    return df[~df['Tm'].str.contains('Did Not Play', na=False)]
+
+
+def parse_tables(html, typed = True):
+    # name -> DataFrame for Regular, Playoffs and their Advanced tables
+    if isinstance(html, BeautifulSoup):
+        found = find_tables(html)  # already parsed in full
+    else:
+        found = slice_tables(html)
+
+    tables = {}
+    for name, ids in TABLE_IDS.items():
+        table = next((found[i] for i in ids if i in found), None)
+        df = table_to_df(table) if table is not None else pd.DataFrame()
+        tables[name] = schema.coerce(df, name) if typed else df
+
+    return tables
+
+
+if __name__ == "__main__":
+    with open(sys.argv[1], encoding='utf-8') as f:
+        for name, df in parse_tables(f.read()).items():
+            print(name)
+            print(df)
+            print()
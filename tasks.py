@@ -0,0 +1,272 @@
+"""
+Task scheduler:
+One bounded thread pool shared by every player lookup
+
+A lookup submits its steps (page fetch, headshot, bio, stats tables) as
+named tasks and waits on them together. Each task has its own deadline,
+the first failure or timeout is raised right away as a TaskFailed that
+names the step, and the pool's threads are reused from one search to the
+next instead of being started and thrown away.
+
+A task can be hedged: if it has not finished after its hedge delay a
+second attempt is started and whichever finishes first wins, so one
+slow upstream response does not set the lookup's latency. The hedge
+clock only runs while an attempt is working: outbound.py stops it while
+the attempt waits for a rate limit token, and a losing attempt still
+in that queue leaves it without taking one (see current()). Optional
+tasks never fail the batch, their failures and timeouts are collected
+in Batch.missing instead. Hedged tasks must be safe to run twice, so
+they return their result rather than changing shared state.
+
+Tasks must not wait on other tasks: run() called from inside a pool
+thread runs its tasks inline so a full pool can never deadlock.
+
+"""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import tracing
+
+MAX_WORKERS = 8
+POLL = 0.1  # seconds between cancel checks while waiting
+
+_executor = None
+_executor_lock = threading.Lock()
+_local = threading.local()  # marks the pool's own threads
+
+
+class Cancelled(Exception):
+    """Raised between stages when a retrieve() is no longer wanted"""
+
+
+class TaskFailed(Exception):
+    """A task raised or ran past its deadline, the cause is chained"""
+
+    def __init__(self, name, error):
+        Exception.__init__(self, f'{name}: {error}')
+        self.name = name
+        self.error = error
+
+
+class TaskTimeout(TaskFailed):
+    pass
+
+
+class Attempt():
+    # one run of a task. cancel is set once another attempt has won or the
+    # batch is over, the hedge clock runs from started() while started_at is set
+    def __init__(self):
+        self.cancel = threading.Event()
+        self.started_at = None
+
+    def started(self):
+        self.started_at = time.monotonic()
+
+    def queued(self):
+        self.started_at = None  # waiting on something that is not the task's own work
+
+
+def current():
+    # the Attempt running on this thread, None outside a Batch
+    return getattr(_local, 'attempt', None)
+
+
+def _mark_worker():
+    _local.worker = True
+
+
+def get_executor():
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(MAX_WORKERS, thread_name_prefix='peakfinder',
+                                               initializer=_mark_worker)
+
+    return _executor
+
+
+def in_worker():
+    return getattr(_local, 'worker', False)
+
+
+def _task(name, fn):
+    # with tracing on, each task is a span under the span that started it
+    if not tracing.ENABLED:
+        return fn
+
+    def traced(*args):
+        with tracing.span(name):
+            return fn(*args)
+
+    return tracing.bind(traced)
+
+
+def _attempt(fn, attempt):
+    def run(*args):
+        _local.attempt = attempt
+        attempt.started()
+
+        try:
+            return fn(*args)
+        finally:
+            _local.attempt = None
+
+    return run
+
+
+class Batch():
+    """Named tasks started together, tasks is {name: (fn, args, timeout)}
+    with the timeout in seconds or None. They start running right away;
+    wait() collects them. hedge is {name: seconds} for tasks that get a
+    second attempt when still running after that long, optional the
+    names of tasks whose failure only lands in self.missing.
+    """
+
+    def __init__(self, tasks, hedge = None, optional = ()):
+        self.tasks = tasks
+        self.hedge = hedge or {}
+        self.optional = set(optional)
+        self.start = time.monotonic()
+        self.pending = {}  # future -> name
+        self.attempts = {}  # future -> Attempt
+        self.hedged = set()
+        self.missing = {}  # name -> error, for optional tasks
+        self.inline = in_worker()
+
+        if not self.inline:
+            for name in tasks:
+                self._submit(name)
+
+    def _submit(self, name):
+        fn, args, _ = self.tasks[name]
+        attempt = Attempt()
+        future = get_executor().submit(_attempt(_task(name, fn), attempt), *args)
+        self.pending[future] = name
+        self.attempts[future] = attempt
+
+    def _fail(self, name, error):
+        # an optional task goes missing, any other fails the batch
+        if name not in self.optional:
+            raise error
+
+        self.missing[name] = error.error
+
+    def _run_inline(self, cancel):
+        results = {}
+
+        for name, (fn, args, _) in self.tasks.items():
+            if cancel is not None and cancel.is_set():
+                raise Cancelled()
+
+            try:
+                results[name] = _task(name, fn)(*args)
+
+            except Exception as err:
+                failed = TaskFailed(name, err)
+                failed.__cause__ = err
+                self._fail(name, failed)
+
+        return results
+
+    def _drop(self, name):
+        # forgets every attempt of name, queued ones are cancelled and
+        # running ones told to give up while waiting on outbound.py
+        for future in [f for f, n in self.pending.items() if n == name]:
+            future.cancel()
+            self.attempts.pop(future).cancel.set()
+            del self.pending[future]
+
+    def _working(self, name, now):
+        # seconds the longest working attempt of name has worked, 0 while all wait
+        starts = [self.attempts[f].started_at for f, n in self.pending.items() if n == name]
+
+        return max([now - start for start in starts if start is not None], default=0)
+
+    def _check_deadlines(self):
+        now = time.monotonic()
+
+        for name in set(self.pending.values()):
+            timeout = self.tasks[name][2]
+            hedge = self.hedge.get(name)
+
+            if timeout is not None and now - self.start >= timeout:
+                err = TimeoutError(f'no result after {timeout}s')
+                failed = TaskTimeout(name, err)
+                failed.__cause__ = err
+                self._drop(name)
+                self._fail(name, failed)
+
+            elif hedge is not None and name not in self.hedged and self._working(name, now) >= hedge:
+                self.hedged.add(name)
+                self._submit(name)  # a second try, the first to finish wins
+
+    def wait(self, cancel = None):
+        """Returns {name: result} once every task is done (optional ones
+        that failed are left out, see self.missing). Raises TaskFailed for
+        the first task that fails, TaskTimeout for the first one past its
+        deadline and Cancelled if the cancel Event gets set; whatever is still
+        queued is then cancelled (a task already running is left to finish).
+        A hedged task only fails once all its attempts have.
+        """
+        if self.inline:
+            return self._run_inline(cancel)
+
+        results = {}
+
+        try:
+            while self.pending:
+                if cancel is not None and cancel.is_set():
+                    raise Cancelled()
+
+                self._check_deadlines()
+
+                if not self.pending:
+                    break
+
+                done, _ = wait(self.pending, timeout=POLL, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    name = self.pending.pop(future, None)
+                    self.attempts.pop(future, None)
+
+                    if name is None or name in results:
+                        continue  # the other attempt already finished
+
+                    err = future.exception()
+
+                    if err is None:
+                        results[name] = future.result()
+                        self._drop(name)
+
+                    elif name not in self.pending.values():
+                        failed = TaskFailed(name, err)
+                        failed.__cause__ = err
+                        self._fail(name, failed)
+
+        finally:
+            self.cancel()
+
+        return results
+
+    def cancel(self):
+        for future in self.pending:
+            future.cancel()
+            self.attempts[future].cancel.set()
+
+
+def run(tasks, cancel = None, hedge = None):
+    # starts the tasks and waits for all of them, see Batch.wait
+    return Batch(tasks, hedge).wait(cancel)
+
+
+def shutdown():
+    global _executor
+
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
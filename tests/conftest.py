@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pytest
+
+# the modules live at the top of the repository, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fixtures  # noqa: E402
+import outbound  # noqa: E402
+import sheets  # noqa: E402
+
+
+@pytest.fixture
+def fake_sheets():
+    # installs a FakeSheets for the test, puts the real service back after
+    installed = []
+
+    def install(fake):
+        sheets.setService(fake)
+        installed.append(fake)
+        return fake
+
+    yield install
+
+    if installed:
+        sheets.getPool().shrink(idle=0)
+    sheets.setService(None)
+
+
+@pytest.fixture
+def server():
+    # serve(...) for the test, shut down after it
+    started = []
+
+    def start(pages, **options):
+        started.append(fixtures.serve(pages, **options))
+        return started[-1]
+
+    yield start
+
+    for running in started:
+        running.shutdown()
+
+
+@pytest.fixture
+def scheduler():
+    # a fresh outbound scheduler, so limits changed by a test stay in it
+    fresh = outbound.Scheduler()
+    outbound.set_scheduler(fresh)
+
+    yield fresh
+
+    outbound.set_scheduler(None)
@@ -0,0 +1,112 @@
+import os
+import time
+
+import pandas as pd
+import pytest
+
+import cache
+import fixtures
+import peakfinder as pf
+import tables
+
+
+@pytest.fixture(scope='module')
+def career():
+    # (html, reg_season, playoff) of the saved veteran page
+    html = fixtures.load_page('veterve01')
+    p = pf.Player(ext='veterve01')
+    pf.merge_tables(p, tables.parse_tables(html))
+
+    return html, p.reg_season, p.playoff
+
+
+def active_season(reg_season, now):
+    # the career with its last season moved to the current one
+    df = reg_season.copy()
+    df['Year'] = df['Year'] + (cache.current_season(now) - df['Year'].max())
+
+    return df
+
+
+def test_put_then_get_round_trips(tmp_path, career):
+    html, reg_season, playoff = career
+    c = cache.PlayerCache(str(tmp_path))
+    c.put('veterve01', html, reg_season, playoff, {'height': '6-8'})
+
+    got_reg, got_playoff, bio = c.get('veterve01')
+
+    pd.testing.assert_frame_equal(got_reg, reg_season)
+    pd.testing.assert_frame_equal(got_playoff, playoff)
+    assert bio == {'height': '6-8'}
+    assert c.page('veterve01') == html
+    assert c.stats['hits'] == 1
+
+
+def test_active_entries_expire_after_active_ttl(tmp_path, career):
+    html, reg_season, playoff = career
+    now = time.time()
+    c = cache.PlayerCache(str(tmp_path), active_ttl=60, retired_ttl=3600)
+    c.put('veterve01', html, active_season(reg_season, now), playoff, now=now)
+
+    assert c.get('veterve01', now=now + 59) is not None
+    assert c.get('veterve01', now=now + 61) is None
+    assert c.stats['expired'] == 1
+    assert not os.path.exists(tmp_path / 'veterve01')
+
+
+def test_retired_entries_keep_for_retired_ttl(tmp_path, career):
+    html, reg_season, playoff = career
+    now = time.time()
+    c = cache.PlayerCache(str(tmp_path), active_ttl=60, retired_ttl=3600)
+    c.put('veterve01', html, reg_season.assign(Year=1990), playoff, now=now)
+
+    assert c.fresh('veterve01', now=now + 61)
+    assert c.get('veterve01', now=now + 61) is not None
+    assert c.get('veterve01', now=now + 3601) is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, career):
+    html, reg_season, playoff = career
+    now = time.time()
+    c = cache.PlayerCache(str(tmp_path))
+    c.put('firstpl01', html, reg_season, playoff, now=now)
+    entry_size = c.size()
+    c.max_bytes = 2 * entry_size
+
+    c.put('secondp01', html, reg_season, playoff, now=now + 1)
+    c.get('firstpl01', now=now + 2)  # first is now the more recently used
+    c.put('thirdpl01', html, reg_season, playoff, now=now + 3)
+
+    assert c.stats['evictions'] == 1
+    assert c.get('secondp01', now=now + 4) is None
+    assert c.get('firstpl01', now=now + 4) is not None
+    assert c.get('thirdpl01', now=now + 4) is not None
+    assert c.size() <= c.max_bytes
+
+
+def test_index_merges_what_other_processes_stored(tmp_path, career):
+    # two caches on one folder stand in for two processes
+    html, reg_season, playoff = career
+    one = cache.PlayerCache(str(tmp_path))
+    other = cache.PlayerCache(str(tmp_path))
+    one.get('firstpl01')  # index loaded before the other one stores
+    other.put('secondp01', html, reg_season, playoff)
+    one.put('firstpl01', html, reg_season, playoff)
+
+    assert set(cache.PlayerCache(str(tmp_path))._read()) == {'firstpl01', 'secondp01'}
+    assert cache.PlayerCache(str(tmp_path)).get('secondp01') is not None
+
+
+def test_dropping_an_entry_keeps_a_newer_store(tmp_path, career):
+    # an entry one cache expires is kept if another stored it again since
+    html, reg_season, playoff = career
+    now = time.time()
+    one = cache.PlayerCache(str(tmp_path), retired_ttl=60)
+    other = cache.PlayerCache(str(tmp_path), retired_ttl=60)
+    retired = reg_season.assign(Year=1990)
+
+    one.put('veterve01', html, retired, playoff, now=now)
+    other.put('veterve01', html, retired, playoff, now=now + 100)
+    assert one.get('veterve01', now=now + 100) is None  # its record is the old one
+
+    assert cache.PlayerCache(str(tmp_path))._read()['veterve01']['stored'] == now + 100
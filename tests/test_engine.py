@@ -0,0 +1,21 @@
+import math
+
+import pandas as pd
+
+import engine
+import fixtures
+import peakfinder as pf
+
+
+def test_peaks_match_determine_peak_season():
+    # the grouped pass finds the same peak season and score for every career
+    frames = {f'p{i}': fixtures.career_frame(i) for i in range(200)}
+    found = engine.peaks(engine.build_store(frames))
+
+    for player, df in frames.items():
+        peak = pf.determine_peak_season(pf.Player(reg_season=df.copy(),
+                                                  playoff=pd.DataFrame({'P': []}))).regular
+        row = found.loc[player]
+
+        assert str(row['Season']) == peak.season.season, player
+        assert math.isclose(row['sum'], peak.values[0][peak.index]), player
@@ -0,0 +1,87 @@
+import fixtures
+import players
+
+
+def letter_site(letters):
+    # /players/<letter>/ pages from {letter: [(name, ext), ...]}
+    return {f'/players/{letter}/': fixtures.letter_page(letter, pairs)
+            for letter, pairs in letters.items()}
+
+
+def test_crawl_parses_every_letter(server, scheduler):
+    site = server(letter_site({'a': [('alpha one', 'alphaon01')],
+                               'b': [('bravo one', 'bravoon01'), ('bravo two', 'bravotw01')]}))
+
+    pages = players.crawl(site.url + '/players/', letters='ab')
+
+    assert pages == {'a': [('alpha one', 'alphaon01')],
+                     'b': [('bravo one', 'bravoon01'), ('bravo two', 'bravotw01')]}
+
+
+def test_recrawl_of_unchanged_pages_gets_304(server, scheduler):
+    site = server(letter_site({'a': [('alpha one', 'alphaon01')],
+                               'b': [('bravo one', 'bravoon01')]}))
+    url = site.url + '/players/'
+    state = {}
+    first = players.crawl(url, letters='ab', state=state)
+    records = {letter: dict(record) for letter, record in state.items()}
+
+    second = players.crawl(url, letters='ab', state=state)
+
+    assert second == first
+    assert state == records
+    assert all(record['etag'] for record in state.values())
+    assert site.hits == {'/players/a/': 2, '/players/b/': 2}
+
+
+def test_recrawl_reparses_only_changed_pages(server, scheduler):
+    pages = letter_site({'a': [('alpha one', 'alphaon01')],
+                         'b': [('bravo one', 'bravoon01'), ('bravo two', 'bravotw01')]})
+    site = server(pages)
+    url = site.url + '/players/'
+    state = {}
+    old = players.crawl(url, letters='ab', state=state)
+    old_hashes = {letter: record['sha256'] for letter, record in state.items()}
+
+    # bravo two renamed, bravo one retired from the index, bravo three added
+    pages.update(letter_site({'b': [('bravo deux', 'bravotw01'), ('bravo three', 'bravoth01')]}))
+    new = players.crawl(url, letters='ab', state=state)
+
+    assert state['a']['sha256'] == old_hashes['a']
+    assert state['b']['sha256'] != old_hashes['b']
+
+    old_pairs = [p for l in 'ab' for p in old[l]]
+    changes = players.diff(old['b'], new['b'])
+
+    assert changes == {'added': [('bravo three', 'bravoth01')],
+                       'removed': [('bravo one', 'bravoon01')],
+                       'renamed': [('bravo two', 'bravo deux', 'bravotw01')]}
+    assert sorted(players.apply_diff(old_pairs, changes)) == sorted(new['a'] + new['b'])
+
+
+def test_same_content_under_new_headers_is_not_reparsed(server, scheduler, monkeypatch):
+    # a 200 whose body hashes the same keeps the players it had
+    site = server(letter_site({'a': [('alpha one', 'alphaon01')]}))
+    url = site.url + '/players/'
+    state = {}
+    players.crawl(url, letters='a', state=state)
+    state['a']['etag'] = '"stale"'
+
+    def parse_letter(html):
+        raise AssertionError('unchanged page parsed again')
+
+    monkeypatch.setattr(players, 'parse_letter', parse_letter)
+
+    assert players.crawl(url, letters='a', state=state) == {'a': [('alpha one', 'alphaon01')]}
+    assert state['a']['etag'] != '"stale"'
+
+
+def test_rate_only_lowers_the_host_limit(server, scheduler):
+    site = server(letter_site({'a': [('alpha one', 'alphaon01')]}))
+    url = site.url + '/players/'
+
+    players.crawl(url, letters='a', rate=50)
+    assert scheduler.limit('127.0.0.1')[0] == 50
+
+    players.crawl(url, letters='a', rate=100)
+    assert scheduler.limit('127.0.0.1')[0] == 50
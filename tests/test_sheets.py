@@ -0,0 +1,55 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+import fixtures
+import peakfinder as pf
+import tables
+from fake_sheets import FakeSheets
+
+
+def differing_tables(expected, got):
+    # table names whose DataFrames differ, a missing table counts as empty
+    def frame(tables, name):
+        df = tables.get(name)
+        return pd.DataFrame() if df is None or df.empty else df.reset_index(drop=True)
+
+    return [name for name in sorted(set(expected) | set(got))
+            if not frame(expected, name).equals(frame(got, name))]
+
+
+def player_url(ext):
+    return 'https://www.basketball-reference.com/players/' + ext[0] + '/' + ext + '.html'
+
+
+@pytest.mark.parametrize('ext', sorted(fixtures.PLAYERS))
+def test_batched_read_matches_per_table(fake_sheets, ext):
+    # one batchUpdate and one batchGet, where per table is an update and a get each
+    url = player_url(ext)
+    html = fixtures.load_page(ext)
+    fake = fake_sheets(FakeSheets({url: html}))
+
+    per_table = pf.sheets_tables(url)
+    per_table_calls = dict(fake.calls)
+    fake.calls.clear()
+
+    batched = pf.sheets_tables(url, html)
+
+    assert differing_tables(per_table, batched) == []
+    assert per_table_calls == {'update': len(per_table), 'get': len(per_table)}
+    assert dict(fake.calls) == {'batchUpdate': 1, 'batchGet': 1}
+
+
+def test_concurrent_lookups_get_their_own_tables(fake_sheets):
+    # lookups at once each read their own leased slot, never another's formula
+    site = fixtures.crowd_site(6)
+    pages = {'https://www.basketball-reference.com' + path: html for path, html in site.items()}
+    expected = {url: tables.parse_tables(html) for url, html in pages.items()}
+    fake_sheets(FakeSheets(pages, recalc=0.05))
+
+    with ThreadPoolExecutor(len(pages)) as pool:
+        found = dict(zip(pages, pool.map(lambda url: pf.sheets_tables(url, pages[url]), pages)))
+
+    for url, got in found.items():
+        assert differing_tables(expected[url], got) == [], url
@@ -0,0 +1,68 @@
+from io import StringIO
+
+import pandas as pd
+import pytest
+from bs4 import BeautifulSoup
+
+import fixtures
+import peakfinder as pf
+import player_bio
+import schema
+import tables
+from test_sheets import differing_tables
+
+
+def read_html_tables(html):
+    # the stats tables through pd.read_html (lxml), cleaned up the
+    # way tables.table_to_df cleans them
+    html = html.replace('<!--', '').replace('-->', '')  # commented out tables too
+    found = {}
+
+    for name, ids in tables.TABLE_IDS.items():
+        df = pd.DataFrame()
+
+        for table_id in ids:
+            try:
+                df = pd.read_html(StringIO(html), attrs={'id': table_id},
+                                  keep_default_na=False, flavor='lxml')[0]
+                break
+            except ValueError:
+                pass  # no table with this id
+
+        if not df.empty:
+            if isinstance(df.columns, pd.MultiIndex):
+                df.columns = df.columns.get_level_values(-1)  # over_header rows
+
+            columns = [tables.HEADER_ALIASES.get(col, col) for col in df.columns]
+            df.columns = columns
+            df = df.loc[:, [not col.startswith('Unnamed') for col in columns]].astype(str)
+            df = df.apply(lambda col: col.str.replace('*', '', regex=False))
+            df = df[~df['Tm'].str.contains('Did Not Play', na=False)]
+
+        found[name] = schema.coerce(df, name)
+
+    return found
+
+
+@pytest.mark.parametrize('ext', sorted(fixtures.PLAYERS))
+def test_targeted_tables_match_full_tree(ext):
+    html = fixtures.load_page(ext)
+    soup = BeautifulSoup(html, 'html.parser')
+
+    assert differing_tables(tables.parse_tables(soup), tables.parse_tables(html)) == []
+
+
+@pytest.mark.parametrize('ext', sorted(fixtures.PLAYERS))
+def test_tables_match_read_html(ext):
+    html = fixtures.load_page(ext)
+
+    assert differing_tables(read_html_tables(html), tables.parse_tables(html)) == []
+
+
+@pytest.mark.parametrize('ext', sorted(fixtures.PLAYERS))
+def test_parse_bio_matches_player_info(ext):
+    html = fixtures.load_page(ext)
+    p = pf.Player()
+    pf.player_info(BeautifulSoup(html, 'html.parser'), p)
+
+    assert player_bio.parse_bio(html)._asdict() == pf.get_bio(p)
@@ -0,0 +1,238 @@
+"""
+Lookup tracing:
+Times each stage of a player lookup as nested spans, with counters for
+bytes downloaded and Sheets calls
+
+Tracing is off unless ENABLED is set (or the PEAKFINDER_TRACE environment
+variable names a file). Switched off, span() hands back one shared no-op
+context manager, so the instrumented code pays a single flag check.
+Finished traces are appended to EXPORT_PATH as JSON lines, one line per
+span, and summary() formats one for the terminal.
+
+Command line example (summarizes a trace file):
+"python3 tracing.py peakfinder_trace.jsonl"
+
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import functools
+import threading
+import contextvars
+from collections import Counter
+
+EXPORT_PATH = os.environ.get('PEAKFINDER_TRACE') or None  # JSON lines file
+ENABLED = EXPORT_PATH is not None
+
+last = None  # most recently finished Trace
+
+_current = contextvars.ContextVar('trace', default=None)  # (Trace, open span id)
+
+
+class Trace():
+    def __init__(self, name):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.spans = []  # finished span records, in the order they ended
+        self.counters = Counter()
+        self.lock = threading.Lock()
+        self.next_id = 0
+
+    def new_id(self):
+        with self.lock:
+            self.next_id += 1
+            return self.next_id
+
+    def add(self, record):
+        with self.lock:
+            self.spans.append(record)
+
+    def count(self, name, n):
+        with self.lock:
+            self.counters[name] += n
+
+    def records(self):
+        # root span last, it carries the counters
+        return [dict(record, trace=self.id) for record in self.spans]
+
+
+class _Noop():
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _Noop()
+
+
+class _Span():
+    def __init__(self, tr, name, attrs):
+        self.trace = tr
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        _, parent = _current.get()
+        self.id = self.trace.new_id()
+        self.parent = parent
+        self.token = _current.set((self.trace, self.id))
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        _current.reset(self.token)
+
+        record = {'id': self.id, 'parent': self.parent, 'name': self.name,
+                  'start': self.start, 'duration': duration,
+                  'thread': threading.current_thread().name}
+
+        if self.attrs:
+            record['attrs'] = self.attrs
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+
+        self.trace.add(record)
+        return False
+
+
+class _Root(_Span):
+    def __init__(self, name, attrs):
+        _Span.__init__(self, Trace(name), name, attrs)
+
+    def __enter__(self):
+        self.outer = _current.set((self.trace, None))
+        _Span.__enter__(self)
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        global last
+
+        self.attrs = dict(self.attrs, counters=dict(self.trace.counters))
+        _Span.__exit__(self, exc_type, exc, tb)
+        _current.reset(self.outer)
+        last = self.trace
+
+        if EXPORT_PATH is not None:
+            export(self.trace, EXPORT_PATH)
+
+        return False
+
+
+def enable(path = None):
+    # turns tracing on, finished traces are also written to path if given
+    global ENABLED, EXPORT_PATH
+
+    ENABLED = True
+    EXPORT_PATH = path
+
+
+def disable():
+    global ENABLED
+
+    ENABLED = False
+
+
+def trace(name, **attrs):
+    """Starts a new trace with a root span, use as a context manager.
+    Gives back the Trace, or None when tracing is off.
+    """
+    if not ENABLED:
+        return _NOOP
+
+    return _Root(name, attrs)
+
+
+def span(name, **attrs):
+    # nested under whichever span is open in this thread (or task, see bind)
+    if not ENABLED:
+        return _NOOP
+
+    current = _current.get()
+
+    if current is None:
+        return _NOOP
+
+    return _Span(current[0], name, attrs)
+
+
+def count(name, n = 1):
+    if not ENABLED:
+        return
+
+    current = _current.get()
+
+    if current is not None:
+        current[0].count(name, n)
+
+
+def bind(fn):
+    # carries the open span into another thread, e.g. a tasks.py pool thread
+    if not ENABLED or _current.get() is None:
+        return fn
+
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def export(tr, path):
+    lines = ''.join(json.dumps(record) + '\n' for record in tr.records())
+
+    with open(path, 'a') as f:
+        f.write(lines)
+
+
+def summary(records):
+    """Indented table of spans (a Trace or its exported records), children
+    under their parent in start order, then the counters.
+    """
+    if isinstance(records, Trace):
+        records = records.records()
+
+    children = {}
+
+    for record in records:
+        children.setdefault(record['parent'], []).append(record)
+
+    lines = []
+
+    def walk(parent, depth):
+        for record in sorted(children.get(parent, []), key=lambda r: r['start']):
+            name = '  ' * depth + record['name']
+            note = f"  [{record['thread']}]" if record['thread'] != 'MainThread' else ''
+            if 'error' in record:
+                note += f"  ({record['error']})"
+
+            lines.append(f"{name:<36}{record['duration'] * 1000:>10.1f} ms{note}")
+            walk(record['id'], depth + 1)
+
+    walk(None, 0)
+
+    for record in records:
+        for name, n in record.get('attrs', {}).get('counters', {}).items():
+            lines.append(f'{name:<36}{n:>10}')
+
+    return '\n'.join(lines)
+
+
+def read(path):
+    # exported traces grouped by trace id, in file order
+    traces = {}
+
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            traces.setdefault(record['trace'], []).append(record)
+
+    return traces
+
+
+if __name__ == "__main__":
+    for trace_id, records in read(sys.argv[1]).items():
+        print(trace_id)
+        print(summary(records))
+        print()